@@ -0,0 +1,259 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import benchmarks.generators    as generators
+import microspice.parser        as parser
+import microspice.utils         as utils
+
+import argparse
+import datetime
+import json
+import os.path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy                    as np
+import scipy
+
+# Systems with more unknowns than this are not assembled as dense matrices (get_mat_trans)
+DENSE_LIMIT = 2000
+
+# Transient steps timed one by one with solve_trans_step
+SOLVE_STEPS = 50
+
+# Best time (in seconds) of repeat calls of func, and the return value of the last call
+#       setup is called (untimed) before every call and its return value is passed to func
+def time_call(func, repeat, setup=None):
+    best = float("inf")
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        ret   = func(*args)
+        best  = min(best, time.perf_counter() - start)
+    return best, ret
+
+def parse_file(file_name):
+    p = parser.Parser()
+    p.read(file_name)
+    p.parse()
+    return p
+
+# Time the phases of a transient simulation of a netlist file
+#       Returns a list of result records, one per phase. With parse_only, only the
+#       parser is timed.
+def bench_file(file_name, repeat=3, options=None, kernels=("python", "jit"), parse_only=False):
+    options = options or {}
+    records = []
+
+    def record(phase, seconds, **extra):
+        records.append(dict(phase=phase, seconds=seconds, **extra))
+
+    # Parsing throughput
+    with open(file_name) as file:
+        num_lines = sum(1 for _ in file)
+    seconds, p = time_call(lambda: parse_file(file_name), repeat)
+    record("parse", seconds, lines=num_lines, lines_per_second=num_lines / seconds)
+    if parse_only:
+        return records
+
+    env       = p.envs[0]
+    eng       = p.eng
+    step_size = eng.options["step_size"]
+    end_time  = eng.options["end_time"]
+    eng.options.update(options)
+    eng.set_env(env)
+
+    # Compilation into the array backed circuit
+    def compile_env():
+        env.circuit = None
+        return env.compile()
+    seconds, ckt = time_call(compile_env, repeat)
+    record("compile", seconds)
+
+    unknowns = env.num_nodes - 1
+    lhs_mat  = env.get_lhs_trans(step_size, sparse=True)
+    info     = dict(unknowns=unknowns, nnz=int(lhs_mat.nnz), steps=int(round(end_time / step_size)))
+
+    # Dense assembly of the full transient system
+    if unknowns <= DENSE_LIMIT:
+        seconds, _ = time_call(lambda: env.get_mat_trans(step_size), repeat)
+        record("get_mat_trans", seconds)
+
+    # Transient steps, the first one factors the LHS matrix
+    def first_step():
+        eng.trans_solvers = {}
+        env.update_states(eng.solve_dc(), 0)
+    seconds, _ = time_call(lambda _: eng.solve_trans_step(step_size), repeat, first_step)
+    record("solve_trans_step_first", seconds, solver=eng.get_solver_type())
+
+    def solve_steps():
+        for _ in range(SOLVE_STEPS):
+            eng.solve_trans_step(step_size)
+    seconds, _ = time_call(solve_steps, repeat)
+    record("solve_trans_step", seconds / SOLVE_STEPS, solver=eng.get_solver_type())
+
+    # Full transient simulation with each kernel, on a freshly parsed netlist
+    def fresh_engine():
+        q = parse_file(file_name)
+        q.eng.options.update(options)
+        q.eng.set_env(q.envs[0])
+        return q.eng
+    for kernel in kernels:
+        def run_trans(run_eng):
+            run_eng.options["kernel"] = kernel
+            run_eng.run_trans(end_time, step_size)
+        seconds, _ = time_call(run_trans, repeat, fresh_engine)
+        record("run_trans", seconds, kernel=kernel, solver=eng.get_solver_type())
+
+    for rec in records:
+        rec.update(info)
+    return records
+
+# Run the benchmarks of the given cases {name: sizes} and return the results document
+def run_benchmarks(cases, num_steps=1000, repeat=3, options=None, kernels=("python", "jit"), log=None,
+                   parse_only=False):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Load (or compile) the kernels before anything is timed
+        file_name = os.path.join(tmp_dir, "warm_up.sp")
+        with open(file_name, "w") as file:
+            file.write(generators.rc_ladder(2, num_steps=2))
+        bench_file(file_name, 1, options, kernels)
+
+        for name, sizes in cases.items():
+            generator = generators.generators[name][0]
+            for size in sizes:
+                file_name = os.path.join(tmp_dir, f"{name}_{size}.sp")
+                with open(file_name, "w") as file:
+                    file.write(generator(size, num_steps=num_steps))
+
+                for rec in bench_file(file_name, repeat, options, kernels, parse_only):
+                    rec = dict(case=name, size=size, **rec)
+                    results.append(rec)
+                    if log is not None:
+                        log(rec)
+
+    return {"meta": get_meta(), "results": results}
+
+# Description of the machine and the code version the benchmarks ran on
+def get_meta():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+
+    return {
+        "date"      : datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit"    : commit,
+        "microspice": utils.VERSION,
+        "platform"  : platform.platform(),
+        "python"    : platform.python_version(),
+        "numpy"     : np.__version__,
+        "scipy"     : scipy.__version__,
+        "numba"     : numba_version,
+    }
+
+# Key identifying a result record between runs
+def record_key(rec):
+    return (rec["case"], rec["size"], rec["steps"], rec["phase"], rec.get("kernel"), rec.get("solver"))
+
+def format_record(rec, base=None):
+    label = f"{rec['case']:<14} {rec['size']:>6} {rec['phase']:<24} {rec.get('kernel') or '':<7}"
+    line  = f"{label} {rec['seconds'] * 1e3:12.3f} ms"
+    if "lines_per_second" in rec:
+        line += f" {rec['lines_per_second']:12.0f} lines/s"
+    if base is not None:
+        line += f"  ({rec['seconds'] / base['seconds']:.2f}x of baseline)"
+    return line
+
+# Compare results with a baseline results document
+#       Returns the lines of the records that are slower than the baseline by more than tolerance
+def compare(results, baseline, tolerance=0.2):
+    base_recs = {record_key(rec): rec for rec in baseline["results"]}
+    slower = []
+    for rec in results["results"]:
+        base = base_recs.get(record_key(rec))
+        if base is not None and rec["seconds"] > (1 + tolerance) * base["seconds"]:
+            slower.append(format_record(rec, base))
+    return slower
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark microspice on generated netlists"
+    )
+    arg_parser.add_argument("--cases", nargs="+", choices=list(generators.generators.keys()),
+                            default=list(generators.generators.keys()), help="netlist generators to run")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, help="sizes to run (default: per generator)")
+    arg_parser.add_argument("--steps", type=int, default=1000, help="transient time steps (default 1000)")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="repetitions, the best time is kept (default 3)")
+    arg_parser.add_argument("--solver", choices=["auto", "dense", "sparse", "iterative"], default="auto", help="solver option")
+    arg_parser.add_argument("--option", nargs="+", default=[], metavar="KEY=VALUE",
+                            help="other engine options, as in .option (e.g. blocks=0 iter_method=cg)")
+    arg_parser.add_argument("--kernels", nargs="+", choices=["python", "jit"], default=["python", "jit"],
+                            help="transient kernels timed with run_trans")
+    arg_parser.add_argument("--parse-only", action="store_true", help="only time the parser (lines per second)")
+    arg_parser.add_argument("--output", help="write the results as JSON into this file")
+    arg_parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="relative slowdown reported by --compare (default 0.2)")
+    args = arg_parser.parse_args(argv)
+
+    options = {"solver": args.solver}
+    for part in args.option:
+        if "=" not in part:
+            arg_parser.error(f"expected KEY=VALUE options, got {part}")
+        opt_key, opt_val = part.split("=", 1)
+        options[opt_key.lower()] = opt_val
+
+    cases   = {name: args.sizes or generators.generators[name][1] for name in args.cases}
+    results = run_benchmarks(
+        cases, args.steps, args.repeat, options, args.kernels,
+        log=lambda rec: print(format_record(rec), flush=True), parse_only=args.parse_only
+    )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            slower = compare(results, json.load(file), args.tolerance)
+        print(f"{len(slower)} results slower than the baseline by more than {args.tolerance:.0%}")
+        for line in slower:
+            print(line)
+        return 1 if slower else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# Generators of parametric netlists for benchmarking
+#       Every generator returns the netlist as a string, with a ".tran" command of
+#       num_steps time steps and a ".print" of the last node
+
+# Stimulus sources
+#       PULSE and SIN sources are given by their parameters, PWL sources by num_points corners
+def pulse_source(src_id, node, period=100e-6):
+    return f"{src_id} {node} 0 PULSE(0 1 0 {period / 100:g} {period / 100:g} {period / 2:g} {period:g})"
+
+def sin_source(src_id, node, freq=10e3):
+    return f"{src_id} {node} 0 SIN(0 1 {freq:g} 0 0 0)"
+
+def pwl_source(src_id, node, end_time, num_points=16):
+    corners = [f"{end_time * i / (num_points - 1):g},{(i % 2):g}" for i in range(num_points)]
+    return f"{src_id} {node} 0 PWL({' '.join(corners)})"
+
+def tran_lines(print_node, end_time, num_steps):
+    return [
+        f".tran {end_time / num_steps:g} {end_time:g}",
+        f".print v({print_node})",
+        ".end",
+    ]
+
+# RC ladder of n sections driven by a PULSE source
+def rc_ladder(n, end_time=200e-6, num_steps=1000):
+    lines = [f"* RC ladder with {n} sections", pulse_source("vin", "n0")]
+    for i in range(1, n + 1):
+        lines.append(f"r{i} n{i - 1} n{i} 100")
+        lines.append(f"c{i} n{i} 0 1n")
+    return "\n".join(lines + tran_lines(f"n{n}", end_time, num_steps)) + "\n"
+
+# 2-D mesh of rows x cols nodes, resistors between neighbours and a capacitor to ground
+#       at every node, driven by a PULSE source at one corner
+def rc_mesh(rows, cols, end_time=200e-6, num_steps=1000):
+    lines = [f"* {rows}x{cols} RC mesh", pulse_source("vin", "in"), "rin in n0_0 10"]
+    for r in range(rows):
+        for c in range(cols):
+            lines.append(f"c{r}_{c} n{r}_{c} 0 1n")
+            if c + 1 < cols:
+                lines.append(f"rh{r}_{c} n{r}_{c} n{r}_{c + 1} 100")
+            if r + 1 < rows:
+                lines.append(f"rv{r}_{c} n{r}_{c} n{r + 1}_{c} 100")
+    return "\n".join(lines + tran_lines(f"n{rows - 1}_{cols - 1}", end_time, num_steps)) + "\n"
+
+# Chain of n first order filter stages, each buffered by an inverting VCCS (gain -1)
+def vccs_chain(n, end_time=200e-6, num_steps=1000):
+    lines = [f"* VCCS filter chain with {n} stages", sin_source("vin", "o0")]
+    for i in range(1, n + 1):
+        lines.append(f"r{i} o{i - 1} a{i} 1k")
+        lines.append(f"c{i} a{i} 0 1n")
+        lines.append(f"g{i} o{i} 0 a{i} 0 1m")
+        lines.append(f"rl{i} o{i} 0 1k")
+    return "\n".join(lines + tran_lines(f"o{n}", end_time, num_steps)) + "\n"
+
+# n RC sections, each driven by its own source (cycling PULSE, PWL and SIN)
+def stimulus_deck(n, end_time=200e-6, num_steps=1000, pwl_points=64):
+    lines = [f"* Stimulus deck with {n} sources"]
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            lines.append(pulse_source(f"v{i}", f"s{i}", end_time / (1 + i % 7)))
+        elif kind == 1:
+            lines.append(pwl_source(f"v{i}", f"s{i}", end_time, pwl_points))
+        else:
+            lines.append(sin_source(f"v{i}", f"s{i}", (1 + i % 5) / end_time))
+        lines.append(f"r{i} s{i} o{i} 1k")
+        lines.append(f"c{i} o{i} 0 10n")
+    return "\n".join(lines + tran_lines(f"o{n - 1}", end_time, num_steps)) + "\n"
+
+# Generators by name, with the sizes used by default
+generators = {
+    "rc_ladder"     : (rc_ladder, [10, 100, 1000]),
+    "rc_mesh"       : (lambda n, **kw: rc_mesh(n, n, **kw), [4, 16, 32]),
+    "vccs_chain"    : (vccs_chain, [10, 100, 500]),
+    "stimulus_deck" : (stimulus_deck, [10, 100, 300]),
+}
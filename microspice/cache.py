@@ -0,0 +1,122 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from   microspice.utils         import VERSION, gc_paused
+
+import hashlib
+import os
+import os.path
+import pickle
+import tempfile
+
+# Default size limit of the cache directory
+CACHE_MAX_BYTES = 1 << 30
+
+# Format of the cache entries, changed with the attributes of the pickled environments
+#       and circuits, so that entries of older formats are not loaded
+CACHE_FORMAT    = 2
+
+# On-disk cache of parsed netlists
+#       An entry holds the parsed (and compiled) environments of every .alter run with the
+#       options and print nodes, pickled into "<cache_dir>/<key>.pkl". The key is the hash
+#       of the netlist content, the microspice version and the entry format, so edited
+#       netlists and new versions never hit old entries. The modification time of an entry
+#       is its last use, and the least recently used entries are removed when the cache
+#       grows above max_bytes.
+class NetlistCache:
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "microspice")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # Key of a netlist file (the file is hashed in chunks)
+    def get_key(self, file_name):
+        digest = hashlib.sha256(f"{VERSION}/{CACHE_FORMAT}".encode() + b"\0")
+        with open(file_name, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    # Load the entry of key, None if it is not cached (or cannot be read)
+    def load(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as file, gc_paused():
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Broken or incompatible entry
+            self.remove(path)
+            return None
+
+        # Mark the entry as recently used
+        os.utime(path)
+        return entry
+
+    # Store the entry of key, then evict the least recently used entries
+    #       The entry is written to a temporary file and renamed, so concurrent runs
+    #       never see partially written entries
+    def store(self, key, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file, gc_paused():
+                pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.get_path(key))
+        except BaseException:
+            self.remove(tmp_path)
+            raise
+        self.evict()
+
+    # Remove the least recently used entries until the cache fits into max_bytes
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                self.remove(os.path.join(self.cache_dir, name))
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,390 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.elements      as elements
+import microspice.solvers       as solvers
+
+import numpy as np
+import scipy.sparse as sp
+import copy
+
+from   collections.abc import Mapping
+
+# Add vals into a zero vector of the given size at the indices idx (repeated indices are summed)
+def scatter_add(size, idx, vals):
+    if np.iscomplexobj(vals):
+        return np.bincount(idx, vals.real, size) + 1j * np.bincount(idx, vals.imag, size)
+    # bincount returns integers for empty idx
+    return np.bincount(idx, vals, size).astype(float, copy=False)
+
+# Triplets for two terminal conductances g between nodes[:, 0] and nodes[:, 1]
+def conductance_triplets(nodes, g):
+    n1, n2 = nodes[:, 0], nodes[:, 1]
+    rows = np.concatenate((n1, n1, n2, n2))
+    cols = np.concatenate((n1, n2, n1, n2))
+    vals = np.concatenate((g, -g, -g, g))
+    return rows, cols, vals
+
+# Triplets of a full (square) stamp matrix of a component on the nodes idx_vec
+def stamp_triplets(idx_vec, stamp):
+    idx_vec = np.asarray(idx_vec)
+    n       = len(idx_vec)
+    return np.repeat(idx_vec, n), np.tile(idx_vec, n), np.asarray(stamp).ravel()
+
+# Join a list of triplets
+def concat_triplets(trip):
+    rows = np.concatenate([t[0] for t in trip])
+    cols = np.concatenate([t[1] for t in trip])
+    vals = np.concatenate([np.asarray(t[2], dtype=float) for t in trip])
+    return rows, cols, vals
+
+# Compiled, array backed representation of an environment
+#       Components of the same type are stored as arrays of node indices and values,
+#       so that the MNA matrices are assembled with a few scatter operations per type
+#       instead of a loop over the components. Node indices include the ground node (0).
+class Circuit:
+    def __init__(self, env):
+        self.num_nodes  = env.num_nodes
+        self.time       = 0.0           # Time of the last accepted solution
+        self.node_vals  = np.zeros(self.num_nodes)      # Last accepted node values (ground included)
+        self.node_view  = NodeValues(env.dict_node2idx, self.node_vals)
+
+        res_nodes, res_g    = [], []
+        cap_nodes, cap_c, cap_v = [], [], []
+        vccs_nodes, vccs_g  = [], []
+        src_nodes           = []
+
+        self.src_comps  = []            # Voltage source objects, in the order of src_nodes
+        self.other      = []            # Other components (and their node indices), stamped one by one
+
+        self.comp_idx   = {}            # Map from component ID to (type, index in the type's arrays)
+        self.base       = None          # Circuit of the base environment, see overlay()
+        self.orderings  = {}            # Fill reducing orderings of the unknowns, see get_ordering()
+
+        for comp in env.dict_id2comp.values():
+            idx_vec = env.dict_comp2node[comp.id]
+            if isinstance(comp, elements.Resistor):
+                self.comp_idx[comp.id] = ("res", len(res_nodes))
+                res_nodes.append(idx_vec)
+                res_g.append(1 / comp.resistance)
+            elif isinstance(comp, elements.Capacitor):
+                self.comp_idx[comp.id] = ("cap", len(cap_nodes))
+                cap_nodes.append(idx_vec)
+                cap_c.append(comp.capacitance)
+                cap_v.append(comp.voltage)
+            elif isinstance(comp, elements.VCCS):
+                self.comp_idx[comp.id] = ("vccs", len(vccs_nodes))
+                vccs_nodes.append(idx_vec)
+                vccs_g.append(comp.g)
+            elif isinstance(comp, elements.VSource):
+                self.comp_idx[comp.id] = ("src", len(src_nodes))
+                src_nodes.append(idx_vec)
+                self.src_comps.append(comp)
+            else:
+                self.other.append((comp, idx_vec))
+
+        self.res_nodes  = np.asarray(res_nodes, dtype=int).reshape(-1, 2)
+        self.res_g      = np.asarray(res_g, dtype=float)
+        self.cap_nodes  = np.asarray(cap_nodes, dtype=int).reshape(-1, 2)
+        self.cap_c      = np.asarray(cap_c, dtype=float)
+        self.cap_v      = np.asarray(cap_v, dtype=float)     # Capacitor voltages (state)
+        self.cap_comps  = [comp for comp in env.dict_id2comp.values() if isinstance(comp, elements.Capacitor)]
+        self.vccs_nodes = np.asarray(vccs_nodes, dtype=int).reshape(-1, 4)
+        self.vccs_g     = np.asarray(vccs_g, dtype=float)
+        self.src_nodes  = np.asarray(src_nodes, dtype=int).reshape(-1, 3)
+
+    # Circuit of an .alter environment that only replaces components of its base environment
+    #       The arrays are the ones of the base circuit with the values of the replaced
+    #       components patched in. The node index arrays are shared with the base circuit.
+    #       Returns None when a replaced component has a different type or different nodes
+    #       (or new components were added), then the environment is compiled from scratch.
+    @staticmethod
+    def overlay(base, env):
+        if env.num_nodes != base.num_nodes:
+            return None
+
+        ckt = copy.copy(base)
+        ckt.base        = base
+        ckt.time        = 0.0
+        ckt.node_vals   = np.zeros(ckt.num_nodes)
+        ckt.node_view   = NodeValues(env.dict_node2idx, ckt.node_vals)
+        ckt.res_g       = base.res_g.copy()
+        ckt.cap_c       = base.cap_c.copy()
+        ckt.cap_v       = np.zeros(len(base.cap_v))
+        ckt.vccs_g      = base.vccs_g.copy()
+        ckt.cap_comps   = list(base.cap_comps)
+        ckt.src_comps   = list(base.src_comps)
+
+        base_nodes = env.base.dict_comp2node
+        for comp in env.get_overrides().values():
+            if comp.id not in base.comp_idx or env.dict_comp2node[comp.id] != base_nodes[comp.id]:
+                return None
+
+            kind, i = base.comp_idx[comp.id]
+            if kind == "src" and isinstance(comp, elements.VSource):
+                ckt.src_comps[i] = comp
+            elif kind == "cap" and isinstance(comp, elements.Capacitor):
+                ckt.cap_comps[i] = comp
+                ckt.cap_c[i] = comp.capacitance
+            elif kind == "res" and isinstance(comp, elements.Resistor):
+                ckt.res_g[i] = 1 / comp.resistance
+            elif kind == "vccs" and isinstance(comp, elements.VCCS):
+                ckt.vccs_g[i] = comp.g
+            else:
+                return None
+
+        return ckt
+
+    # Triplets of the change in the LHS matrix from the base circuit (see overlay()), made
+    #       by the replaced components comps
+    def get_base_delta_triplets(self, comps, step_size=None):
+        trip = [(np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0))]
+        for comp in comps:
+            if comp.value_name is not None:
+                trip.append(self.base.get_delta_triplets(comp.id, getattr(comp, comp.value_name), step_size))
+        return concat_triplets(trip)
+
+    # Triplets of the LHS matrix
+    #       step_size = None gives the DC matrix (capacitors are open circuits)
+    def get_triplets(self, step_size=None):
+        trip = [
+            conductance_triplets(self.res_nodes, self.res_g),
+            self.get_vccs_triplets(),
+            self.get_src_triplets(),
+        ]
+        if step_size is not None:
+            trip.append(conductance_triplets(self.cap_nodes, self.cap_c / step_size))
+
+        for comp, idx_vec in self.other:
+            if step_size is None:
+                stamp = np.asarray(comp.stamp_dc())[:, :-1]
+            else:
+                stamp = np.asarray(comp.stamp_trans_lhs(step_size))
+            trip.append(stamp_triplets(idx_vec, stamp))
+
+        return concat_triplets(trip)
+
+    # Triplets of the AC matrices G and C, the AC LHS matrix is G + j * w * C
+    #       Components without a compiled form are assumed to have stamp_ac(w) linear in w
+    def get_ac_triplets(self):
+        g_trip = [
+            conductance_triplets(self.res_nodes, self.res_g),
+            self.get_vccs_triplets(),
+            self.get_src_triplets(),
+        ]
+        c_trip = [conductance_triplets(self.cap_nodes, self.cap_c)]
+
+        for comp, idx_vec in self.other:
+            stamp_0 = np.asarray(comp.stamp_ac(0), dtype=complex)[:, :-1]
+            stamp_1 = np.asarray(comp.stamp_ac(1), dtype=complex)[:, :-1]
+            g_trip.append(stamp_triplets(idx_vec, stamp_0.real))
+            c_trip.append(stamp_triplets(idx_vec, (stamp_1 - stamp_0).imag))
+
+        return concat_triplets(g_trip), concat_triplets(c_trip)
+
+    # RHS vector of the AC system (including the ground row)
+    def get_rhs_ac(self):
+        rhs_vec = np.zeros(self.num_nodes, dtype=complex)
+        rhs_vec[self.src_nodes[:, 2]] = [comp.get_voltage_ac() for comp in self.src_comps]
+
+        for comp, idx_vec in self.other:
+            rhs_vec += scatter_add(self.num_nodes, np.asarray(idx_vec), np.asarray(comp.stamp_ac(0), dtype=complex)[:, -1])
+        return rhs_vec
+
+    def get_vccs_triplets(self):
+        n1, n2, n3, n4 = self.vccs_nodes.T
+        g    = self.vccs_g
+        rows = np.concatenate((n1, n1, n2, n2))
+        cols = np.concatenate((n3, n4, n3, n4))
+        vals = np.concatenate((g, -g, -g, g))
+        return rows, cols, vals
+
+    def get_src_triplets(self):
+        n1, n2, nb = self.src_nodes.T
+        ones = np.ones(len(nb))
+        rows = np.concatenate((n1, n2, nb, nb))
+        cols = np.concatenate((nb, nb, n1, n2))
+        vals = np.concatenate((ones, -ones, ones, -ones))
+        return rows, cols, vals
+
+    # RHS vector of the DC system (including the ground row)
+    def get_rhs_dc(self):
+        rhs_vec = np.zeros(self.num_nodes)
+        rhs_vec[self.src_nodes[:, 2]] = [comp.get_voltage_dc() for comp in self.src_comps]
+
+        for comp, idx_vec in self.other:
+            rhs_vec += scatter_add(self.num_nodes, np.asarray(idx_vec), np.asarray(comp.stamp_dc())[:, -1])
+        return rhs_vec
+
+    # RHS vector of the transient system (including the ground row)
+    #       Sources are evaluated at src_time, by default the time of the last accepted solution,
+    #       unless their values src_vals are given (see get_src_values)
+    def get_rhs_trans(self, step_size, src_time=None, src_vals=None):
+        if src_time is None:
+            src_time = self.time
+        cap_i   = self.cap_c / step_size * self.cap_v
+        rhs_vec = scatter_add(self.num_nodes, self.cap_nodes.T.ravel(), np.concatenate((cap_i, -cap_i)))
+        if src_vals is None:
+            src_vals = [comp.get_voltage(src_time) for comp in self.src_comps]
+        rhs_vec[self.src_nodes[:, 2]] += src_vals
+
+        for comp, idx_vec in self.other:
+            comp.stamp_trans_rhs(step_size, rhs_vec, idx_vec)
+        return rhs_vec
+
+    # Source values at the given times, as a (num times, num sources) array
+    #       Each source evaluates its waveform over all the times in one vectorized call
+    def get_src_values(self, times):
+        src_vals = np.empty((len(times), len(self.src_comps)))
+        for j, comp in enumerate(self.src_comps):
+            src_vals[:, j] = comp.get_voltages(times)
+        return src_vals
+
+    # Sparse (num_nodes, num capacitors) incidence matrix of the capacitors
+    #       Multiplying it with the capacitor currents gives the currents into the nodes
+    def get_cap_incidence(self):
+        num_caps = len(self.cap_c)
+        rows = self.cap_nodes.T.ravel()
+        cols = np.tile(np.arange(num_caps), 2)
+        vals = np.concatenate((np.ones(num_caps), -np.ones(num_caps)))
+        return sp.csr_matrix((vals, (rows, cols)), shape=(self.num_nodes, num_caps))
+
+    # Capacitor voltages for a solution vector (without the ground node)
+    def get_cap_voltages(self, soln_vec):
+        node_vals = np.concatenate(([0.0], soln_vec))
+        return node_vals[self.cap_nodes[:, 0]] - node_vals[self.cap_nodes[:, 1]]
+
+    # Sorted, unique source breakpoints in (0, end_time]
+    def get_breakpoints(self, end_time):
+        times = [t for comp in self.src_comps for t in comp.breakpoints(end_time)]
+        times = np.unique(np.asarray(times, dtype=float))
+        return times[(times > 0) & (times <= end_time)]
+
+    # Update the state variables from the solution vector (without the ground node) at time
+    def update_states(self, soln_vec, time):
+        self.time = time
+        self.node_vals[1:] = soln_vec
+        self.cap_v = self.node_vals[self.cap_nodes[:, 0]] - self.node_vals[self.cap_nodes[:, 1]]
+
+        for comp, idx_vec in self.other:
+            comp.update_state(time, self.node_view)
+
+    # Copy the state variables back into the component objects
+    def sync_components(self):
+        for comp, v in zip(self.cap_comps, self.cap_v):
+            comp.voltage = v
+        for comp in self.src_comps:
+            comp.update_state(self.time, self.node_view)
+
+    # Triplets of the change in the LHS matrix (DC for step_size = None) when the value
+    #       of component comp_id changes to value
+    def get_delta_triplets(self, comp_id, value, step_size=None):
+        kind, i = self.comp_idx[comp_id]
+        if kind == "res":
+            return conductance_triplets(self.res_nodes[i:i+1], np.asarray([1 / value - self.res_g[i]]))
+        if kind == "cap" and step_size is not None:
+            return conductance_triplets(self.cap_nodes[i:i+1], np.asarray([(value - self.cap_c[i]) / step_size]))
+        if kind == "vccs":
+            n1, n2, n3, n4 = self.vccs_nodes[i]
+            g = value - self.vccs_g[i]
+            return np.asarray([n1, n1, n2, n2]), np.asarray([n3, n4, n3, n4]), np.asarray([g, -g, -g, g])
+        # Capacitors in DC and sources do not change the LHS matrix
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+
+    # Change the value of component comp_id in the arrays
+    #       Source values are read from the source objects, so only the element arrays are updated
+    def set_value(self, comp_id, value):
+        kind, i = self.comp_idx[comp_id]
+        if kind == "res":
+            self.res_g[i] = 1 / value
+        elif kind == "cap":
+            self.cap_c[i] = value
+        elif kind == "vccs":
+            self.vccs_g[i] = value
+
+    # Replace the object of a component (with the same type and nodes)
+    def replace_component(self, comp):
+        kind, i = self.comp_idx[comp.id]
+        if kind == "src":
+            self.src_comps[i] = comp
+        elif kind == "cap":
+            self.cap_comps[i] = comp
+
+    # Check if another compiled circuit has the same components on the same nodes
+    def same_topology(self, other):
+        return (
+            self.num_nodes == other.num_nodes and
+            not self.other and not other.other and
+            np.array_equal(self.res_nodes, other.res_nodes) and
+            np.array_equal(self.cap_nodes, other.cap_nodes) and
+            np.array_equal(self.vccs_nodes, other.vccs_nodes) and
+            np.array_equal(self.src_nodes, other.src_nodes)
+        )
+
+    # Check if another compiled circuit (with the same topology) has the same LHS matrices,
+    #       so that the circuits only differ in their sources
+    def same_lhs(self, other):
+        return (
+            np.array_equal(self.res_g, other.res_g) and
+            np.array_equal(self.cap_c, other.cap_c) and
+            np.array_equal(self.vccs_g, other.vccs_g)
+        )
+
+    # Fill reducing ordering of the unknowns (without ground) for the sparse solver
+    #       The ordering is computed once from the sparsity pattern of the DC and transient
+    #       matrices, and reused for every factorization (step sizes, sweep points, AC
+    #       frequencies). Overlay circuits have the pattern of their base circuit and share
+    #       its orderings.
+    def get_ordering(self, method="amd"):
+        if method not in self.orderings:
+            rows, cols, _ = concat_triplets([self.get_triplets(), self.get_triplets(1.0)])
+            pattern = self.to_sparse(rows, cols, np.ones(len(rows)))
+            self.orderings[method] = solvers.get_ordering(pattern, method)
+        return self.orderings[method]
+
+    # Convert triplets to a sparse (CSC) matrix, removing the ground row and column
+    def to_sparse(self, rows, cols, vals):
+        keep = (rows != 0) & (cols != 0)
+        size = self.num_nodes - 1
+        return sp.coo_matrix((vals[keep], (rows[keep] - 1, cols[keep] - 1)), shape=(size, size)).tocsc()
+
+    # Convert triplets to a dense matrix, removing the ground row and column
+    def to_dense(self, rows, cols, vals):
+        n   = self.num_nodes
+        mat = scatter_add(n * n, rows * n + cols, vals).reshape(n, n)
+        return mat[1:, 1:]
+
+# Read only map from node name to node value, backed by the node value vector
+#       Passed to Element.update_state, so no dictionary is rebuilt every time step
+class NodeValues(Mapping):
+    def __init__(self, dict_node2idx, node_vals):
+        self.dict_node2idx  = dict_node2idx
+        self.node_vals      = node_vals
+
+    def __getitem__(self, node):
+        return self.node_vals[self.dict_node2idx[node]]
+
+    def __iter__(self):
+        return iter(self.dict_node2idx)
+
+    def __len__(self):
+        return len(self.dict_node2idx)
@@ -24,9 +24,22 @@ from microspice.utils           import *
 from microspice.errors          import *
 
 import numpy as np
+import re
 from   copy import copy
 
+# Voltage source with a waveform : <id> <n+> <n-> <type>(<options>)
+SOURCE_PATTERN      = re.compile(r'^(?P<id>\w+)\s+(?P<n1>\w+)\s+(?P<n2>\w+)\s+(?P<type>\w+)(\s+)?\((?P<options>.+)\)$')
+# Separator of the options of a waveform
+OPTION_SEPARATOR    = re.compile(r'\s|,')
+
 class Element():
+    # Linear elements have a transient LHS stamp that only depends on the step size
+    #       (not on time or the circuit state), so it can be factored once per step size
+    is_linear = True
+    
+    # Name of the attribute holding the element's value (used by .step), None if it has none
+    value_name = None
+
     def __init__(self):
         # Internal constants
         self.id = ''         # Identifier (name) of the instance
@@ -48,6 +61,17 @@ class Element():
     
     def stamp_trans(self, h):
         # Generate the stamp matrix for transient simulation
+        rhs_vec = np.zeros(len(self.nodes))
+        self.stamp_trans_rhs(h, rhs_vec, range(len(self.nodes)))
+        return np.column_stack((self.stamp_trans_lhs(h), rhs_vec))
+    
+    def stamp_trans_lhs(self, h):
+        # Generate the LHS part of the transient stamp matrix (constant for a given step size)
+        pass
+    
+    def stamp_trans_rhs(self, h, rhs_vec, idx_vec):
+        # Add the RHS part of the transient stamp into rhs_vec at the indices idx_vec
+        #       Called every time step, so this should not allocate any arrays
         pass
     
     def update_state(self, time, state_val_map):
@@ -55,16 +79,18 @@ class Element():
         pass
 
 class Capacitor(Element):
+    value_name = "capacitance"
+    
     def __init__(self):
         super().__init__()
         self.capacitance = 0.0
         self.voltage = 0.0
     
     def read_spice(self, spice_line):
-        
-        inp = spice_line.split(' ')
-        inp = [item for item in inp if item != '']
-        
+        self.read_tokens(spice_line.split())
+
+    # Read the whitespace separated tokens of a spice line
+    def read_tokens(self, inp):
         if len(inp) != 4:
             raise SyntaxError(f"3 options expected, only {len(inp) -1} received")
             # ret = NumArgsError(file_name, line_num, len(inp)-1, 3)
@@ -89,26 +115,34 @@ class Capacitor(Element):
         ]
         return np.asarray(stamp)
     
-    def stamp_trans(self, h):
+    def stamp_trans_lhs(self, h):
         temp = self.capacitance / h
         stamp = [
-            [temp, -temp, temp * self.voltage],
-            [-temp, temp, -temp * self.voltage]
+            [temp, -temp],
+            [-temp, temp]
         ]
         return np.asarray(stamp)
     
+    def stamp_trans_rhs(self, h, rhs_vec, idx_vec):
+        temp = self.capacitance / h * self.voltage
+        rhs_vec[idx_vec[0]] += temp
+        rhs_vec[idx_vec[1]] -= temp
+    
     def update_state(self, time, state_val_map):
         self.voltage = state_val_map[self.nodes[0]] - state_val_map[self.nodes[1]]
 
 class Resistor(Element):
+    value_name = "resistance"
+    
     def __init__(self):
         super().__init__()
         self.resistance = 0.0
     
     def read_spice(self, spice_line):
-        inp = spice_line.split(' ')
-        inp = [item for item in inp if item != '']
-        
+        self.read_tokens(spice_line.split())
+
+    # Read the whitespace separated tokens of a spice line
+    def read_tokens(self, inp):
         if len(inp) != 4:
             raise SyntaxError(f"3 options expected, only {len(inp) -1} received")
         
@@ -130,31 +164,46 @@ class Resistor(Element):
         ]
         return np.asarray(stamp)
     
-    def stamp_trans(self, h):
+    def stamp_trans_lhs(self, h):
         stamp = [
-            [1/self.resistance, -1/self.resistance, 0],    # N+
-            [-1/self.resistance, 1/self.resistance, 0]     # N-
+            [1/self.resistance, -1/self.resistance],    # N+
+            [-1/self.resistance, 1/self.resistance]     # N-
         ]
         return np.asarray(stamp)
 
-class VConst(Element):
+# Common base for the voltage sources
+#       Nodes are [N+, N-, branch current], the source voltage is get_voltage(time)
+#       evaluated at the time of the last accepted solution
+class VSource(Element):
     def __init__(self):
         super().__init__()
-        self.voltage = 0.0
+        self.time = 0.0
+    
+    def get_voltage(self, t):
+        # Source voltage at time t
+        pass
+    
+    def get_voltages(self, times):
+        # Source voltages at all the times (array), subclasses evaluate them vectorized
+        return np.fromiter((self.get_voltage(t) for t in times), dtype=float, count=len(times))
+    
+    def get_voltage_dc(self):
+        # Source voltage for the DC operating point
+        pass
+    
+    def breakpoints(self, end_time):
+        # Iterator over the times up to end_time where the waveform has corners
+        return iter(())
+    
+    def get_voltage_ac(self):
+        # Source magnitude for AC analysis
+        pass
     
-    def read_spice(self, spice_line):
-        inp = spice_line.split(' ')
-        inp = [item for item in inp if item != '']
-        
-        self.id         = inp[0]
-        self.nodes      = [inp[1], inp[2], "_I_" + self.id]
-        self.voltage    = parse_number(inp[3])
-        
     def stamp_dc(self):
         stamp = [
             [0, 0, 1, 0],
             [0, 0, -1, 0],
-            [1, -1, 0, self.voltage]
+            [1, -1, 0, self.get_voltage_dc()]
         ]
         return np.asarray(stamp)
     
@@ -162,22 +211,55 @@ class VConst(Element):
         stamp = [
             [0, 0, 1, 0],
             [0, 0, -1, 0],
-            [1, -1, 0, self.voltage]
+            [1, -1, 0, self.get_voltage_ac()]
         ]
         return np.asarray(stamp)
     
-    def stamp_trans(self, h):
+    def update_state(self, time, state_val_map):
+        self.time = time
+    
+    def stamp_trans_lhs(self, h):
         stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, self.voltage]
+            [0, 0, 1],
+            [0, 0,-1],
+            [1,-1, 0]
         ]
         return np.asarray(stamp)
+    
+    def stamp_trans_rhs(self, h, rhs_vec, idx_vec):
+        rhs_vec[idx_vec[2]] += self.get_voltage(self.time)
 
-class VPulse(Element):
+class VConst(VSource):
+    value_name = "voltage"
+    
+    def __init__(self):
+        super().__init__()
+        self.voltage = 0.0
+    
+    def read_spice(self, spice_line):
+        self.read_tokens(spice_line.split())
+
+    # Read the whitespace separated tokens of a spice line
+    def read_tokens(self, inp):
+        self.id         = inp[0]
+        self.nodes      = [inp[1], inp[2], "_I_" + self.id]
+        self.voltage    = parse_number(inp[3])
+        
+    def get_voltage_dc(self):
+        return self.voltage
+    
+    def get_voltage_ac(self):
+        return self.voltage
+    
+    def get_voltage(self, t):
+        return self.voltage
+
+    def get_voltages(self, times):
+        return np.full(len(times), self.voltage, dtype=float)
+
+class VPulse(VSource):
     def __init__(self):
         super().__init__()
-        self.time = 0.0
         self.init_v = 0.0
         self.final_v = 0.0
         self.init_delay = 0.0
@@ -187,8 +269,7 @@ class VPulse(Element):
         self.period = 0.0
     
     def read_spice(self, spice_line):
-        pattern = r'^(?P<id>\w+)\s+(?P<n1>\w+)\s+(?P<n2>\w+)\s+(?P<type>\w+)(\s+)?\((?P<options>.+)\)$'
-        match = re.match(pattern, spice_line)
+        match = SOURCE_PATTERN.match(spice_line)
         
         if match is None:
             raise SyntaxError("Match for voltage type PULSE failed")
@@ -197,7 +278,7 @@ class VPulse(Element):
         self.nodes = [match.group('n1'), match.group('n2'), "_I_" + self.id]
         self.time = 0.0
         
-        options = re.split(r'\s|,', match.group('options'))
+        options = OPTION_SEPARATOR.split(match.group('options'))
         options = [item for item in options if item != '']
         
         if len(options) != 7:
@@ -213,21 +294,23 @@ class VPulse(Element):
         self.pulse_width = options[5]
         self.period     = options[6]
             
-    def stamp_dc(self):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, self.init_v]
-        ]
-        return np.asarray(stamp)
+    def get_voltage_dc(self):
+        return self.init_v
     
-    def stamp_ac(self, freq):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, self.init_v]
-        ]
-        return np.asarray(stamp)
+    def get_voltage_ac(self):
+        return self.init_v
+    
+    def breakpoints(self, end_time):
+        # Start, end of rise, start of fall and end of fall of every period
+        corners = [0, self.rise_time, self.rise_time + self.pulse_width, self.rise_time + self.pulse_width + self.fall_time]
+        t_start = self.init_delay
+        while t_start <= end_time:
+            for corner in corners:
+                if t_start + corner <= end_time:
+                    yield t_start + corner
+            if self.period <= 0:
+                return
+            t_start += self.period
     
     def get_voltage(self, t):
         if t < self.init_delay:
@@ -240,33 +323,39 @@ class VPulse(Element):
         elif t_cyc < self.rise_time + self.pulse_width:
             v = self.final_v
         elif t_cyc < self.rise_time + self.pulse_width + self.fall_time:
-            v = self.final_v + (self.init_v - self.final_v) * (t_cyc - (self.rise_time + self.pulse_width))
+            v = self.final_v + (self.init_v - self.final_v) * (t_cyc - (self.rise_time + self.pulse_width)) / self.fall_time
         else:
             v = self.init_v
 
         return v
 
-    def update_state(self, time, state_val_map):
-        self.time = time;
-    
-    def stamp_trans(self, h):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0,-1, 0],
-            [1,-1, 0, self.get_voltage(self.time)]
-        ]
-        return np.asarray(stamp)
+    def get_voltages(self, times):
+        t = np.asarray(times, dtype=float)
+        rise_end = self.rise_time
+        high_end = self.rise_time + self.pulse_width
+        fall_end = self.rise_time + self.pulse_width + self.fall_time
+
+        # Same expressions as get_voltage, the branches not taken may divide by zero
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_cyc = (t - self.init_delay) % self.period
+            rise  = self.init_v + (self.final_v - self.init_v) * t_cyc / self.rise_time
+            fall  = self.final_v + (self.init_v - self.final_v) * (t_cyc - high_end) / self.fall_time
+
+        return np.select(
+            [t < self.init_delay, t_cyc < rise_end, t_cyc < high_end, t_cyc < fall_end],
+            [self.init_v, rise, self.final_v, fall],
+            self.init_v
+        )
 
-class VPWL(Element):
+
+class VPWL(VSource):
     def __init__(self):
         super().__init__()
-        self.time = 0.0
         self.table = []
         self.curr_idx = 0
     
     def read_spice(self, spice_line):
-        pattern = r'^(?P<id>\w+)\s+(?P<n1>\w+)\s+(?P<n2>\w+)\s+(?P<type>\w+)(\s+)?\((?P<options>.+)\)$'
-        match = re.match(pattern, spice_line)
+        match = SOURCE_PATTERN.match(spice_line)
         
         if match is None:
             raise SyntaxError("Match for voltage type VPWL failed")
@@ -278,7 +367,7 @@ class VPWL(Element):
         self.time = 0.0
         self.curr_idx = 1
         
-        options = re.split(r'\s|,', match.group('options'))
+        options = OPTION_SEPARATOR.split(match.group('options'))
         options = [item for item in options if item != '']
         
         if len(options) % 2 != 0:
@@ -288,25 +377,23 @@ class VPWL(Element):
         
         self.table = [[options[i], options[i+1]] for i in range(0, len(options), 2)]
         
-    def stamp_dc(self):
-        init_v = self.table[0][1]
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, init_v]
-        ]
-        return np.asarray(stamp)
+    def get_voltage_dc(self):
+        return self.table[0][1]
     
-    def stamp_ac(self, freq):
-        init_v = self.table[0][1]
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, init_v]
-        ]
-        return np.asarray(stamp)
+    def get_voltage_ac(self):
+        return self.table[0][1]
+    
+    def breakpoints(self, end_time):
+        for t, v in self.table:
+            if t > end_time:
+                return
+            yield t
     
     def get_voltage(self, t):
+        # The cursor only moves forward, start again when going back in time (a new run
+        #       with a source shared between .alter environments)
+        if self.curr_idx > 1 and self.table[self.curr_idx - 2][0] >= t:
+            self.curr_idx = 1
         while self.curr_idx <= len(self.table) and self.table[self.curr_idx - 1][0] < t:
             self.curr_idx += 1
         
@@ -318,22 +405,27 @@ class VPWL(Element):
             v = self.table[self.curr_idx - 2][1] + ((self.table[self.curr_idx - 1][1] - self.table[self.curr_idx - 2][1]) * (t - self.table[self.curr_idx - 2][0]) / (self.table[self.curr_idx - 1][0] - self.table[self.curr_idx - 2][0]))
         
         return v
-    
-    def update_state(self, time, state_val_map):
-        self.time = time
-    
-    def stamp_trans(self, h):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0,-1, 0],
-            [1,-1, 0, self.get_voltage(self.time)]
-        ]
-        return np.asarray(stamp)
 
-class VSin(Element):
+    def get_voltages(self, times):
+        # Interpolation like np.interp, but the corner for each time is found like the
+        #       cursor of get_voltage (the first corner at or after t), which also decides
+        #       vertical steps (corners with the same time)
+        t = np.asarray(times, dtype=float)
+        table_t = np.asarray([row[0] for row in self.table], dtype=float)
+        table_v = np.asarray([row[1] for row in self.table], dtype=float)
+
+        idx = np.searchsorted(table_t, t, side="left")
+        i   = np.clip(idx, 1, len(table_t) - 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            v = table_v[i - 1] + ((table_v[i] - table_v[i - 1]) * (t - table_t[i - 1]) / (table_t[i] - table_t[i - 1]))
+
+        v[idx == 0] = table_v[0]
+        v[idx == len(table_t)] = table_v[-1]
+        return v
+
+class VSin(VSource):
     def __init__(self):
         super().__init__()
-        self.time = 0.0
         self.offset_v = 0.0
         self.amplitude_v = 0.0
         self.init_delay = 0.0
@@ -342,8 +434,7 @@ class VSin(Element):
         self.phase = 0.0
     
     def read_spice(self, spice_line):
-        pattern = r'^(?P<id>\w+)\s+(?P<n1>\w+)\s+(?P<n2>\w+)\s+(?P<type>\w+)(\s+)?\((?P<options>.+)\)$'
-        match = re.match(pattern, spice_line)
+        match = SOURCE_PATTERN.match(spice_line)
         
         if match is None:
             raise SyntaxError("Match for VSIN failed")
@@ -352,7 +443,7 @@ class VSin(Element):
         self.nodes = [match.group('n1'), match.group('n2'), "_I_" + self.id]
         self.time = 0.0
         
-        options = re.split(r'\s|,', match.group('options'))
+        options = OPTION_SEPARATOR.split(match.group('options'))
         options = [item for item in options if item != '']
         
         if len(options) != 6:
@@ -367,21 +458,16 @@ class VSin(Element):
         self.damp_factor    = options[4]
         self.phase          = options[5]
         
-    def stamp_dc(self):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, self.get_voltage(0)]
-        ]
-        return np.asarray(stamp)
+    def get_voltage_dc(self):
+        return self.get_voltage(0)
     
-    def stamp_ac(self, freq):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, self.amplitude_v]
-        ]
-        return np.asarray(stamp)
+    def get_voltage_ac(self):
+        return self.amplitude_v
+    
+    def breakpoints(self, end_time):
+        # The sine starts after the initial delay
+        if 0 < self.init_delay <= end_time:
+            yield self.init_delay
     
     def get_voltage(self, t):
         if t < self.init_delay:
@@ -394,26 +480,27 @@ class VSin(Element):
         
         v = self.offset_v + (self.amplitude_v * sin_comp * exp_comp)
         return v
-    
-    def update_state(self, time, state_val_map):
-        self.time = time
-    
-    def stamp_trans(self, h):
-        stamp = [
-            [0, 0, 1, 0],
-            [0, 0, -1, 0],
-            [1, -1, 0, self.get_voltage(self.time)]
-        ]
-        return np.asarray(stamp)
+
+    def get_voltages(self, times):
+        t = np.asarray(times, dtype=float)
+        t_shift = np.where(t < self.init_delay, 0, t - self.init_delay)
+
+        exp_comp = np.exp(self.damp_factor * t_shift)
+        sin_comp = np.sin((2 * math.pi * self.frequency * t_shift) + (self.phase * math.pi / 180))
+
+        return self.offset_v + (self.amplitude_v * sin_comp * exp_comp)
 
 class VCCS(Element):
+    value_name = "g"
+    
     def __init__(self):
         self.g = 0.0
 
     def read_spice(self, spice_line):
-        inp = spice_line.split()
-        inp = list(filter(None, inp))
+        self.read_tokens(spice_line.split())
 
+    # Read the whitespace separated tokens of a spice line
+    def read_tokens(self, inp):
         if len(inp) != 6:
             raise SyntaxError("Expected 6 arguments, only {len)inp) - 1} received")
 
@@ -439,11 +526,37 @@ class VCCS(Element):
         ]
         return np.asarray(stamp)
 
-    def stamp_trans(self, h):
+    def stamp_trans_lhs(self, h):
         stamp = [
-            [0, 0, self.g, -self.g, 0],
-            [0, 0, -self.g, self.g, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0]
+            [0, 0, self.g, -self.g],
+            [0, 0, -self.g, self.g],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
         ]
         return np.asarray(stamp)
+
+# Reduced order model of a linear RC network (see reduction.py)
+#       Nodes are [ports, virtual nodes], the virtual nodes are the states of the reduced
+#       model. The stamps are the reduced conductance and capacitance matrices g_mat and
+#       c_mat, with the capacitances integrated by backward Euler like Capacitor.
+class Macromodel(Element):
+    def __init__(self):
+        super().__init__()
+        self.g_mat = np.zeros((0, 0))
+        self.c_mat = np.zeros((0, 0))
+        self.state = np.zeros(0)        # Node values at the last accepted time point
+
+    def stamp_dc(self):
+        return np.column_stack((self.g_mat, np.zeros(len(self.nodes))))
+
+    def stamp_ac(self, freq):
+        return np.column_stack((self.g_mat + 1j * freq * self.c_mat, np.zeros(len(self.nodes))))
+
+    def stamp_trans_lhs(self, h):
+        return self.g_mat + self.c_mat / h
+
+    def stamp_trans_rhs(self, h, rhs_vec, idx_vec):
+        rhs_vec[idx_vec] += self.c_mat @ self.state / h
+
+    def update_state(self, time, state_val_map):
+        self.state = np.asarray([state_val_map[node] for node in self.nodes])
@@ -20,8 +20,66 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import microspice.elements      as elements
+import microspice.errors        as errors
+import microspice.kernels       as kernels
+import microspice.profiler      as profiler
+import microspice.reduction     as reduction
+import microspice.solvers       as solvers
+import microspice.waveform      as waveform
+from   microspice.utils         import parse_number
+
 import numpy as np
+import scipy.sparse as sp
 import re
+import time
+
+from   concurrent.futures       import ThreadPoolExecutor
+
+# Systems with at least these many unknowns are solved with the sparse solver by default
+SPARSE_THRESHOLD = 1000
+
+# Independent subcircuits with less unknowns than BLOCK_MIN_SIZE are solved together,
+#       blocks with at least BLOCK_PARALLEL_SIZE unknowns are solved in parallel (see make_solver)
+BLOCK_MIN_SIZE      = 64
+BLOCK_PARALLEL_SIZE = 2000
+
+# Time steps run per call of the compiled transient kernel
+KERNEL_BLOCK = 4096
+
+# Source values evaluated together in fixed step transient simulations
+#       Blocks have up to SOURCE_BLOCK time points and SOURCE_BLOCK_VALUES values
+SOURCE_BLOCK        = 4096
+SOURCE_BLOCK_VALUES = 1 << 21
+
+# Number of time points per block of source values, for num_values values per time point
+def get_source_block(num_values):
+    return int(max(1, min(SOURCE_BLOCK, SOURCE_BLOCK_VALUES // max(1, num_values))))
+
+# Frequencies of an AC sweep
+#       "dec" and "oct" give num_points per decade or octave, "lin" gives num_points in total
+def get_ac_freqs(sweep_type, num_points, f_start, f_stop):
+    sweep_type = sweep_type.lower()
+    if num_points < 1 or f_start <= 0 or f_stop < f_start:
+        raise errors.uSpiceError(f"Invalid AC sweep {num_points} points from {f_start} to {f_stop} Hz, expected at least 1 point and 0 < start <= stop")
+    if sweep_type == "lin":
+        return np.linspace(f_start, f_stop, int(num_points))
+    if sweep_type == "dec":
+        num_steps = np.log10(f_stop / f_start) * num_points
+        base = 10
+    elif sweep_type == "oct":
+        num_steps = np.log2(f_stop / f_start) * num_points
+        base = 2
+    else:
+        raise errors.uSpiceError(f"Unknown AC sweep type {sweep_type}, expected dec, oct or lin")
+    # Small tolerance so that f_stop is included despite rounding
+    num_steps = int(np.floor(num_steps + 1e-9))
+    return f_start * base ** (np.arange(num_steps + 1) / num_points)
+
+# Values from start to stop (included) in increments of incr
+def get_sweep_values(start, stop, incr):
+    num_points = int(round((stop - start) / incr)) + 1
+    return start + incr * np.arange(num_points)
 
 class Engine:
     def __init__(self):
@@ -30,69 +88,734 @@ class Engine:
         self.print_nodes = []
         self.time       = 0
         self.data_dc    = None
+        self.sweep_dc   = None
+        self.data_ac    = None
+        self.freq_ac    = None
         self.data_trans = None
         self.time_trans = None
+        self.store_cols = {}        # Map from node name to column in data_trans
+        self.wave_file  = None      # Transient results are streamed into this waveform file, if set
+        self.wave_writer = None
+        self.wave_row   = None
+        self.trans_solvers = {}     # Factored transient LHS matrices, keyed by step size
+        self.block_pool = None      # Thread pool of the block solvers of a run, see make_solver
+        self.profiler   = profiler.Profiler()
+
+    # Read a numeric option (options from the netlist are stored as strings)
+    def get_option_number(self, opt_key, default):
+        val = self.options.get(opt_key, default)
+        if isinstance(val, str):
+            val = parse_number(val)
+        return val
+
+    # Decide between the dense and sparse solver backends
+    #       ".option solver=dense|sparse|auto" selects the backend, "auto" picks the
+    #       sparse backend when the number of unknowns reaches ".option sparse_threshold"
+    #       size is the number of unknowns of the system, by default the ones of the environment
+    def get_solver_type(self, size=None):
+        solver_type = str(self.options.get("solver", "auto")).lower()
+        if solver_type == "auto":
+            if size is None:
+                size = self.env.num_nodes - 1
+            threshold = self.get_option_number("sparse_threshold", SPARSE_THRESHOLD)
+            solver_type = "sparse" if size >= threshold else "dense"
+        return solver_type
+
+    # Check if the LHS matrices are assembled as sparse matrices
+    def is_sparse(self):
+        return self.get_solver_type() in ("sparse", "iterative")
+
+    # Solver backend for the LHS matrices of the environment
+    #       ".option solver=iterative" selects the preconditioned iterative solver, with
+    #       ".option iter_method=gmres|bicgstab|cg", ".option precond=ilu|jacobi|none" (default ilu, jacobi for cg),
+    #       ".option iter_tol" (relative residual, default 1e-10) and ".option iter_maxiter"
+    #       Dense systems of independent subcircuits (see Environment.get_blocks) are solved
+    #       with a BlockSolver, with one dense factorization per subcircuit instead of one of
+    #       the whole system. The small subcircuits are solved together, with the sparse
+    #       backend for ".option solver=auto". Sparse factorizations do not fill in across
+    #       the subcircuits, so sparse systems are solved as one system.
+    #       ".option blocks=0" disables the blocks, ".option block_workers=N" sets the
+    #       threads solving large blocks (default one per CPU).
+    def make_solver(self):
+        solver_type = self.get_solver_type()
+        if solver_type == "iterative":
+            maxiter = self.get_option_number("iter_maxiter", 0)
+            return solvers.IterativeSolver(
+                method  = str(self.options.get("iter_method", "gmres")).lower(),
+                precond = str(self.options["precond"]).lower() if "precond" in self.options else None,
+                tol     = self.get_option_number("iter_tol", 1e-10),
+                maxiter = int(maxiter) or None
+            )
+        if solver_type != "dense" or not self.get_option_number("blocks", 1) or self.env.num_nodes <= 1:
+            return solvers.make_solver(solver_type, self.get_ordering())
+
+        blocks = self.env.get_blocks()
+        if len(blocks) == 1:
+            return solvers.make_solver(solver_type)
+
+        large, small = solvers.group_blocks(blocks, BLOCK_MIN_SIZE)
+        names = ["dense"] * len(large)
+        if len(small):
+            auto = str(self.options.get("solver", "auto")).lower() == "auto"
+            large.append(small)
+            names.append("sparse" if auto and len(small) >= BLOCK_MIN_SIZE else "dense")
+        self.profiler.max_stat("blocks", len(blocks))
+
+        # The large blocks of all solvers of a run share one thread pool (see close_block_pool)
+        if self.block_pool is None and sum(len(idx) >= BLOCK_PARALLEL_SIZE for idx in large) > 1:
+            workers = int(self.get_option_number("block_workers", 0)) or None
+            self.block_pool = ThreadPoolExecutor(max_workers=workers)
+        return solvers.BlockSolver(large, names, BLOCK_PARALLEL_SIZE, pool=self.block_pool)
+
+    # Shut down the thread pool of the block solvers at the end of a run
+    def close_block_pool(self):
+        if self.block_pool is not None:
+            self.block_pool.shutdown()
+            self.block_pool = None
+
+    # Fill reducing ordering of the unknowns for the sparse solver (".option ordering",
+    #       see solvers.get_ordering), None for the dense solver
+    def get_ordering(self):
+        if self.get_solver_type() != "sparse":
+            return None
+        method = str(self.options.get("ordering", "amd")).lower()
+        if method not in solvers.ORDERINGS:
+            raise errors.uSpiceError(f"Unknown ordering '{method}', expected one of {list(solvers.ORDERINGS)}")
+        with self.profiler.phase("ordering"):
+            return self.env.compile().get_ordering(method)
+
+    # Check if the fixed step transient loop can run in the compiled kernel
+    #       ".option kernel=jit" selects the kernel (see kernels.py), ".option kernel=python"
+    #       (default) the regular loop. The kernel needs a linear circuit of array backed
+    #       components, equal steps and a direct solver, other simulations use the regular loop.
+    def use_kernel(self, steps, step_size):
+        kernel = str(self.options.get("kernel", "python")).lower()
+        if kernel not in ("python", "jit"):
+            raise errors.uSpiceError(f"Unknown kernel '{kernel}', expected python or jit")
+        return (
+            kernel == "jit" and self.env.is_linear() and self.get_solver_type() != "iterative" and
+            len(self.env.compile().other) == 0 and np.all(steps == step_size)
+        )
 
     def set_env(self, inp_env):
         self.env = inp_env
 
+    # Register a callback for the profiler events, called as func(event, name, value)
+    #       (see Profiler)
+    def add_callback(self, func):
+        self.profiler.add_callback(func)
+
+    # Run the simulation selected by the options on the environment
+    #       With a ".step" option, the simulation is repeated for every step value
+    #       With ".option reduce=1", the simulation runs on a reduced order model of the
+    #       R/C network (see get_reduced_env)
     def run(self):
+        try:
+            if self.get_option_number("reduce", 0):
+                with self.profiler.phase("reduction"):
+                    reduced = self.get_reduced_env()
+                if reduced is not None:
+                    env = self.env
+                    self.set_env(reduced)
+                    try:
+                        return self.run_simulation()
+                    finally:
+                        self.set_env(env)
+            return self.run_simulation()
+        finally:
+            self.close_block_pool()
+
+    def run_simulation(self):
+        with self.profiler.phase("compile"):
+            self.env.compile()
+        if "step" in self.options:
+            return self.run_step(*self.options["step"])
+        return self.run_analysis()
+
+    # Environment with the R/C network replaced by a reduced order model (see reduction.py)
+    #       The printed nodes and the stepped component are kept. ".option mor_order" sets
+    #       the moments per port (default 4), ".option mor_tol" the allowed relative error of
+    #       the port admittance (default 1e-3), checked up to ".option mor_fmax" (by default
+    #       the last AC frequency, or 1 / (2 pi step size) for transient simulations).
+    #       Returns None when the network is not reduced, the statistics of the reduction
+    #       are added to the profiler.
+    def get_reduced_env(self):
+        keep_ids = set()
+        if "step" in self.options:
+            keep_ids.add(self.env.find_component(self.options["step"][0]).id)
+
+        mode = self.options.get("mode", 0)
+        fmax = self.get_option_number("mor_fmax", 0)
+        if not fmax and mode == 3:
+            fmax = self.options["ac_sweep"][3]
+        elif not fmax and mode == 2 and self.options.get("step_size", 0):
+            fmax = 1 / (2 * np.pi * self.options["step_size"])
+
+        reduced, stats = reduction.reduce_environment(
+            self.env, set(self.print_nodes), keep_ids,
+            order   = int(self.get_option_number("mor_order", 4)),
+            tol     = self.get_option_number("mor_tol", 1e-3),
+            fmax    = fmax
+        )
+        for name, value in stats.items():
+            self.profiler.set_stat(name, value)
+        return reduced
+
+    def run_analysis(self):
         ret = {}
         mode = self.options.get("mode", 0)
         if mode == 1:
-            print("DC not implemented yet")
+            if "dc_source" in self.options:
+                self.run_dc_sweep(self.options["dc_source"], get_sweep_values(*self.options["dc_sweep"]))
+                ret = self.get_result_dc(self.data_dc, self.sweep_dc)
+            else:
+                self.data_dc = self.solve_dc()
+                ret = self.get_result_dc(self.data_dc[None, :])
+        elif mode == 3:
+            self.run_ac(get_ac_freqs(*self.options["ac_sweep"]))
+            ret = self.get_result_ac(self.data_ac, self.freq_ac)
         elif mode == 2:
-            self.run_trans(
-                self.options.get("end_time", 0),
-                self.options.get("step_size", 0)
-            )
-            ret = {"time": self.time_trans}
-            for n in self.print_nodes:
-                if n == "0":
-                    ret[n] = np.zeros((self.data_trans.shape[0], 1))
-                else:
-                    ret[n] = [i[self.env.dict_node2idx[n] - 1] for i in self.data_trans]
+            if self.get_option_number("adaptive", 0):
+                self.run_trans_adaptive(
+                    self.options.get("end_time", 0),
+                    self.options.get("step_size", 0)
+                )
+            else:
+                self.run_trans(
+                    self.options.get("end_time", 0),
+                    self.options.get("step_size", 0)
+                )
+            ret = self.get_result(self.data_trans)
         return ret
 
-    def run_trans(self, end_time, step_size):
+    # Result dictionary of the printed nodes from a transient result array
+    def get_result(self, data_trans):
+        ret = {"time": data_trans[:, -1]}
+        for n in self.print_nodes:
+            if n == "0":
+                ret[n] = np.zeros((data_trans.shape[0], 1))
+            else:
+                ret[n] = data_trans[:, self.store_cols[n]]
+        return ret
+
+    # Result dictionary of the printed nodes from a (points, unknowns) DC result array
+    def get_result_dc(self, data_dc, sweep=None):
+        ret = {} if sweep is None else {"sweep": sweep}
+        for n in self.print_nodes:
+            if n == "0":
+                ret[n] = np.zeros(data_dc.shape[0])
+            else:
+                ret[n] = data_dc[:, self.env.dict_node2idx[n] - 1]
+        return ret
+
+    # Result dictionary of the printed nodes from a (frequencies, unknowns) AC result array
+    def get_result_ac(self, data_ac, freqs):
+        ret = {"freq": freqs}
+        for n in self.print_nodes:
+            if n == "0":
+                ret[n] = np.zeros(data_ac.shape[0], dtype=complex)
+            else:
+                ret[n] = data_ac[:, self.env.dict_node2idx[n] - 1]
+        return ret
+
+    # AC small signal analysis at the frequencies freqs (Hz)
+    #       The LHS matrix is G + j * w * C, where G and C are assembled once. Dense systems are
+    #       solved in vectorized batches of frequencies (".option ac_batch", by default as many
+    #       as fit in about 64 MB), sparse systems one frequency at a time across ".option
+    #       ac_workers" threads (one per CPU by default).
+    def run_ac(self, freqs):
+        ckt             = self.env.compile()
+        with self.profiler.phase("assembly"):
+            g_trip, c_trip  = ckt.get_ac_triplets()
+            rhs_vec         = ckt.get_rhs_ac()[1:]
+        omegas          = 2 * np.pi * np.asarray(freqs, dtype=float)
+        size            = ckt.num_nodes - 1
+
+        self.freq_ac = np.asarray(freqs, dtype=float)
+        self.data_ac = np.empty((len(omegas), size), dtype=complex)
+        self.profiler.count("factorizations", len(omegas))
+        self.profiler.count("solves", len(omegas))
+        self.profiler.max_stat("unknowns", size)
+
+        # The iterative solver type also solves the complex AC systems with the sparse direct solver
+        if self.is_sparse():
+            # G and C share one sparsity pattern, G in the real part and C in the imaginary part
+            mat  = (ckt.to_sparse(*g_trip) + 1j * ckt.to_sparse(*c_trip)).tocsc()
+            perm = self.get_ordering()
+
+            def solve_point(w):
+                lhs_mat = sp.csc_matrix((mat.data.real + 1j * w * mat.data.imag, mat.indices, mat.indptr), shape=mat.shape)
+                solver = solvers.SparseSolver(perm)
+                solver.factor(lhs_mat)
+                return solver.solve(rhs_vec)
+
+            workers = int(self.get_option_number("ac_workers", 0)) or None
+            with self.profiler.phase("solve"), ThreadPoolExecutor(max_workers=workers) as pool:
+                for i, soln in enumerate(pool.map(solve_point, omegas)):
+                    self.data_ac[i] = soln
+        else:
+            g_mat = ckt.to_dense(*g_trip)
+            c_mat = ckt.to_dense(*c_trip)
+            batch = int(self.get_option_number("ac_batch", max(1, 2**26 // (16 * max(size, 1)**2))))
+
+            for start in range(0, len(omegas), batch):
+                w = omegas[start:start + batch, None, None]
+                with self.profiler.phase("assembly"):
+                    lhs_mat = g_mat[None, :, :] + 1j * w * c_mat[None, :, :]
+                    rhs_mat = np.broadcast_to(rhs_vec[None, :, None], (len(w), size, 1))
+                with self.profiler.phase("solve"):
+                    self.data_ac[start:start + batch] = np.linalg.solve(lhs_mat, rhs_mat)[:, :, 0]
+
+    # DC sweep of the value of the voltage source src_id
+    #       The LHS matrix does not depend on the source, so it is factored once and all
+    #       sweep points are solved together as the columns of one RHS matrix
+    def run_dc_sweep(self, src_id, values):
+        src = self.env.find_component(src_id)
+        if not isinstance(src, elements.VSource):
+            raise errors.uSpiceError(f"{src.id} is not a voltage source, .dc only sweeps voltage sources")
+        branch = self.env.dict_comp2node[src.id][2] - 1
+
+        with self.profiler.phase("assembly"):
+            lhs_mat = self.env.get_lhs_dc(sparse=self.is_sparse())
+            rhs_mat = np.repeat(self.env.get_rhs_dc()[:, None], len(values), axis=1)
+            rhs_mat[branch, :] = values
+        solver = self.factor(lhs_mat)
+
+        with self.profiler.phase("solve"):
+            self.data_dc  = solver.solve(rhs_mat).T
+        self.profiler.count("solves", len(values))
+        self.sweep_dc = values
+
+    # Repeat the simulation while stepping the value of component comp_id
+    #       Only the stepped component is re-stamped between the steps (Environment.set_value)
+    #       Returns the result dictionary with "step" values, and for every result a
+    #       (steps, points) array
+    def run_step(self, comp_id, start, stop, incr):
+        comp = self.env.find_component(comp_id)
+        if comp.value_name is None:
+            raise errors.uSpiceError(f"The value of {comp.id} cannot be stepped")
+        orig_value = getattr(comp, comp.value_name)
+        values = get_sweep_values(start, stop, incr)
+
+        # The original value is restored even when a step fails
+        results = []
+        try:
+            for value in values:
+                self.env.set_value(comp.id, value)
+                results.append(self.run_analysis())
+        finally:
+            self.env.set_value(comp.id, orig_value)
+
+        ret = {"step": values}
+        for key in results[0].keys():
+            data = [np.asarray(r[key]).ravel() for r in results]
+            if any(len(d) != len(data[0]) for d in data):
+                raise errors.uSpiceError(".step needs the same number of points in every step (no adaptive time steps)")
+            ret[key] = np.stack(data)
+        # The sweep axis is the same for all steps
+        for key in ("time", "sweep"):
+            if key in ret:
+                ret[key] = ret[key][0]
+        return ret
+
+    # Run several environments with the same topology as one batched problem
+    #       Returns the result dictionaries in the order of envs. Environments are run one by
+    #       one when they cannot be batched (not a fixed step transient run, different
+    #       topologies, nonlinear elements or waveform files). wave_files holds the waveform
+    #       file of each environment, or None.
+    def run_batch(self, envs, wave_files=None):
+        wave_files = wave_files or [None] * len(envs)
+        batch = (
+            self.options.get("mode", 0) == 2 and
+            not any(wave_files) and
+            "step" not in self.options and
+            not self.get_option_number("adaptive", 0) and
+            not self.get_option_number("reduce", 0) and
+            not self.get_option_number("breakpoints", 0) and
+            all(env.is_linear() for env in envs) and
+            all(envs[0].compile().same_topology(env.compile()) for env in envs)
+        )
+
+        if not batch:
+            ret = []
+            for env, wave_file in zip(envs, wave_files):
+                self.set_env(env)
+                self.wave_file = wave_file
+                ret.append(self.run())
+            return ret
+
+        try:
+            data_trans = self.run_trans_batch(envs, self.options.get("end_time", 0), self.options.get("step_size", 0))
+        finally:
+            self.close_block_pool()
+        return [self.get_result(data_trans[:, k, :]) for k in range(len(envs))]
+
+    # Transient simulation of K environments with the same topology
+    #       The K solutions are advanced together. When the environments only differ in their
+    #       sources, the LHS is factored once and solved with a K column RHS, otherwise each
+    #       environment's LHS is factored once and solved with its own column.
+    #       Returns the (steps, K, stored unknowns + time) result array
+    def run_trans_batch(self, envs, end_time, step_size):
+        timestamps  = np.linspace(0, end_time, int(1 + end_time / step_size))
+        ckts        = [env.compile() for env in envs]
+        ckt         = ckts[0]
+        num_envs    = len(envs)
+
+        self.set_env(envs[0])
+        self.store_cols, store_idx = self.get_store_cols()
+        data_trans  = np.empty((len(timestamps), num_envs, len(self.store_cols) + 1))
+        data_trans[:, :, -1] = timestamps[:, None]
+
+        # DC operating points
+        soln = np.empty((ckt.num_nodes - 1, num_envs))
+        for k, env in enumerate(envs):
+            self.set_env(env)
+            soln[:, k] = self.solve_dc()
+        self.set_env(envs[0])
+        data_trans[0, :, :-1] = soln[store_idx].T
+
+        # LHS matrices
+        if all(ckt.same_lhs(other) for other in ckts[1:]):
+            with self.profiler.phase("assembly"):
+                lhs_mat = envs[0].get_lhs_trans(step_size, sparse=self.is_sparse())
+            solve = self.factor(lhs_mat).solve
+        else:
+            solvers = []
+            for env in envs:
+                self.set_env(env)
+                with self.profiler.phase("assembly"):
+                    lhs_mat = env.get_lhs_trans(step_size, sparse=self.is_sparse())
+                solvers.append(self.factor(lhs_mat))
+            self.set_env(envs[0])
+            def solve(rhs_mat):
+                return np.column_stack([solver.solve(rhs_mat[:, k]) for k, solver in enumerate(solvers)])
+
+        # Batched states, capacitor currents are scattered into the RHS through an incidence matrix
+        cap_c    = np.stack([other.cap_c for other in ckts], axis=1) / step_size
+        cap_inc  = ckt.get_cap_incidence()[1:]
+        node_val = np.zeros((ckt.num_nodes, num_envs))
+        src_br   = ckt.src_nodes[:, 2] - 1
+        rhs_mat  = np.zeros((ckt.num_nodes - 1, num_envs))
+
+        t = 0
+        block = get_source_block(len(src_br) * num_envs)
+        with self.profiler.phase("trans_loop"):
+            for i in range(1, len(timestamps)):
+                # Source values of the next block of steps, (steps, sources, K)
+                if (i - 1) % block == 0:
+                    times    = timestamps[i - 1:i - 1 + block]
+                    src_vals = np.stack([other.get_src_values(times) for other in ckts], axis=2)
+
+                node_val[1:] = soln
+                cap_v = node_val[ckt.cap_nodes[:, 0]] - node_val[ckt.cap_nodes[:, 1]]
+
+                rhs_mat[:] = cap_inc @ (cap_c * cap_v)
+                rhs_mat[src_br] += src_vals[(i - 1) % block]
+
+                soln = solve(rhs_mat)
+                t    = timestamps[i]
+                data_trans[i, :, :-1] = soln[store_idx].T
+        self.profiler.count("steps", len(timestamps) - 1)
+        self.profiler.count("solves", num_envs * (len(timestamps) - 1))
+        self.profiler.max_stat("peak_result_bytes", data_trans.nbytes)
+
+        for k, env in enumerate(envs):
+            env.update_states(soln[:, k], t)
+            env.sync_components()
+        return data_trans
+
+    # Select the unknowns kept in the transient results
+    #       ".option store=print" keeps only the printed nodes, otherwise all unknowns are kept
+    #       Returns the map from node name to result column and the index into the solution vector
+    def get_store_cols(self):
+        if str(self.options.get("store", "all")).lower() == "print":
+            nodes = list(dict.fromkeys(n for n in self.print_nodes if n != "0"))
+            store_idx = np.asarray([self.env.dict_node2idx[n] - 1 for n in nodes], dtype=int)
+        else:
+            nodes = sorted(self.env.dict_node2idx.keys(), key=lambda n: self.env.dict_node2idx[n])[1:]
+            store_idx = slice(None)
+        return {n: i for i, n in enumerate(nodes)}, store_idx
+
+    # Time points of a fixed step transient simulation
+    #       With ".option breakpoints=1" the source breakpoints are added to the time points
+    #       Returns the time points and the step sizes leading to them. Regular steps use
+    #       exactly step_size, so their factored LHS matrix is reused.
+    def get_timestamps(self, end_time, step_size):
         timestamps = np.linspace(0, end_time, int(1 + end_time / step_size))
+        steps      = np.full(len(timestamps), step_size)
 
-        self.data_trans = []
-        self.time_trans = []
+        if self.get_option_number("breakpoints", 0):
+            breakpoints = self.env.compile().get_breakpoints(end_time)
+            # Breakpoints that are already (almost) on the grid are not added
+            grid_idx    = np.clip(np.searchsorted(timestamps, breakpoints), 1, len(timestamps) - 1)
+            grid_dist   = np.minimum(breakpoints - timestamps[grid_idx - 1], timestamps[grid_idx] - breakpoints)
+            breakpoints = breakpoints[np.abs(grid_dist) > 1e-9 * step_size]
+
+            timestamps  = np.union1d(timestamps, breakpoints)
+            steps       = np.full(len(timestamps), step_size)
+            bp_idx      = np.searchsorted(timestamps, breakpoints)
+            steps[bp_idx]     = timestamps[bp_idx] - timestamps[bp_idx - 1]
+            steps[bp_idx + 1] = timestamps[bp_idx + 1] - timestamps[bp_idx]
+
+        return timestamps, steps
+
+    # Transient simulation
+    #       Results are written into a preallocated (steps, stored unknowns + time) array,
+    #       or streamed into the waveform file wave_file and memory mapped back
+    #       The source values are evaluated for blocks of time points up front (see
+    #       get_source_block), at the time of the previous time point
+    def run_trans(self, end_time, step_size):
+        timestamps, steps = self.get_timestamps(end_time, step_size)
+
+        self.store_cols, store_idx = self.get_store_cols()
+        self.open_results(len(timestamps))
+        self.trans_solvers = {}
 
         soln = self.solve_dc()
         self.data_dc = soln
-        self.env.set_node_vals(soln)
-        self.env.update_comp_states(0)
-        self.data_trans.append(soln)
-        self.time_trans.append(0)
-        # self.data_trans = np.vstack((self.data_trans, soln))
-
-        for t in timestamps[1:]:
-            soln = self.solve_trans_step(step_size)
-            self.env.set_node_vals(soln)
-            self.env.update_comp_states(t)
-            # self.data_trans = np.vstack((self.data_trans, soln))
-            self.data_trans.append(soln)
-            self.time_trans.append(t)
-
-        self.data_trans = np.column_stack((self.data_trans, timestamps))
-
-    def solve_trans_step(self, step_size):
-        mat = self.env.get_mat_trans(step_size)
-        lhs_mat = mat[:, :-1]
-        rhs_vec = mat[:,-1]
-
-        soln_vec = np.linalg.solve(lhs_mat, rhs_vec)
-        return soln_vec
+        self.env.update_states(soln, 0)
+        self.store_result(0, soln[store_idx], 0)
+
+        if self.use_kernel(steps, step_size):
+            self.run_trans_kernel(timestamps, step_size, store_idx)
+        else:
+            ckt         = self.env.compile()
+            block       = get_source_block(len(ckt.src_comps))
+            update_time = 0.0
+            store_time  = 0.0
+            for k in range(1, len(timestamps)):
+                if (k - 1) % block == 0:
+                    with self.profiler.phase("rhs"):
+                        src_vals = ckt.get_src_values(timestamps[k - 1:k - 1 + block])
+                soln = self.solve_trans_step(steps[k], src_vals=src_vals[(k - 1) % block])
+                if steps[k] != step_size:
+                    self.drop_trans_step(steps[k])
+                start = time.perf_counter()
+                self.env.update_states(soln, timestamps[k])
+                mid   = time.perf_counter()
+                self.store_result(k, soln[store_idx], timestamps[k])
+                update_time += mid - start
+                store_time  += time.perf_counter() - mid
+            self.profiler.add_time("update", update_time, len(timestamps) - 1)
+            self.profiler.add_time("store", store_time, len(timestamps) - 1)
+        self.profiler.count("steps", len(timestamps) - 1)
+
+        self.close_results(len(timestamps))
+        self.env.sync_components()
+
+    # Run the time steps after the DC solution in the compiled transient kernel
+    #       The steps run in blocks of up to KERNEL_BLOCK time points. The source values of a
+    #       block are evaluated up front, at the time of the previous time point.
+    def run_trans_kernel(self, timestamps, step_size, store_idx):
+        ckt = self.env.compile()
+        with self.profiler.phase("assembly"):
+            lhs_mat = self.env.get_lhs_trans(step_size, sparse=self.is_sparse())
+        with self.profiler.phase("factor"):
+            trans_kernel = kernels.TransKernel(ckt, step_size, lhs_mat, perm=self.get_ordering())
+        self.profiler.count("factorizations")
+        self.profiler.count("solves", len(timestamps) - 1)
+
+        node_idx  = np.arange(1, ckt.num_nodes)[store_idx]
+        node_vals = ckt.node_vals.copy()
+
+        block = min(KERNEL_BLOCK, get_source_block(len(ckt.src_comps)))
+        for start in range(1, len(timestamps), block):
+            stop     = min(start + block, len(timestamps))
+            with self.profiler.phase("rhs"):
+                src_vals = ckt.get_src_values(timestamps[start - 1:stop - 1])
+            solns    = np.empty((stop - start, len(node_idx)))
+            with self.profiler.phase("kernel"):
+                trans_kernel.run(node_vals, src_vals, node_idx, solns)
+            with self.profiler.phase("store"):
+                for k in range(start, stop):
+                    self.store_result(k, solns[k - start], timestamps[k])
+
+        self.env.update_states(node_vals[1:], timestamps[-1])
+
+    # Transient simulation with adaptive time steps
+    #       The local truncation error of backward Euler is estimated from the second divided
+    #       difference of the capacitor voltages, LTE = h^2 * |v[n+1, n, n-1]|. Steps are
+    #       step_size * 2^k, so the factored LHS matrices are reused, halved when the error is
+    #       above "reltol * |v| + abstol" and doubled when it is well below. Steps are cut to
+    #       land exactly on the source breakpoints, and sources are evaluated at the end of
+    #       each step.
+    def run_trans_adaptive(self, end_time, step_size):
+        reltol  = self.get_option_number("reltol", 1e-3)
+        abstol  = self.get_option_number("abstol", 1e-6)
+        hmin    = self.get_option_number("hmin", step_size / 1024)
+        hmax    = self.get_option_number("hmax", end_time / 50)
+        k_min   = int(np.ceil(np.log2(hmin / step_size)))
+        k_max   = max(int(np.floor(np.log2(hmax / step_size))), k_min)
+        k_start = min(max(0, k_min), k_max)
+        eps     = 1e-9 * step_size
+
+        ckt = self.env.compile()
+        breakpoints = np.append(ckt.get_breakpoints(end_time), end_time)
+
+        self.store_cols, store_idx = self.get_store_cols()
+        self.open_results(int(end_time / step_size) + 1 + len(breakpoints))
+        self.trans_solvers = {}
+
+        soln = self.solve_dc()
+        self.data_dc = soln
+        self.env.update_states(soln, 0)
+        self.store_result(0, soln[store_idx], 0)
+
+        num_steps   = 1
+        t           = 0.0
+        k           = k_start
+        bp_idx      = 0
+        v_prev      = ckt.cap_v
+        dv_prev     = None          # Slope of the capacitor voltages over the previous step
+        h_prev      = None
+        update_time = 0.0
+        store_time  = 0.0
+
+        while t < end_time - eps:
+            while breakpoints[bp_idx] <= t + eps:
+                bp_idx += 1
+
+            h   = step_size * 2.0 ** k
+            cut = t + h >= breakpoints[bp_idx] - eps
+            if cut:
+                h = breakpoints[bp_idx] - t
+
+            soln = self.solve_trans_step(h, breakpoints[bp_idx] if cut else t + h)
+            v    = ckt.get_cap_voltages(soln)
+
+            ratio = 0.0
+            if dv_prev is not None and len(v) > 0:
+                lte   = h * h * np.abs(((v - v_prev) / h - dv_prev) / (h + h_prev))
+                ratio = np.max(lte / (reltol * np.maximum(np.abs(v), np.abs(v_prev)) + abstol))
+
+            # Steps that are not a power of two multiple of step_size are not reused
+            if cut and h != step_size * 2.0 ** k:
+                self.drop_trans_step(h)
+
+            # Reject the step and retry with a smaller one
+            if ratio > 1 and h > step_size * 2.0 ** k_min + eps:
+                k = max(min(k, int(np.floor(np.log2(h / step_size)))) - 1, k_min)
+                self.profiler.count("rejected_steps")
+                continue
+
+            t = breakpoints[bp_idx] if cut else t + h
+            start = time.perf_counter()
+            self.env.update_states(soln, t)
+            mid   = time.perf_counter()
+            self.store_result(num_steps, soln[store_idx], t)
+            update_time += mid - start
+            store_time  += time.perf_counter() - mid
+            num_steps += 1
+
+            dv_prev = (v - v_prev) / h
+            v_prev  = v
+            h_prev  = h
+
+            if cut:
+                # The waveforms have a corner at the breakpoint, restart from step_size
+                k       = k_start
+                dv_prev = None
+            elif ratio < 0.2:
+                k = min(k + 1, k_max)
+
+        self.profiler.add_time("update", update_time, num_steps - 1)
+        self.profiler.add_time("store", store_time, num_steps - 1)
+        self.profiler.count("steps", num_steps - 1)
+        self.close_results(num_steps)
+        self.env.sync_components()
+
+    # Forget the factored LHS matrix of a step size that will not be used again
+    def drop_trans_step(self, step_size):
+        self.trans_solvers.pop(step_size, None)
+        self.env.drop_lhs_trans(step_size)
+
+    # Allocate the transient result storage for num_steps time points
+    def open_results(self, num_steps):
+        signals = list(self.store_cols.keys()) + ["time"]
+        if self.wave_file:
+            dtype = self.options.get("wave_dtype", "float64")
+            self.wave_writer = waveform.WaveformWriter(self.wave_file, signals, num_steps, dtype)
+            self.wave_row    = np.empty(len(signals))
+            self.profiler.max_stat("peak_result_bytes", self.wave_writer.buf.nbytes)
+        else:
+            self.data_trans  = np.empty((num_steps, len(signals)))
+            self.profiler.max_stat("peak_result_bytes", self.data_trans.nbytes)
+
+    # Store the (selected) solution of time point k
+    #       The result array grows when more than the allocated time points are stored
+    def store_result(self, k, soln, t):
+        if self.wave_writer is None:
+            if k >= len(self.data_trans):
+                data_trans = np.empty((max(2 * len(self.data_trans), 1), self.data_trans.shape[1]))
+                data_trans[:k] = self.data_trans[:k]
+                self.profiler.max_stat("peak_result_bytes", self.data_trans.nbytes + data_trans.nbytes)
+                self.data_trans = data_trans
+            self.data_trans[k, :-1] = soln
+            self.data_trans[k, -1]  = t
+        else:
+            self.wave_row[:-1] = soln
+            self.wave_row[-1]  = t
+            self.wave_writer.write(self.wave_row)
+
+    # Finish the transient results, num_steps time points were stored
+    def close_results(self, num_steps):
+        if self.wave_writer is not None:
+            self.wave_writer.close()
+            self.wave_writer = None
+            self.data_trans  = waveform.Waveform(self.wave_file).data.T
+        else:
+            self.data_trans  = self.data_trans[:num_steps]
+        self.time_trans = self.data_trans[:, -1]
+
+    # Solve one transient step
+    #       For linear circuits, the LHS matrix is factored once per step size and
+    #       only the RHS vector is rebuilt in the following steps
+    #       Sources are evaluated at src_time, by default the time of the last accepted solution,
+    #       unless their values src_vals are given
+    def solve_trans_step(self, step_size, src_time=None, src_vals=None):
+        solver = self.trans_solvers.get(step_size)
+
+        if solver is None or not self.env.is_linear():
+            with self.profiler.phase("assembly"):
+                lhs_mat = self.env.get_lhs_trans(step_size, sparse=self.is_sparse())
+            solver = self.factor(lhs_mat)
+            self.trans_solvers[step_size] = solver
+
+        start   = time.perf_counter()
+        rhs_vec = self.env.get_rhs_trans(step_size, src_time, src_vals)
+        mid     = time.perf_counter()
+        if isinstance(solver, solvers.IterativeSolver):
+            # Warm start from the last accepted solution
+            soln = solver.solve(rhs_vec, self.env.compile().node_vals[1:])
+            self.profiler.count("iterations", solver.iterations)
+        else:
+            soln = solver.solve(rhs_vec)
+        self.profiler.add_step(mid - start, time.perf_counter() - mid)
+        return soln
 
     def solve_dc(self):
-        mat = self.env.get_mat_dc()
-        lhs_mat = mat[:, :-1]
-        rhs_vec = mat[:,-1]
+        with self.profiler.phase("assembly"):
+            lhs_mat = self.env.get_lhs_dc(sparse=self.is_sparse())
+            rhs_vec = self.env.get_rhs_dc()
+        return self.solve(lhs_mat, rhs_vec)
+
+    # Factor a LHS matrix with the selected solver backend
+    def factor(self, lhs_mat):
+        solver = self.make_solver()
+        with self.profiler.phase("factor"):
+            solver.factor(lhs_mat)
+        self.profiler.count("factorizations")
+        self.profiler.max_stat("unknowns", lhs_mat.shape[0])
+        self.profiler.max_stat("nnz", int(lhs_mat.nnz if sp.issparse(lhs_mat) else np.count_nonzero(lhs_mat)))
+        return solver
 
-        soln_vec = np.linalg.solve(lhs_mat, rhs_vec)
-        return soln_vec
+    # Solve a single system with the selected solver backend
+    def solve(self, lhs_mat, rhs_vec):
+        solver = self.factor(lhs_mat)
+        with self.profiler.phase("solve"):
+            soln = solver.solve(rhs_vec)
+        self.profiler.count("solves")
+        return soln
 
     def add_option(self, opt_key, opt_val):
         self.options[opt_key] = opt_val
@@ -115,3 +838,15 @@ class Engine:
                 self.print_nodes.append(node)
         else:
             print('Input string does not match the pattern V(x) or I(x).')
+
+# Run an environment with a new engine that has the given options and print nodes
+#       Used to run environments in worker processes, which do not share the parser's engine
+#       Returns the result and the profiler summary of the run
+def run_env(options, print_nodes, env, wave_file=None):
+    eng = Engine()
+    eng.options     = options
+    eng.print_nodes = print_nodes
+    eng.wave_file   = wave_file
+    eng.set_env(env)
+    result = eng.run()
+    return result, eng.profiler.summary()
@@ -20,8 +20,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import microspice.circuit       as circuit
+import microspice.errors        as errors
+
 import copy
 import numpy as np
+import scipy.sparse as sp
+
+from   collections import ChainMap
+from   scipy.sparse.csgraph import connected_components
 
 class Environment:
     def __init__(self):
@@ -32,52 +39,209 @@ class Environment:
         self.dict_node2val  = {"0": 0}      # Map from node name to node value
         self.dict_comp2node = {}            # Map from component ID to nodes connected to the component
 
+        self.circuit        = None          # Compiled (array backed) circuit, see compile()
+        self.lhs_cache      = {}            # Cached transient LHS matrices, keyed by (step size, sparse)
+        self.linear         = None          # Cached result of is_linear()
+        self.blocks         = None          # Cached result of get_blocks()
+        self.base           = None          # Environment this .alter environment is an overlay of
+
+    # Create the environment of an .alter run
+    #       The new environment shares the components and nodes of the base (first)
+    #       environment. Its dictionaries are overlays (ChainMap) over the base dictionaries
+    #       that only store the components and nodes added or replaced in the .alter runs.
+    #       Shared components are not copied, so their states (see sync_components) are the
+    #       ones of the last run.
+    def alter(self):
+        base = self if self.base is None else self.base
+
+        def overlay(own, base_dict):
+            return ChainMap(dict(own.maps[0]) if isinstance(own, ChainMap) else {}, base_dict)
+
+        env = Environment()
+        env.base            = base
+        env.num_nodes       = self.num_nodes
+        env.dict_id2comp    = overlay(self.dict_id2comp, base.dict_id2comp)
+        env.dict_node2idx   = overlay(self.dict_node2idx, base.dict_node2idx)
+        env.dict_node2val   = overlay(self.dict_node2val, base.dict_node2val)
+        env.dict_comp2node  = overlay(self.dict_comp2node, base.dict_comp2node)
+        return env
+
+    # Components added or replaced in this .alter environment (all components without a base)
+    def get_overrides(self):
+        if self.base is None:
+            return self.dict_id2comp
+        return self.dict_id2comp.maps[0]
+
     # Add a component to the enviornment
     def add_component(self, comp):
         self.dict_id2comp[comp.id] = comp                   # Add to the component dictionary
 
         node_idx_ls = []                                    # Maintain a list of nodes connected with the component
+        node2idx    = self.dict_node2idx
 
         for node in comp.nodes:
+            node_idx = node2idx.get(node)
             # Add a new node into the enviornment node dictionary
-            if node not in self.dict_node2idx:
-                self.dict_node2idx[node] = self.num_nodes
+            if node_idx is None:
+                node_idx = node2idx[node] = self.num_nodes
                 self.num_nodes += 1
-            node_idx_ls.append(self.dict_node2idx[node])    # Adding nodes connected to the component
+            node_idx_ls.append(node_idx)                    # Adding nodes connected to the component
         
         self.dict_comp2node[comp.id] = node_idx_ls          # Add nodes to the component to node dictionary
 
+        # The compiled circuit and cached matrices are no longer valid
+        self.circuit   = None
+        self.lhs_cache = {}
+        self.linear    = None
+        self.blocks    = None
+
+    # Compile the components into the array backed circuit representation
+    #       .alter environments are compiled from the circuit of their base environment
+    #       when they only replace components (see Circuit.overlay)
+    def compile(self):
+        if self.circuit is None and self.base is not None:
+            self.circuit = circuit.Circuit.overlay(self.base.compile(), self)
+        if self.circuit is None:
+            self.circuit = circuit.Circuit(self)
+        return self.circuit
+
+    # Split the unknowns into the blocks of independent subcircuits
+    #       Nodes are connected through the components (dict_comp2node), except through
+    #       the ground node. Unknowns of different blocks do not appear together in any
+    #       row of the MNA matrices, so every block can be solved on its own.
+    #       Returns a list of arrays of unknown indices (node index - 1), sorted by their first unknown
+    def get_blocks(self):
+        if self.blocks is None:
+            rows, cols = [], []
+            for idx_vec in self.dict_comp2node.values():
+                nodes = [node - 1 for node in idx_vec if node != 0]
+                rows += nodes[:1] * len(nodes)
+                cols += nodes
+
+            size = self.num_nodes - 1
+            graph = sp.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(size, size))
+            num_blocks, labels = connected_components(graph, directed=False)
+
+            order = np.argsort(labels, kind="stable")
+            self.blocks = np.split(order, np.cumsum(np.bincount(labels, minlength=num_blocks))[:-1])
+        return self.blocks
+
     # Get the DC matrix to solve
     def get_mat_dc(self):
-        stamp_mat = np.zeros((self.num_nodes, self.num_nodes + 1))
+        ckt = self.compile()
+        lhs_mat = ckt.to_dense(*ckt.get_triplets())
+        return np.column_stack((lhs_mat, self.get_rhs_dc()))
 
-        components = self.dict_id2comp.values()
-        
-        for comp in components:
-            idx_vec = self.dict_comp2node[comp.id]
-            stamp = comp.stamp_dc()
+    def get_mat_trans(self, step_size):
+        ckt = self.compile()
+        lhs_mat = ckt.to_dense(*ckt.get_triplets(step_size))
+        return np.column_stack((lhs_mat, self.get_rhs_trans(step_size)))
 
-            # "Stamping"
-            for j, idx in enumerate(idx_vec):
-                stamp_mat[idx, [idx_vec + [self.num_nodes]]] += stamp[j, :]
+    # Get the LHS matrix of the DC (step_size = None) or transient system
+    #       The matrix only depends on the step size for linear circuits, so it is cached
+    #       For .alter environments compiled from their base, the matrix is the one of the
+    #       base environment plus the change in the stamps of the replaced components
+    def get_lhs(self, step_size=None, sparse=False):
+        key = (step_size, sparse)
+        if key in self.lhs_cache:
+            return self.lhs_cache[key]
 
-        mat = stamp_mat[1:, 1:]
-        return mat
+        ckt = self.compile()
+        if ckt.base is not None:
+            triplets = ckt.get_base_delta_triplets(self.get_overrides().values(), step_size)
+            base_mat = self.base.get_lhs(step_size, sparse)
+        else:
+            triplets = ckt.get_triplets(step_size)
+            base_mat = 0
+        if sparse:
+            lhs_mat = base_mat + ckt.to_sparse(*triplets)
+        else:
+            lhs_mat = base_mat + ckt.to_dense(*triplets)
 
-    def get_mat_trans(self, step_size):
-        stamp_mat = np.zeros((self.num_nodes, self.num_nodes + 1))
+        if self.is_linear():
+            self.lhs_cache[key] = lhs_mat
+        return lhs_mat
 
-        components = self.dict_id2comp.values()
-        for comp in components:
-            idx_vec = self.dict_comp2node[comp.id]
-            stamp   = comp.stamp_trans(step_size)
+    def get_lhs_dc(self, sparse=False):
+        return self.get_lhs(None, sparse)
+
+    # Get the LHS matrix of the transient system (without the RHS column)
+    def get_lhs_trans(self, step_size, sparse=False):
+        return self.get_lhs(step_size, sparse)
+
+    # Get only the RHS vector of the DC system
+    def get_rhs_dc(self):
+        return self.compile().get_rhs_dc()[1:]
+
+    # Find a component by its ID (exact match first, then ignoring case like SPICE)
+    def find_component(self, comp_id):
+        if comp_id in self.dict_id2comp:
+            return self.dict_id2comp[comp_id]
+        for other_id, comp in self.dict_id2comp.items():
+            if other_id.lower() == comp_id.lower():
+                return comp
+        raise errors.uSpiceError(f"Component {comp_id} not found")
+
+    # Change the value (resistance, capacitance, ...) of a component
+    #       The cached LHS matrices are patched with the difference of the component's
+    #       stamps instead of being assembled again, and the compiled circuit is updated in place
+    def set_value(self, comp_id, value):
+        comp = self.find_component(comp_id)
+        if comp.value_name is None:
+            raise errors.uSpiceError(f"The value of {comp.id} cannot be changed")
+
+        # Components shared with the base environment are copied before they are changed
+        if self.base is not None and comp.id not in self.get_overrides():
+            comp = copy.copy(comp)
+            self.get_overrides()[comp.id] = comp
+            if self.circuit is not None:
+                self.circuit.replace_component(comp)
+
+        ckt = self.compile()
+        for (step_size, sparse), lhs_mat in self.lhs_cache.items():
+            rows, cols, vals = ckt.get_delta_triplets(comp.id, value, step_size)
+            if sparse:
+                self.lhs_cache[(step_size, sparse)] = lhs_mat + ckt.to_sparse(rows, cols, vals)
+            else:
+                lhs_mat += ckt.to_dense(rows, cols, vals)
+
+        ckt.set_value(comp.id, value)
+        setattr(comp, comp.value_name, value)
+
+    # Remove the cached transient LHS matrices for a step size
+    def drop_lhs_trans(self, step_size):
+        self.lhs_cache.pop((step_size, False), None)
+        self.lhs_cache.pop((step_size, True), None)
+
+    # Get only the RHS vector of the transient system
+    def get_rhs_trans(self, step_size, src_time=None, src_vals=None):
+        return self.compile().get_rhs_trans(step_size, src_time, src_vals)[1:]
+
+    # Check if the transient LHS matrix is constant for a fixed step size
+    def is_linear(self):
+        if self.linear is None:
+            self.linear = all(comp.is_linear for comp in self.dict_id2comp.values())
+        return self.linear
+
+    # Get the DC system as a sparse LHS matrix and a dense RHS vector
+    def get_sparse_dc(self):
+        return self.get_lhs_dc(sparse=True), self.get_rhs_dc()
+
+    # Get the transient system as a sparse LHS matrix and a dense RHS vector
+    def get_sparse_trans(self, step_size):
+        ckt = self.compile()
+        return ckt.to_sparse(*ckt.get_triplets(step_size)), self.get_rhs_trans(step_size)
 
-            # "Stamping" the matrix
-            for j, idx in enumerate(idx_vec):
-                stamp_mat[idx, [idx_vec + [self.num_nodes]]] += stamp[j, :]
+    # Update the states of all components from a solution vector (vectorized)
+    #       The states live in the compiled circuit, use sync_components() to copy them
+    #       back into the component objects and dict_node2val
+    def update_states(self, soln_vec, time):
+        self.compile().update_states(soln_vec, time)
 
-        mat = stamp_mat[1:, 1:]
-        return mat
+    def sync_components(self):
+        ckt = self.compile()
+        ckt.sync_components()
+        self.set_node_vals(ckt.node_vals[1:])
 
     def set_node_vals(self, soln_vec):
         for node in self.dict_node2idx.keys():
@@ -0,0 +1,176 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import microspice.solvers    as solvers
+
+import numpy                as np
+import scipy.linalg         as la
+import scipy.sparse         as sp
+
+# Compiled transient kernels
+#       Every time step of a fixed step transient simulation of a linear circuit only
+#       stamps the capacitor history currents and the source values into the RHS vector,
+#       back substitutes the factored LHS matrix and updates the node voltages. The kernels
+#       run this loop over a block of time steps on the arrays of the compiled circuit,
+#       without going back to the component objects. They are compiled with Numba when it
+#       is installed, otherwise the same steps run as plain NumPy / SciPy code.
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+def jit(func):
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+# RHS vector (including ground) of one time step
+@jit
+def stamp_rhs(rhs_vec, node_vals, cap_n1, cap_n2, cap_g, src_idx, src_vals):
+    rhs_vec[:] = 0
+    for i in range(len(cap_g)):
+        cap_i = cap_g[i] * (node_vals[cap_n1[i]] - node_vals[cap_n2[i]])
+        rhs_vec[cap_n1[i]] += cap_i
+        rhs_vec[cap_n2[i]] -= cap_i
+    for i in range(len(src_idx)):
+        rhs_vec[src_idx[i]] += src_vals[i]
+
+# Time steps with a dense LU factorization "lhs_mat[perm] = L * U" (unit diagonal L)
+@jit
+def trans_steps_dense(lu, perm, cap_n1, cap_n2, cap_g, src_idx, src_vals, node_vals, store_idx, out):
+    n = lu.shape[0]
+    rhs_vec = np.zeros(n + 1)
+    x = np.empty(n)
+    for k in range(src_vals.shape[0]):
+        stamp_rhs(rhs_vec, node_vals, cap_n1, cap_n2, cap_g, src_idx, src_vals[k])
+        for i in range(n):
+            x[i] = rhs_vec[perm[i] + 1]
+        for i in range(n):
+            acc = x[i]
+            for j in range(i):
+                acc -= lu[i, j] * x[j]
+            x[i] = acc
+        for i in range(n - 1, -1, -1):
+            acc = x[i]
+            for j in range(i + 1, n):
+                acc -= lu[i, j] * x[j]
+            x[i] = acc / lu[i, i]
+        node_vals[1:] = x
+        for j in range(len(store_idx)):
+            out[k, j] = node_vals[store_idx[j]]
+
+# Time steps with a sparse (SuperLU) factorization "Pr * lhs_mat * Pc = L * U"
+#       L and U are given as CSC arrays without their diagonals
+@jit
+def trans_steps_sparse(l_ptr, l_idx, l_val, u_ptr, u_idx, u_val, u_diag, perm_r, perm_c,
+                       cap_n1, cap_n2, cap_g, src_idx, src_vals, node_vals, store_idx, out):
+    n = len(u_diag)
+    rhs_vec = np.zeros(n + 1)
+    y = np.empty(n)
+    for k in range(src_vals.shape[0]):
+        stamp_rhs(rhs_vec, node_vals, cap_n1, cap_n2, cap_g, src_idx, src_vals[k])
+        for i in range(n):
+            y[perm_r[i]] = rhs_vec[i + 1]
+        for j in range(n):
+            for p in range(l_ptr[j], l_ptr[j + 1]):
+                y[l_idx[p]] -= l_val[p] * y[j]
+        for j in range(n - 1, -1, -1):
+            y[j] /= u_diag[j]
+            for p in range(u_ptr[j], u_ptr[j + 1]):
+                y[u_idx[p]] -= u_val[p] * y[j]
+        for i in range(n):
+            node_vals[i + 1] = y[perm_c[i]]
+        for j in range(len(store_idx)):
+            out[k, j] = node_vals[store_idx[j]]
+
+# Fixed step transient loop of a linear, array backed circuit (see Circuit)
+#       The LHS matrix of the step size is factored once, dense or sparse like lhs_mat
+#       perm is the fill reducing ordering of the sparse factorization (see solvers.py)
+class TransKernel:
+    def __init__(self, ckt, step_size, lhs_mat, compiled=HAVE_NUMBA, perm=None):
+        self.compiled   = compiled and HAVE_NUMBA
+        self.sparse     = sp.issparse(lhs_mat)
+        self.num_nodes  = ckt.num_nodes
+
+        self.cap_n1     = np.ascontiguousarray(ckt.cap_nodes[:, 0])
+        self.cap_n2     = np.ascontiguousarray(ckt.cap_nodes[:, 1])
+        self.cap_g      = ckt.cap_c / step_size
+        self.src_idx    = np.ascontiguousarray(ckt.src_nodes[:, 2])
+
+        if self.sparse:
+            self.solver = solvers.SparseSolver(perm)
+            self.solver.factor(lhs_mat)
+            if self.compiled:
+                lu = self.solver.lu
+                perm_r, perm_c = lu.perm_r, lu.perm_c
+                # Fold the ordering into the row and column permutations of SuperLU
+                if perm is not None:
+                    perm_r, perm_c = np.empty_like(perm_r), np.empty_like(perm_c)
+                    perm_r[perm], perm_c[perm] = lu.perm_r, lu.perm_c
+                # Strip the diagonals, L has a unit diagonal
+                lower = sp.tril(lu.L, -1, format="csc")
+                upper = sp.triu(lu.U, 1, format="csc")
+                self.factors = (
+                    lower.indptr, lower.indices, lower.data,
+                    upper.indptr, upper.indices, upper.data, lu.U.diagonal(),
+                    perm_r, perm_c
+                )
+        else:
+            self.lu_piv = la.lu_factor(lhs_mat, check_finite=False)
+            if self.compiled:
+                # Row interchanges of getrf as a permutation of the RHS vector
+                lu, piv = self.lu_piv
+                perm = np.arange(len(piv))
+                for i, p in enumerate(piv):
+                    perm[i], perm[p] = perm[p], perm[i]
+                self.factors = (np.ascontiguousarray(lu), perm)
+
+        # Capacitor incidence for the NumPy steps
+        num_caps = len(self.cap_g)
+        self.cap_inc = sp.csr_matrix(
+            (np.repeat([1.0, -1.0], num_caps), (ckt.cap_nodes.T.ravel(), np.tile(np.arange(num_caps), 2))),
+            shape=(self.num_nodes, num_caps)
+        )
+
+    # Run len(src_vals) time steps starting from node_vals (updated in place)
+    #       src_vals[k] are the source values used in step k, and node_vals[store_idx]
+    #       after step k is stored in out[k]
+    def run(self, node_vals, src_vals, store_idx, out):
+        caps = (self.cap_n1, self.cap_n2, self.cap_g, self.src_idx)
+        if self.compiled:
+            if self.sparse:
+                trans_steps_sparse(*self.factors, *caps, src_vals, node_vals, store_idx, out)
+            else:
+                trans_steps_dense(*self.factors, *caps, src_vals, node_vals, store_idx, out)
+            return
+
+        for k in range(len(src_vals)):
+            cap_i   = self.cap_g * (node_vals[self.cap_n1] - node_vals[self.cap_n2])
+            rhs_vec = self.cap_inc @ cap_i
+            rhs_vec[self.src_idx] += src_vals[k]
+            if self.sparse:
+                node_vals[1:] = self.solver.solve(rhs_vec[1:])
+            else:
+                node_vals[1:] = la.lu_solve(self.lu_piv, rhs_vec[1:], check_finite=False)
+            out[k] = node_vals[store_idx]
@@ -20,21 +20,48 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import microspice.cache         as cache
 import microspice.parser        as parser
+import microspice.engine        as engine
 import microspice.errors        as errors
 
 import matplotlib.pyplot        as plt
+import numpy                    as np
+import os.path
+import time
+
+from   concurrent.futures       import ProcessPoolExecutor
 
 class Microspice():
-    def __init__(self) -> None:
+    # With use_cache, parsed netlists are cached on disk in cache_dir (see cache.py)
+    def __init__(self, use_cache=False, cache_dir=None, cache_max_bytes=cache.CACHE_MAX_BYTES) -> None:
         self.parser     = parser.Parser()
         self.run_num    = 0        
+        self.profile    = None
+        self.cache      = cache.NetlistCache(cache_dir, cache_max_bytes) if use_cache else None
 
     def parse_file(self, file_name):
+        self.run_num    = 0        
+
+        if self.cache is None:
+            self.parser.read(file_name)
+            self.parser.parse()
+            return
+
+        # Unchanged netlists are loaded from the cache instead of being parsed
+        start  = time.perf_counter()
+        key    = self.cache.get_key(file_name)
+        parsed = self.cache.load(key)
+        if parsed is not None:
+            self.parser.set_parsed(parsed, file_name)
+            self.parser.eng.profiler.add_time("cache_load", time.perf_counter() - start)
+            return
+
         self.parser.read(file_name)
-        
         self.parser.parse()
-        self.run_num    = 0        
+        start  = time.perf_counter()
+        self.cache.store(key, self.parser.get_parsed())
+        self.parser.eng.profiler.add_time("cache_store", time.perf_counter() - start)
         
     def parse_and_run_file(self, file_name):
         try:
@@ -44,6 +71,16 @@ class Microspice():
             print(e)
             return
 
+        # ".option batch=1" runs the environments as one batched problem
+        # ".option workers=N" runs the environments in N processes (0 for one per CPU)
+        workers = int(self.parser.eng.get_option_number("workers", 1))
+        if self.parser.eng.get_option_number("batch", 0):
+            for run_num, self.result in enumerate(self.run_batch(), 1):
+                self.disp_result(run_num)
+        elif workers != 1:
+            for run_num, self.result in enumerate(self.run_all(workers or None), 1):
+                self.disp_result(run_num)
+
         while(not self.done()):
             self.run_next()
             self.disp_result()
@@ -58,22 +95,124 @@ class Microspice():
             return errors.uSpiceError("No more configurations to run") .GenError("Simulated all environments")
         
         self.parser.eng.set_env(self.parser.envs[self.run_num])
+        self.parser.eng.wave_file = self.get_wave_file(self.run_num)
         self.result     = self.parser.eng.run()
         self.run_num   += 1
+        self.collect_profile()
+
+    # Keep the profiler summary of the last run(s) in self.profile and start a new one
+    #       The parsing time is part of the summary of the first run
+    #       ".option profile=1" prints the summary
+    def collect_profile(self):
+        prof = self.parser.eng.profiler
+        self.profile = prof.summary()
+        prof.reset()
+        if self.parser.eng.get_option_number("profile", 0):
+            print(prof.report(self.profile))
+
+    # Run all remaining environments in a pool of worker processes
+    #       Every environment is independent, so they are run concurrently with their own
+    #       engine. The results are returned in the order of the environments, and the
+    #       profiler summary of every run is collected like in run_next().
+    #       workers = None uses one process per CPU
+    def run_all(self, workers=None):
+        eng     = self.parser.eng
+        runs    = range(self.run_num, len(self.parser.envs))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(engine.run_env, eng.options, eng.print_nodes, self.parser.envs[i], self.get_wave_file(i))
+                for i in runs
+            ]
+            results = []
+            # The profiler summaries of the workers are collected as if the runs were serial
+            for future in futures:
+                result, summary = future.result()
+                eng.profiler.merge(summary)
+                self.collect_profile()
+                results.append(result)
+
+        self.run_num    = len(self.parser.envs)
+        self.result     = results[-1] if results else {}
+        return results
 
-    def disp_result(self):
-        plt.title(f'Transient simulation result {self.run_num}')
+    # Run all remaining environments together as one batched problem (see Engine.run_batch)
+    #       The results are returned in the order of the environments
+    def run_batch(self):
+        runs    = range(self.run_num, len(self.parser.envs))
+        results = self.parser.eng.run_batch(self.parser.envs[self.run_num:], [self.get_wave_file(i) for i in runs])
+
+        self.run_num    = len(self.parser.envs)
+        self.result     = results[-1] if results else {}
+        self.collect_profile()
+        return results
+
+    # Waveform file for run run_num (".option wavefile=<name>")
+    #       The run number is appended to the name when there are multiple runs
+    def get_wave_file(self, run_num):
+        wave_file = self.parser.eng.options.get("wavefile")
+        if wave_file is None or len(self.parser.envs) == 1:
+            return wave_file
+        base, ext = os.path.splitext(wave_file)
+        return f"{base}_{run_num}{ext}"
+
+    def disp_result(self, run_num=None):
+        if run_num is None:
+            run_num = self.run_num
+
+        # AC analysis (Bode plot)
+        if "freq" in self.result:
+            self.disp_result_ac(run_num)
+            return
+
+        # DC operating point
+        if "time" not in self.result and "sweep" not in self.result:
+            print(f"DC operating point {run_num}")
+            for o in self.result.keys():
+                if o != "step":
+                    print("V(" + o + "):", self.result[o])
+            return
+
+        if "time" in self.result:
+            x_key = "time"
+            plt.title(f'Transient simulation result {run_num}')
+            plt.xlabel('Time (s)')
+        else:
+            x_key = "sweep"
+            plt.title(f'DC sweep result {run_num}')
+            plt.xlabel('Sweep value')
         plt.ylabel('Voltage (V)')
-        plt.xlabel('Time (s)')
 
         for o in self.result.keys():
-            if o != "time":
+            if o not in (x_key, "step"):
                 data = self.result[o]
-                plt.plot(self.result["time"], data, label="V(" + o + ")")
+                if "step" in self.result:
+                    # One curve per step value
+                    for step, row in zip(self.result["step"], data):
+                        plt.plot(self.result[x_key], row, label="V(" + o + ") step=" + f"{step:g}")
+                else:
+                    plt.plot(self.result[x_key], data, label="V(" + o + ")")
                 print("V(" + o + "):", data[0])
 
         plt.legend()
         plt.show()
 
+    def disp_result_ac(self, run_num):
+        fig, (ax_mag, ax_phase) = plt.subplots(2, 1, sharex=True)
+        ax_mag.set_title(f'AC simulation result {run_num}')
+        ax_mag.set_ylabel('Magnitude (dB)')
+        ax_phase.set_ylabel('Phase (deg)')
+        ax_phase.set_xlabel('Frequency (Hz)')
+
+        for o in self.result.keys():
+            if o not in ("freq", "step", "0"):
+                data = np.asarray(self.result[o])
+                ax_mag.semilogx(self.result["freq"], 20 * np.log10(np.abs(data)), label="V(" + o + ")")
+                ax_phase.semilogx(self.result["freq"], np.angle(data, deg=True), label="V(" + o + ")")
+                print("V(" + o + "):", data[0])
+
+        ax_mag.legend()
+        plt.show()
+
     def reset(self):
         self.parser = parser.Parser()
@@ -27,109 +27,229 @@ import microspice.environment   as environment
 import microspice.elements      as elements
 from   microspice.utils         import *
 
+import mmap
 import os.path
-import re
-import copy
+
+# Element types by the first letter of their ID
+ELEMENT_TYPES = {
+    'c' : elements.Capacitor,
+    'r' : elements.Resistor,
+    'g' : elements.VCCS,
+}
+
+# Voltage source types by their waveform
+SOURCE_TYPES = {
+    'pulse' : elements.VPulse,
+    'pwl'   : elements.VPWL,
+    'sin'   : elements.VSin,
+}
+
+# Statements of a netlist from its lines, as (line number, statement) pairs
+#       Comments and whitespace are removed, and "+" continuation lines are joined with
+#       the statement they continue. Only the current statement is kept in memory, so
+#       lines can be any iterable (like an open file). The line number is the one of the
+#       first line of the statement.
+def iter_statements(lines):
+    statement, statement_line = None, 0
+
+    for line_num, line in enumerate(lines, 1):
+        line = line.split('*')[0].strip()
+        if len(line) == 0:
+            continue
+
+        if line[0] == '+' and statement is not None:
+            statement += ' ' + line[1:].strip()
+            continue
+
+        if statement is not None:
+            yield statement_line, statement
+        statement, statement_line = line, line_num
+
+    if statement is not None:
+        yield statement_line, statement
+
+# Lines of a file through a memory map, decoded one by one
+def iter_mmap_lines(file):
+    if os.fstat(file.fileno()).st_size == 0:
+        return
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mem:
+        for line in iter(mem.readline, b""):
+            yield line.decode()
 
 # This class parses a file and populates the engine and environment
 #       with components, connectivity and simulation settings
+#       The netlist is streamed from the file while parsing, it is never held in memory
 class Parser:
     def __init__(self):
         self.file_name  = ""
         self.next_line  = 0
-        self.file_lines = []
+        self.stream     = None      # Open file (or iterable of lines) to parse instead of file_name
+        self.use_mmap   = False
         self.envs       = []
         self.eng        = engine.Engine()
+        self.dc_line    = None      # Line of the .dc command, see check_dc_source()
+        self.lines      = None      # Lines of the file for parse_line(), read on first use
 
-    # Read a netlist into buffer and initialize variables
-    def read(self, inp_file):
+    # Set up the netlist file to be parsed and initialize variables
+    #       With use_mmap, the file is read through a memory map
+    def read(self, inp_file, use_mmap=False):
         # Check if the file exists
         if not os.path.isfile(inp_file):
             raise errors.uSpiceError(f"File {inp_file} could not be opened")
             
         # Set the filename and line counts (used for debugging)
         self.file_name = inp_file
+        self.stream    = None
+        self.use_mmap  = use_mmap
+        self.init_parse()
+
+    # Set up an open file (or any iterable of lines) to be parsed
+    #       file_name is only used in the error messages
+    def read_stream(self, stream, file_name="<stream>"):
+        self.file_name = file_name
+        self.stream    = stream
+        self.use_mmap  = False
+        self.init_parse()
+
+    # Initialize the engine and environment 
+    def init_parse(self):
         self.next_line = 1
-        
-        # Initialize the engine and environment 
+        self.dc_line   = None
+        self.lines     = None
         self.envs      = [environment.Environment()]        
         self.eng       = engine.Engine()
         self.eng.options["mode"] = 1
         self.eng.set_env(self.envs[0])
 
-        # Read the file
-        with open(self.file_name, 'r') as file:
-            self.file_lines = file.read().split('\n')
-        
     # Parse the whole netlist
     def parse(self):
-        max_lines = len(self.file_lines)
+        # Iterate through all the statements (with the garbage collector paused)
+        with gc_paused(), self.eng.profiler.phase("parse"):
+            if self.stream is not None:
+                self.parse_lines(self.stream)
+            else:
+                with open(self.file_name, 'r') as file:
+                    self.parse_lines(iter_mmap_lines(file) if self.use_mmap else file)
+        self.check_dc_source()
 
-        # Iterate through all the lines
-        while self.next_line <= max_lines:
-            self.parse_line()
-            
-    # Parse a single line of the spice netlist
+    def parse_lines(self, lines):
+        for self.next_line, statement in iter_statements(lines):
+            self.parse_statement(statement)
+
+    # Lines of the netlist file (empty for streams)
+    #       Kept for compatibility, parse() streams the file without keeping its lines
+    @property
+    def file_lines(self):
+        if self.lines is None:
+            self.lines = []
+            if self.stream is None and os.path.isfile(self.file_name):
+                with open(self.file_name, 'r') as file:
+                    self.lines = file.read().split('\n')
+        return self.lines
+
+    # Parse the single line next_line of the netlist file and move to the next line
+    #       Kept for compatibility, "+" continuation lines are only joined by parse()
     def parse_line(self):
-        # Last line (should not happen unless function is called after running "parse()")
         if len(self.file_lines) < self.next_line:
             raise errors.uSpiceError("File read completely")
-            
-        # Read file, remove comments and leading and trailing whitespace
+
         line = self.file_lines[self.next_line - 1].split('*')[0].strip()
-        if len(line) == 0:
-            self.next_line += 1
+        if len(line) != 0:
+            self.parse_statement(line)
+        self.next_line += 1
+
+    # Check that the source of a .dc sweep is a voltage source in all environments
+    #       The source can be defined after the .dc command, so this is checked once the
+    #       whole netlist is parsed
+    def check_dc_source(self):
+        if self.dc_line is None:
             return
-        
+        src_id = self.eng.options["dc_source"]
+        for env in self.envs:
+            try:
+                src = env.find_component(src_id)
+            except errors.uSpiceError as e:
+                raise errors.NetlistError(self.file_name, self.dc_line, e.message)
+            if not isinstance(src, elements.VSource):
+                raise errors.NetlistError(self.file_name, self.dc_line, f"{src.id} is not a voltage source, .dc only sweeps voltage sources")
+
+    # Numeric arguments of a command, malformed numbers are reported with the line number
+    def parse_numbers(self, parts):
+        values = []
+        for part in parts:
+            try:
+                values.append(parse_number(part))
+            except (errors.uSpiceError, errors.uSpiceBug):
+                raise errors.NetlistError(self.file_name, self.next_line, f"Invalid number {part}")
+        return tuple(values)
+
+    # Start, stop and increment of a .dc or .step sweep, the increment has to go from start to stop
+    def parse_sweep(self, parts):
+        start, stop, incr = self.parse_numbers(parts)
+        if incr == 0 or (stop - start) / incr < 0:
+            raise errors.NetlistError(self.file_name, self.next_line, f"The increment {parts[2]} does not go from {parts[0]} to {parts[1]}")
+        return start, stop, incr
+
+    # Parsed netlist (compiled environments, options and print nodes), see cache.py
+    def get_parsed(self):
+        for env in self.envs:
+            env.compile()
+        return {
+            "envs"          : self.envs,
+            "options"       : self.eng.options,
+            "print_nodes"   : self.eng.print_nodes,
+        }
+
+    # Set up the parser as if it had parsed the netlist file_name into parsed (see get_parsed())
+    def set_parsed(self, parsed, file_name=""):
+        self.file_name = file_name
+        self.stream    = None
+        self.init_parse()
+        self.envs      = parsed["envs"]
+        self.eng.options     = parsed["options"]
+        self.eng.print_nodes = parsed["print_nodes"]
+        self.eng.set_env(self.envs[0])
+
+    # Parse one statement of the netlist (self.next_line is its line number)
+    #       The statement has no comments or leading and trailing whitespace, see iter_statements()
+    def parse_statement(self, line):
         # Decide the element type or the command 
         switch_case = line[0].lower()
-        # Comment
-        if switch_case == '*':
-            pass
         # Command
-        elif switch_case == '.':
+        if switch_case == '.':
             self.parse_command(line)
+            return
+
+        # Add elements
+        match = None
+        if switch_case in ELEMENT_TYPES:
+            # Capacitor, resistor, VCCS (Voltage controlled current source)
+            e = ELEMENT_TYPES[switch_case]()
+        # Voltage source
+        elif switch_case == 'v':
+            match = elements.SOURCE_PATTERN.match(line) if '(' in line else None
+
+            if match is None:
+                e = elements.VConst()
+            else:
+                voltage_type = match.group('type').lower()
+                if voltage_type not in SOURCE_TYPES:
+                    raise errors.NetlistError(self.file_name, self.next_line, f"Unidentified voltage source type {voltage_type}")
+                e = SOURCE_TYPES[voltage_type]()
+        # Not implemented!
         else:
-            # Add elements
-            # Capacitor
-            if switch_case == 'c':
-                e = elements.Capacitor()
-            # Resistor
-            elif switch_case == 'r':
-                e = elements.Resistor()
-            # Voltage source
-            elif switch_case == 'v':
-                pattern = r'^(?P<id>\w+)\s+(?P<n1>\w+)\s+(?P<n2>\w+)\s+(?P<type>\w+)(\s+)?\(.+\)$'
-                match = re.match(pattern, line)
-
-                if match is None:
-                    e = elements.VConst()
-                else:
-                    voltage_type = match.group('type').lower()
-                    if voltage_type == "pulse":
-                        e = elements.VPulse()
-                    elif voltage_type == "pwl":
-                        e = elements.VPWL()
-                    elif voltage_type == "sin":
-                        e = elements.VSin()
-                    else:
-                        raise errors.NetlistError(self.file_name, self.next_line, f"Unidentified voltage source type {voltage_type}")
-
-            # VCCS (Voltage controlled current source)
-            elif switch_case == 'g':
-                e = elements.VCCS()
-            # Not implemented!
+            raise errors.NetlistError(self.file_name, self.next_line, "Unidetified prefix")
+        
+        try:
+            # Elements without a waveform are read from their tokens, without a regex
+            if match is None:
+                e.read_tokens(line.split())
             else:
-                raise errors.NetlistError(self.file_name, self.next_line, "Unidetified prefix")
-            
-            try:
                 e.read_spice(line)
-            except errors.SyntaxError as e:
-                raise errors.NetlistError(self.file_name, self.next_line, e.message + '\n' + line)
-            
-            self.envs[-1].add_component(e)
+        except errors.SyntaxError as e:
+            raise errors.NetlistError(self.file_name, self.next_line, e.message + '\n' + line)
         
-        self.next_line += 1
+        self.envs[-1].add_component(e)
 
     # Parse a spice command (starts with .)
     def parse_command(self, line):
@@ -140,9 +260,15 @@ class Parser:
         switch_case = cmd_parts[0].lower()
 
         # SPICE commands
-        if switch_case == "option":
+        if switch_case in ("option", "options"):
             # Options are added to the options dictionary in the engine
-            self.eng.add_option("option", cmd_parts[1])
+            #       "key=value" pairs are stored under their key, bare flags under "option"
+            for part in cmd_parts[1:]:
+                if '=' in part:
+                    opt_key, opt_val = part.split('=', 1)
+                    self.eng.add_option(opt_key.lower(), opt_val)
+                else:
+                    self.eng.add_option("option", part)
         
         elif switch_case == "print":
             # Nodes to be printed are added to the print list in the engine
@@ -158,6 +284,34 @@ class Parser:
             self.eng.add_option("step_size", step_size)
             self.eng.add_option("end_time", end_time)
 
+        elif switch_case == "dc":
+            # DC sweep of a voltage source : .dc <source> <start> <stop> <increment>
+            if len(cmd_parts) != 5:
+                raise errors.NetlistError(self.file_name, self.next_line, "Expected .dc <source> <start> <stop> <increment>")
+            self.eng.add_option("mode", 1)
+            self.eng.add_option("dc_source", cmd_parts[1])
+            self.eng.add_option("dc_sweep", self.parse_sweep(cmd_parts[2:5]))
+            self.dc_line = self.next_line
+
+        elif switch_case == "ac":
+            # AC analysis : .ac <dec|oct|lin> <points> <start frequency> <stop frequency>
+            if len(cmd_parts) != 5 or cmd_parts[1].lower() not in ("dec", "oct", "lin"):
+                raise errors.NetlistError(self.file_name, self.next_line, "Expected .ac <dec|oct|lin> <points> <start> <stop>")
+            num_points, f_start, f_stop = self.parse_numbers(cmd_parts[2:5])
+            if num_points < 1 or f_start <= 0 or f_stop < f_start:
+                raise errors.NetlistError(self.file_name, self.next_line, "Expected at least 1 point and frequencies 0 < start <= stop")
+            self.eng.add_option("mode", 3)
+            self.eng.add_option("ac_sweep", (cmd_parts[1].lower(), num_points, f_start, f_stop))
+
+        elif switch_case == "step":
+            # Step the value of a component : .step [param] <component> <start> <stop> <increment>
+            if len(cmd_parts) > 1 and cmd_parts[1].lower() == "param":
+                cmd_parts = cmd_parts[1:]
+            if len(cmd_parts) != 5:
+                raise errors.NetlistError(self.file_name, self.next_line, "Expected .step <component> <start> <stop> <increment>")
+            self.eng.add_option("step", (cmd_parts[1],) + self.parse_sweep(cmd_parts[2:5]))
+
         elif switch_case == "alter":
-            # The alter command sets up one more simulation by creating a copy of the most recent environment
-            self.envs.append(copy.deepcopy(self.envs[-1]))
+            # The alter command sets up one more simulation with an overlay of the most recent
+            #       environment, the following components are added to or replace its components
+            self.envs.append(self.envs[-1].alter())
@@ -0,0 +1,141 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import time
+
+# Collects the timings, counters and statistics of simulations
+#       Phases (parse, assembly, factor, solve, ...) are timed with "with profiler.phase(name):"
+#       or add_time(), and their times add up until reset(). Callbacks registered with
+#       add_callback(func) are called as func(event, name, value) for every timed phase
+#       ("phase", name, seconds), counter increment ("count", name, num) and statistic
+#       ("stat", name, value).
+class Profiler:
+    def __init__(self):
+        self.callbacks  = []
+        self.timers     = {}
+        self.reset()
+
+    # Forget all timings, counters and statistics (the callbacks are kept)
+    def reset(self):
+        self.times      = {}        # Map from phase name to total seconds
+        self.calls      = {}        # Map from phase name to number of timed calls
+        self.counters   = {}        # Map from counter name to count
+        self.stats      = {}        # Map from statistic name to value
+        self.step_times = [0.0, 0.0, 0]
+
+    # Time of one transient step, split into RHS assembly and solve
+    #       Called every time step, so the times are only added up here and passed on to
+    #       the phases "rhs" and "solve" by flush()
+    def add_step(self, rhs_time, solve_time):
+        step_times = self.step_times
+        step_times[0] += rhs_time
+        step_times[1] += solve_time
+        step_times[2] += 1
+
+    def flush(self):
+        rhs_time, solve_time, num_steps = self.step_times
+        if num_steps:
+            self.step_times = [0.0, 0.0, 0]
+            self.add_time("rhs", rhs_time, num_steps)
+            self.add_time("solve", solve_time, num_steps)
+            self.count("solves", num_steps)
+
+    def add_callback(self, func):
+        self.callbacks.append(func)
+
+    def remove_callback(self, func):
+        self.callbacks.remove(func)
+
+    # Context manager timing a phase
+    def phase(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = PhaseTimer(self, name)
+        return timer
+
+    # Add the total time of a number of calls of a phase
+    def add_time(self, name, seconds, calls=1):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+        for func in self.callbacks:
+            func("phase", name, seconds)
+
+    def count(self, name, num=1):
+        self.counters[name] = self.counters.get(name, 0) + num
+        for func in self.callbacks:
+            func("count", name, num)
+
+    def set_stat(self, name, value):
+        self.stats[name] = value
+        for func in self.callbacks:
+            func("stat", name, value)
+
+    # Set a statistic if the value is larger than the current one (peak values)
+    def max_stat(self, name, value):
+        if value > self.stats.get(name, value - 1):
+            self.set_stat(name, value)
+
+    # Dictionary of everything collected since the last reset()
+    def summary(self):
+        self.flush()
+        return {
+            "phases"    : {name: {"seconds": self.times[name], "calls": self.calls[name]} for name in self.times},
+            "counters"  : dict(self.counters),
+            "stats"     : dict(self.stats),
+        }
+
+    # Add a summary (of a run in another process) to the collected timings, counters and
+    #       statistics, as if the run had been profiled here
+    def merge(self, summary):
+        for name, phase in summary["phases"].items():
+            self.add_time(name, phase["seconds"], phase["calls"])
+        for name, value in summary["counters"].items():
+            self.count(name, value)
+        for name, value in summary["stats"].items():
+            self.set_stat(name, value)
+
+    # Summary as printable text
+    def report(self, summary=None):
+        if summary is None:
+            summary = self.summary()
+
+        lines = ["Phase                  Time (ms)      Calls"]
+        for name, phase in summary["phases"].items():
+            lines.append(f"{name:<18} {phase['seconds'] * 1e3:13.3f} {phase['calls']:10d}")
+        for name, value in summary["counters"].items():
+            lines.append(f"{name:<18} {value:13d}")
+        for name, value in summary["stats"].items():
+            lines.append(f"{name:<18} {value:13}")
+        return "\n".join(lines)
+
+# Times one phase of a profiler, see Profiler.phase()
+class PhaseTimer:
+    def __init__(self, profiler, name):
+        self.profiler   = profiler
+        self.name       = name
+        self.start      = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
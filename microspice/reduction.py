@@ -0,0 +1,183 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import microspice.elements      as elements
+import microspice.environment   as environment
+import microspice.errors        as errors
+
+import copy
+import itertools
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+# Model order reduction of the R/C network of an environment
+#       The resistors and capacitors form the network "G x + C x' = i", where the nodes
+#       x = [x_p, x_i] are split into the ports x_p (nodes of the other components and
+#       nodes that are printed) and the internal nodes x_i. With the port voltages given,
+#       the internal nodes are
+#           x_i(s) = -(G_ii + s C_ii)^-1 (G_ip + s C_ip) x_p = (M_0 + s M_1 + s^2 A M_1 + ...) x_p
+#       with M_0 = -G_ii^-1 G_ip, M_1 = -G_ii^-1 (C_ip + C_ii M_0) and A = -G_ii^-1 C_ii.
+#       The internal nodes are projected on an orthonormal basis V of M_0 and the block
+#       Krylov space of A and M_1 (PRIMA). The projection W = diag(I, V) keeps the ports,
+#       so the reduced matrices W^T G W and W^T C W are stamped as a Macromodel element on
+#       the ports and one virtual node per basis vector. The congruence keeps them symmetric
+#       and positive semidefinite, so the reduced model is passive.
+
+# Orthonormalize the columns of block against the orthonormal columns of basis
+#       Columns that are (almost) in the span of basis or of the other columns are dropped
+def orthonormalize(block, basis, rtol=1e-10):
+    scale = max(np.abs(block).max(initial=0.0), np.finfo(float).tiny)
+    block = block / scale
+    ref   = np.linalg.norm(block, axis=0).max(initial=0.0)
+    for _ in range(2):
+        block = block - basis @ (basis.T @ block)
+    if block.shape[1] == 0:
+        return block
+
+    u, s, _ = np.linalg.svd(block, full_matrices=False)
+    return u[:, s > rtol * ref]
+
+# Blocks of an orthonormal basis of the block Krylov space {start, A start, A^2 start, ...}
+#       (block Arnoldi), apply_a(block) returns A block
+def iter_krylov(apply_a, start):
+    basis = np.zeros((start.shape[0], 0))
+    block = start
+    while True:
+        block = orthonormalize(block, basis)
+        if block.shape[1] == 0:
+            return
+        basis = np.hstack((basis, block))
+        yield block
+        block = apply_a(block)
+
+# Port admittance Y(s) = A_pp - A_pi A_ii^-1 A_ip of the system A = G + s C with num_ports ports
+def port_admittance(g_mat, c_mat, num_ports, s):
+    p       = num_ports
+    a_mat   = g_mat + s * c_mat
+    if sp.issparse(a_mat):
+        a_mat   = sp.csc_matrix(a_mat)
+        a_ii    = spla.splu(sp.csc_matrix(a_mat[p:, p:]))
+        a_ip    = a_mat[p:, :p].toarray()
+        return a_mat[:p, :p].toarray() - a_mat[:p, p:] @ a_ii.solve(a_ip)
+    return a_mat[:p, :p] - a_mat[:p, p:] @ np.linalg.solve(a_mat[p:, p:], a_mat[p:, :p])
+
+# Largest error of the reduced port admittance at the complex frequencies s_values,
+#       relative to the largest entry of the full port admittances y_full at s_values
+def admittance_error(y_full, reduced, num_ports, s_values):
+    err, ref = 0.0, 0.0
+    for y, s in zip(y_full, s_values):
+        y_red   = port_admittance(*reduced, num_ports, s)
+        err     = max(err, np.abs(y - y_red).max(initial=0.0))
+        ref     = max(ref, np.abs(y).max(initial=0.0))
+    return err / ref if ref > 0 else err
+
+# Project the symmetric matrix mat (ports first) with W = diag(I, basis)
+def project(mat, basis, num_ports):
+    p     = num_ports
+    m_pp  = mat[:p, :p].toarray()
+    m_pi  = np.asarray(mat[:p, p:] @ basis)
+    m_ii  = basis.T @ np.asarray(mat[p:, p:] @ basis)
+    return np.block([[m_pp, m_pi], [m_pi.T, m_ii]])
+
+# Conductance and capacitance matrices of the resistors and capacitors comps over the
+#       nodes (ground removed)
+def get_rc_matrices(comps, nodes):
+    index = {node: i for i, node in enumerate(nodes)}
+    n1 = np.asarray([index.get(comp.nodes[0], -1) for comp in comps], dtype=int)
+    n2 = np.asarray([index.get(comp.nodes[1], -1) for comp in comps], dtype=int)
+    is_res = np.asarray([isinstance(comp, elements.Resistor) for comp in comps], dtype=bool)
+    vals = np.asarray([1 / comp.resistance if isinstance(comp, elements.Resistor) else comp.capacitance for comp in comps], dtype=float)
+
+    def stamp(keep):
+        rows = np.concatenate((n1[keep], n1[keep], n2[keep], n2[keep]))
+        cols = np.concatenate((n1[keep], n2[keep], n1[keep], n2[keep]))
+        data = np.concatenate((vals[keep], -vals[keep], -vals[keep], vals[keep]))
+        valid = (rows >= 0) & (cols >= 0)
+        return sp.csc_matrix((data[valid], (rows[valid], cols[valid])), shape=(len(nodes), len(nodes)))
+
+    return stamp(is_res), stamp(~is_res)
+
+# Environment with the R/C network of env replaced by a reduced order model
+#       keep_nodes are kept as ports, the components keep_ids are not reduced. The model
+#       has order blocks of moments per port, the order is doubled (up to max_order) until
+#       the port admittance is within tol at DC and at frequencies up to fmax (Hz).
+#       Returns the environment (None when nothing is reduced) and the statistics of the
+#       reduction
+def reduce_environment(env, keep_nodes, keep_ids=(), order=4, tol=1e-3, fmax=0.0, max_order=64):
+    rc_types = (elements.Resistor, elements.Capacitor)
+    rc_comps = [comp for comp in env.dict_id2comp.values() if type(comp) in rc_types and comp.id not in keep_ids]
+    others   = [comp for comp in env.dict_id2comp.values() if type(comp) not in rc_types or comp.id in keep_ids]
+
+    port_set = set(keep_nodes) | {node for comp in others for node in comp.nodes}
+    rc_nodes = dict.fromkeys(node for comp in rc_comps for node in comp.nodes if node != "0")
+    ports    = [node for node in rc_nodes if node in port_set]
+    internal = [node for node in rc_nodes if node not in port_set]
+    stats    = {"mor_ports": len(ports), "mor_internal_nodes": len(internal)}
+    if not ports or not internal:
+        return None, stats
+
+    p = len(ports)
+    g_mat, c_mat = get_rc_matrices(rc_comps, ports + internal)
+    try:
+        g_ii = spla.splu(sp.csc_matrix(g_mat[p:, p:]))
+    except RuntimeError:
+        raise errors.uSpiceError("Cannot reduce the RC network, some internal nodes have no DC path to a port")
+
+    c_ii = c_mat[p:, p:]
+    m_0  = -g_ii.solve(g_mat[p:, :p].toarray())
+    m_1  = -g_ii.solve(c_mat[p:, :p].toarray() + c_ii @ m_0)
+
+    s_values = [0.0]
+    if fmax > 0:
+        s_values += list(2j * np.pi * np.geomspace(fmax * 1e-3, fmax, 7))
+    y_full = [port_admittance(g_mat, c_mat, p, s) for s in s_values]
+
+    krylov = iter_krylov(lambda block: -g_ii.solve(c_ii @ block), m_1)
+    blocks = [m_0]
+    while True:
+        blocks += itertools.islice(krylov, order - len(blocks))
+        basis  = orthonormalize(np.hstack(blocks), np.zeros((len(internal), 0)))
+        g_red  = project(g_mat, basis, p)
+        c_red  = project(c_mat, basis, p)
+        error  = admittance_error(y_full, (g_red, c_red), p, s_values)
+        if error <= tol or order >= max_order or len(blocks) < order:
+            break
+        order *= 2
+
+    stats.update({"mor_states": basis.shape[1], "mor_order": order, "mor_error": error})
+    if error > tol or basis.shape[1] >= len(internal):
+        return None, stats
+
+    model = elements.Macromodel()
+    model.id = "mor"
+    while model.id in env.dict_id2comp:
+        model.id = "_" + model.id
+    model.nodes = ports + [f"_M_{model.id}_{k}" for k in range(basis.shape[1])]
+    model.g_mat = g_red
+    model.c_mat = c_red
+    model.state = np.zeros(len(model.nodes))
+
+    reduced = environment.Environment()
+    for comp in others:
+        reduced.add_component(copy.copy(comp))
+    reduced.add_component(model)
+    return reduced, stats
@@ -0,0 +1,335 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.errors     as errors
+
+import inspect
+import numpy                as np
+import scipy.linalg         as la
+import scipy.sparse         as sp
+import scipy.sparse.linalg  as spla
+
+from   concurrent.futures   import ThreadPoolExecutor
+from   scipy.sparse.csgraph import reverse_cuthill_mckee
+
+# Solver backends for the MNA system "lhs_mat * x = rhs_vec"
+#       A solver is first factored with the LHS matrix and can then be used to
+#       solve for any number of right hand side vectors
+#       perm is a fill reducing ordering of the unknowns (see get_ordering), solutions
+#       are always returned in the original order
+
+# Fill reducing orderings of the unknowns
+#       "amd" is a minimum degree ordering of the pattern of A + A^T, "rcm" the reverse
+#       Cuthill-McKee (bandwidth reducing) ordering. "colamd" leaves the ordering to
+#       SuperLU, which computes it again in every factorization.
+ORDERINGS = ("amd", "rcm", "colamd")
+
+# Permutation of the unknowns (new index -> original index) for the sparsity pattern of
+#       pattern_mat, or None for the "colamd" ordering
+#       The ordering only depends on the pattern, so it can be reused for all matrices
+#       with the same pattern
+def get_ordering(pattern_mat, method="amd"):
+    if method not in ORDERINGS:
+        raise errors.uSpiceError(f"Unknown ordering '{method}', expected one of {list(ORDERINGS)}")
+    if method == "colamd":
+        return None
+
+    pattern = sp.csr_matrix(pattern_mat, dtype=float, copy=True)
+    pattern.data[:] = 1
+    pattern = (pattern + pattern.T).tocsr()
+
+    if method == "rcm":
+        return reverse_cuthill_mckee(pattern, symmetric_mode=True).astype(int)
+
+    # The pattern with a dominant diagonal is not singular, SuperLU orders its columns
+    #       with minimum degree on A^T + A
+    degree  = np.asarray(pattern.sum(axis=1)).ravel()
+    lu      = spla.splu((pattern + sp.diags(degree + 1)).tocsc(), permc_spec="MMD_AT_PLUS_A")
+    return np.argsort(lu.perm_c)
+
+# Dense LU factorization (LAPACK getrf/getrs)
+#       Orderings do not reduce the work of dense factorizations, perm is ignored
+class DenseSolver:
+    def __init__(self, perm=None):
+        self.lu_piv = None
+
+    def factor(self, lhs_mat):
+        if sp.issparse(lhs_mat):
+            lhs_mat = lhs_mat.toarray()
+        self.lu_piv = la.lu_factor(lhs_mat, check_finite=False)
+
+    def solve(self, rhs_vec):
+        return la.lu_solve(self.lu_piv, rhs_vec, check_finite=False)
+
+# Sparse direct LU factorization (SuperLU)
+#       With an ordering, the symmetrically permuted matrix is factored without ordering
+#       it again
+class SparseSolver:
+    def __init__(self, perm=None):
+        self.lu     = None
+        self.perm   = perm
+
+    def factor(self, lhs_mat):
+        lhs_mat = sp.csc_matrix(lhs_mat)
+        if self.perm is None:
+            self.lu = spla.splu(lhs_mat)
+        else:
+            self.lu = spla.splu(lhs_mat[self.perm][:, self.perm], permc_spec="NATURAL")
+
+    def solve(self, rhs_vec):
+        rhs_vec = np.asarray(rhs_vec)
+        if self.perm is None:
+            return self.lu.solve(rhs_vec)
+
+        perm_soln = self.lu.solve(rhs_vec[self.perm])
+        soln = np.empty_like(perm_soln)
+        soln[self.perm] = perm_soln
+        return soln
+
+# Preconditioned iterative solver (SciPy Krylov methods)
+#       "gmres" and "bicgstab" solve general MNA systems. "cg" solves the system left once the
+#       voltage sources connected to ground are eliminated (see split_sources), which has to be
+#       symmetric positive definite (R/C circuits, no VCCS). factor() only builds the "ilu"
+#       (incomplete LU) or "jacobi" (diagonal) preconditioner, so large systems do not need
+#       the memory of a full factorization. Every solve starts from the guess x0, by default
+#       the previous solution, and stops at a residual of tol times the norm of the RHS.
+#       The default preconditioner is "ilu", and "jacobi" for "cg", which needs a symmetric
+#       positive definite preconditioner (ILU is not symmetric).
+class IterativeSolver:
+    methods     = {"gmres": spla.gmres, "bicgstab": spla.bicgstab, "cg": spla.cg}
+    precond     = ("ilu", "jacobi", "none")
+    restarts    = 3
+
+    # SciPy < 1.12 names the relative tolerance "tol", SciPy < 1.8 has no callback_type
+    #       (its gmres callback always gets the preconditioned residual norm)
+    krylov_args = inspect.signature(spla.gmres).parameters
+    rtol_name   = "rtol" if "rtol" in krylov_args else "tol"
+    gmres_args  = {"callback_type": "pr_norm"} if "callback_type" in krylov_args else {}
+
+    def __init__(self, perm=None, method="gmres", precond=None, tol=1e-10, maxiter=None):
+        if method not in self.methods:
+            raise errors.uSpiceError(f"Unknown iterative method '{method}', expected one of {list(self.methods.keys())}")
+        if precond is None:
+            precond = "jacobi" if method == "cg" else "ilu"
+        if precond not in self.precond:
+            raise errors.uSpiceError(f"Unknown preconditioner '{precond}', expected one of {list(self.precond)}")
+        if method == "cg" and precond == "ilu":
+            raise errors.uSpiceError("The cg solver needs a symmetric preconditioner, use jacobi or none")
+        self.method         = method
+        self.precond_type   = precond
+        self.tol            = tol
+        self.maxiter        = maxiter
+        self.lhs_mat        = None
+        self.precond_op     = None
+        self.split          = None          # Eliminated grounded voltage sources (cg), see split_sources
+        self.last           = None          # Last solution, the default guess
+        self.iterations     = 0             # Iterations of the last solve
+
+    def factor(self, lhs_mat):
+        self.lhs_mat = sp.csr_matrix(lhs_mat)
+        self.last    = None
+        self.split   = None
+
+        if self.method == "cg":
+            self.split   = self.split_sources(self.lhs_mat)
+            keep         = self.split[2]
+            self.lhs_mat = self.lhs_mat[keep][:, keep]
+            diag         = self.lhs_mat.diagonal()
+            asym         = abs(self.lhs_mat - self.lhs_mat.T).max() if self.lhs_mat.nnz else 0
+            if asym > 1e-12 * abs(self.lhs_mat).max() or np.any(diag <= 0):
+                raise errors.uSpiceError("The cg solver needs a symmetric positive definite system once the grounded voltage sources are eliminated, use gmres or bicgstab for this circuit")
+
+        size = self.lhs_mat.shape[0]
+        if self.precond_type == "ilu" and size:
+            ilu = spla.spilu(self.lhs_mat.tocsc(), drop_tol=1e-4, fill_factor=10)
+            self.precond_op = spla.LinearOperator((size, size), ilu.solve)
+        elif self.precond_type == "jacobi" and size:
+            # Voltage source rows have no diagonal entry, they are not scaled
+            diag = self.lhs_mat.diagonal()
+            diag[diag == 0] = 1
+            self.precond_op = sp.diags(1 / diag)
+        else:
+            self.precond_op = None
+
+    # Find the voltage sources connected to ground in a MNA matrix
+    #       The row of such a source (zero diagonal, one entry) only fixes the voltage of its
+    #       node, and its branch current (one entry in its column) only appears in the row of
+    #       that node. Both unknowns are removed from the system: the node voltage is moved
+    #       to the RHS, the branch current is computed back from the node row after the solve.
+    #       Returns (branch rows, node rows, other unknowns, source coefficients, branch
+    #       coefficients, columns of the fixed nodes in the other rows, full node rows)
+    def split_sources(self, lhs_mat):
+        lhs_mat = lhs_mat.copy()
+        lhs_mat.sum_duplicates()
+        lhs_mat.eliminate_zeros()
+        csc     = lhs_mat.tocsc()
+        size    = lhs_mat.shape[0]
+
+        single  = (lhs_mat.diagonal() == 0) & (np.diff(lhs_mat.indptr) == 1) & (np.diff(csc.indptr) == 1)
+        branch  = np.flatnonzero(single)
+        nodes   = lhs_mat.indices[lhs_mat.indptr[branch]]
+        # A node connected only to a source has the same structure as the source row, only
+        #       one of the two rows is eliminated as a source
+        mask    = (csc.indices[csc.indptr[branch]] == nodes) & (~single[nodes] | (branch > nodes))
+        branch, nodes = branch[mask], nodes[mask]
+        nodes, first  = np.unique(nodes, return_index=True)
+        branch  = branch[first]
+
+        keep    = np.setdiff1d(np.arange(size), np.concatenate((branch, nodes)))
+        return (
+            branch, nodes, keep,
+            lhs_mat.data[lhs_mat.indptr[branch]], csc.data[csc.indptr[branch]],
+            lhs_mat[keep][:, nodes], lhs_mat[nodes]
+        )
+
+    # Solve for rhs_vec, from the guess x0 (by default the last solution)
+    #       The columns of a 2-D rhs_vec are unrelated systems (AC points, batched variants),
+    #       each one starts from its column of x0, or without a guess. They do not change
+    #       the last solution.
+    def solve(self, rhs_vec, x0=None):
+        rhs_vec = np.asarray(rhs_vec)
+        if rhs_vec.ndim == 2:
+            return np.column_stack([
+                self.solve_column(col, None if x0 is None else np.asarray(x0)[:, k])
+                for k, col in enumerate(rhs_vec.T)
+            ])
+        self.last = self.solve_column(rhs_vec, self.last if x0 is None else x0)
+        return self.last
+
+    def solve_column(self, rhs_vec, x0):
+        if self.split is None:
+            return self.solve_system(rhs_vec, x0)
+
+        branch, nodes, keep, src_coef, branch_coef, keep_cols, node_rows = self.split
+        fixed           = rhs_vec[branch] / src_coef
+        guess           = None if x0 is None else np.asarray(x0)[keep]
+        soln            = np.zeros(len(rhs_vec))
+        soln[nodes]     = fixed
+        soln[keep]      = self.solve_system(rhs_vec[keep] - keep_cols @ fixed, guess)
+        soln[branch]    = (rhs_vec[nodes] - node_rows @ soln) / branch_coef
+        return soln
+
+    # Solve the (cg: reduced) system lhs_mat * x = rhs_vec from the guess x0
+    def solve_system(self, rhs_vec, x0):
+        self.iterations = 0
+        def count(_):
+            self.iterations += 1
+
+        if len(rhs_vec) == 0:
+            return np.zeros(0)
+
+        # A guess that already solves the system is returned as it is (BiCGSTAB breaks down
+        #       on a zero residual)
+        if x0 is not None and np.linalg.norm(rhs_vec - self.lhs_mat @ x0) <= self.tol * np.linalg.norm(rhs_vec):
+            return np.array(x0, dtype=float)
+
+        options = dict(self.gmres_args) if self.method == "gmres" else {}
+        options[self.rtol_name] = self.tol
+
+        # Breakdowns (info < 0) are restarted from the last iterate, with a new shadow residual
+        for _ in range(self.restarts + 1):
+            soln, info = self.methods[self.method](
+                self.lhs_mat, rhs_vec, x0=x0, atol=0.0,
+                maxiter=self.maxiter, M=self.precond_op, callback=count, **options
+            )
+            if info >= 0:
+                break
+            x0 = soln
+        if info != 0:
+            raise errors.uSpiceError(f"The {self.method} solver did not converge (info {info})")
+        return soln
+
+# Solver for block diagonal systems (circuits made of independent subcircuits)
+#       Every block of unknowns (see group_blocks) is factored and solved separately with
+#       its own backend, names[i] for block i, so the cost is the sum of the block costs.
+#       Blocks with at least parallel_size unknowns are factored and solved in a pool of
+#       workers threads (LAPACK and SuperLU release the GIL), the others one by one.
+#       The pool is the given one (shared by the solvers of a run, see Engine.make_solver),
+#       or a pool of the solver that is shut down by close()
+class BlockSolver:
+    def __init__(self, blocks, names, parallel_size=2000, workers=None, pool=None):
+        self.blocks     = blocks
+        self.solvers    = [make_solver(name) for name in names]
+        self.parallel   = [i for i, idx in enumerate(blocks) if len(idx) >= parallel_size]
+        self.own_pool   = pool is None and len(self.parallel) > 1
+        self.pool       = ThreadPoolExecutor(max_workers=workers) if self.own_pool else pool
+        if len(self.parallel) <= 1:
+            self.pool   = None
+
+    def close(self):
+        if self.own_pool:
+            self.pool.shutdown()
+            self.own_pool = False
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Run func(i) for all blocks i, the large blocks in the thread pool
+    def map(self, func):
+        if self.pool is None:
+            return [func(i) for i in range(len(self.blocks))]
+
+        futures = {i: self.pool.submit(func, i) for i in self.parallel}
+        results = [None if i in futures else func(i) for i in range(len(self.blocks))]
+        for i, future in futures.items():
+            results[i] = future.result()
+        return results
+
+    def factor(self, lhs_mat):
+        if sp.issparse(lhs_mat):
+            lhs_mat = sp.csr_matrix(lhs_mat)
+            get_block = lambda idx: lhs_mat[idx][:, idx]
+        else:
+            get_block = lambda idx: lhs_mat[np.ix_(idx, idx)]
+        self.map(lambda i: self.solvers[i].factor(get_block(self.blocks[i])))
+
+    def solve(self, rhs_vec):
+        rhs_vec = np.asarray(rhs_vec)
+        parts   = self.map(lambda i: self.solvers[i].solve(rhs_vec[self.blocks[i]]))
+        soln    = np.empty(rhs_vec.shape, dtype=np.result_type(rhs_vec, *parts))
+        for idx, part in zip(self.blocks, parts):
+            soln[idx] = part
+        return soln
+
+# Split the blocks of unknowns of independent subcircuits for the BlockSolver
+#       Returns the blocks with at least min_size unknowns, and the other blocks gathered
+#       into one block (an empty array when there are none)
+def group_blocks(blocks, min_size=64):
+    large = [idx for idx in blocks if len(idx) >= min_size]
+    small = [idx for idx in blocks if len(idx) < min_size]
+    return large, np.sort(np.concatenate(small)) if small else np.zeros(0, dtype=int)
+
+solver_types = {
+    "dense"     : DenseSolver,
+    "sparse"    : SparseSolver,
+    "iterative" : IterativeSolver,
+}
+
+# Create a solver backend from its name
+def make_solver(name, perm=None):
+    if name not in solver_types:
+        raise errors.uSpiceError(f"Unknown solver '{name}', expected one of {list(solver_types.keys())}")
+    return solver_types[name](perm)
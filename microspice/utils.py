@@ -22,12 +22,77 @@
 
 import microspice.errors as errors
 
+import gc
 import re
 import math
 
+from   contextlib import contextmanager
+from   functools import lru_cache
+
+# Version of microspice (also invalidates the cached parsed netlists, see cache.py)
+VERSION = "0.2.0"
+
+NUMBER_PATTERN = re.compile(r'^(?P<value>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)(?P<prefix>[yzafpnum kMGT]?)(?P<unit>[A-Za-z]*)$')
+
+# Metric prefixes
+SCALING = {
+    'y': 1e-24,
+    'z': 1e-21,
+    'a': 1e-18,
+    'f': 1e-15,
+    'p': 1e-12,
+    'n': 1e-9,
+    'u': 1e-6,
+    'm': 1e-3,
+    'c': 1e-2,
+    'd': 1e-1,
+    'k': 1e3,
+    'M': 1e6,
+    'G': 1e9,
+    'T': 1e12,
+    'P': 1e15,
+    'E': 1e18,
+    'Z': 1e21,
+    'Y': 1e24,
+}
+
+# Units (lower case), as a scaling factor or a conversion function
+UNITS = {
+    'ohm': 1,
+    'ohms': 1,
+    'v': 1,
+    'a': 1,
+    'f': 1,
+    'h': 1,
+    's': 1,
+    'w': 1,
+    'j': 1,
+    'n': 1,
+    'hz': 1,
+    'k': 1e3,
+    'c': lambda x: x + 273.15,
+    'degc': lambda x: x + 273.15,
+    'fahrenheit': lambda x: (x - 32) * 5/9 + 273.15,
+    'degf': lambda x: (x - 32) * 5/9 + 273.15,
+    'kat': 1,
+    'mol': 1,
+    'pa': 1,
+    'bar': 1e5,
+    'psi': 6.89476e3,
+    'inhg': 3.38639e3,
+    'in hg': 3.38639e3,
+    'cmhg': 1.33322e3,
+    'cm hg': 1.33322e3,
+    'mmhg': 133.322,
+    'mm hg': 133.322,
+    'torr': 133.322,
+    'atm': 1.01325e5,
+}
+
+# Netlists repeat the same few values many times, so parsed numbers are cached
+@lru_cache(maxsize=1 << 16)
 def parse_number(str_inp):
-    pattern = r'^(?P<value>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)(?P<prefix>[yzafpnum kMGT]?)(?P<unit>[A-Za-z]*)$'
-    match = re.match(pattern, str_inp)
+    match = NUMBER_PATTERN.match(str_inp)
 
     if match:
         value = float(match.group('value'))
@@ -49,65 +114,27 @@ def parse_number(str_inp):
         raise errors.uSpiceBug("parse_number received an empty input")
 
 def get_scaling(prefix):
-    scaling_dict = {
-        'y': 1e-24,
-        'z': 1e-21,
-        'a': 1e-18,
-        'f': 1e-15,
-        'p': 1e-12,
-        'n': 1e-9,
-        'u': 1e-6,
-        'm': 1e-3,
-        'c': 1e-2,
-        'd': 1e-1,
-        'k': 1e3,
-        'M': 1e6,
-        'G': 1e9,
-        'T': 1e12,
-        'P': 1e15,
-        'E': 1e18,
-        'Z': 1e21,
-        'Y': 1e24,
-    }
-    return scaling_dict.get(prefix, 1)
+    return SCALING.get(prefix, 1)
 
 def apply_unit(value, unit):
-    unit_dict = {
-        'ohm': 1,
-        'ohms': 1,
-        'v': 1,
-        'a': 1,
-        'f': 1,
-        'h': 1,
-        's': 1,
-        'w': 1,
-        'j': 1,
-        'n': 1,
-        'hz': 1,
-        'k': 1e3,
-        'c': lambda x: x + 273.15,
-        'degc': lambda x: x + 273.15,
-        'fahrenheit': lambda x: (x - 32) * 5/9 + 273.15,
-        'degf': lambda x: (x - 32) * 5/9 + 273.15,
-        'kat': 1,
-        'mol': 1,
-        'pa': 1,
-        'bar': 1e5,
-        'psi': 6.89476e3,
-        'inhg': 3.38639e3,
-        'in hg': 3.38639e3,
-        'cmhg': 1.33322e3,
-        'cm hg': 1.33322e3,
-        'mmhg': 133.322,
-        'mm hg': 133.322,
-        'torr': 133.322,
-        'atm': 1.01325e5,
-    }
-    if unit.lower() in unit_dict:
-        conversion = unit_dict[unit.lower()]
+    if unit.lower() in UNITS:
+        conversion = UNITS[unit.lower()]
         if callable(conversion):
             return conversion(value)
         else:
             return value * conversion
     else:
         raise errors.SyntaxError(f"Invalid unit, '{unit}'")
+
+# Pause the garbage collector
+#       Used while creating (parsing, unpickling) many objects without reference cycles,
+#       where the collections triggered by the new objects dominate the time
+@contextmanager
+def gc_paused():
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
@@ -0,0 +1,145 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.errors        as errors
+
+import json
+import struct
+import numpy as np
+
+# Binary waveform file format
+#
+#       magic       8 bytes     b"USPWAVE1"
+#       num_steps   uint64      Number of time points written
+#       capacity    uint64      Number of time points reserved per signal
+#       header_len  uint64      Length of the JSON header
+#       header      JSON        {"signals": [...], "dtype": "<f8"}, padded to a multiple of 8 bytes
+#       data        Column major (signal major) array of shape (num signals, capacity)
+#
+#       Each signal is stored contiguously, so a single signal can be read through
+#       np.memmap without touching the rest of the file. The time axis is stored as
+#       the signal "time".
+
+MAGIC       = b"USPWAVE1"
+PREFIX      = struct.Struct("<8sQQQ")
+
+# Size of the write buffer, a chunk holds as many time points of all signals as fit into it
+BUF_BYTES   = 1 << 22
+
+# Writes a waveform file incrementally, one time point at a time
+#       Time points are buffered and written to the file in chunks of chunk_size (by default
+#       as many as fit into BUF_BYTES, at most capacity and 4096)
+class WaveformWriter:
+    def __init__(self, file_name, signals, capacity, dtype=np.float64, chunk_size=None):
+        self.file_name  = file_name
+        self.signals    = list(signals)
+        self.capacity   = capacity
+        self.dtype      = np.dtype(dtype)
+        self.num_steps  = 0
+
+        if chunk_size is None:
+            chunk_size = min(4096, capacity, BUF_BYTES // (self.dtype.itemsize * max(1, len(self.signals))))
+        self.buf        = np.empty((max(1, chunk_size), len(self.signals)), dtype=self.dtype)
+        self.buf_len    = 0
+
+        header = json.dumps({"signals": self.signals, "dtype": self.dtype.str}).encode()
+        header += b" " * (-(PREFIX.size + len(header)) % 8)
+        self.offset = PREFIX.size + len(header)
+
+        self.file = open(file_name, "w+b")
+        self.file.write(PREFIX.pack(MAGIC, 0, capacity, len(header)))
+        self.file.write(header)
+        self.file.truncate(self.offset + len(self.signals) * capacity * self.dtype.itemsize)
+
+    # Add one time point, values are ordered as the signals
+    #       The file grows (doubling the capacity) when it is full
+    def write(self, values):
+        if self.num_steps + self.buf_len >= self.capacity:
+            self.flush()
+            self.grow(max(2 * self.capacity, len(self.buf)))
+
+        self.buf[self.buf_len, :] = values
+        self.buf_len += 1
+        if self.buf_len == len(self.buf):
+            self.flush()
+
+    # Write the buffered time points into each signal's column
+    def flush(self):
+        if self.buf_len == 0:
+            return
+        itemsize = self.dtype.itemsize
+        for j in range(len(self.signals)):
+            self.file.seek(self.offset + (j * self.capacity + self.num_steps) * itemsize)
+            self.file.write(self.buf[:self.buf_len, j].tobytes())
+        self.num_steps += self.buf_len
+        self.buf_len    = 0
+
+    # Increase the number of time points reserved per signal
+    #       Signals are moved starting from the last one, so no data is overwritten
+    def grow(self, capacity):
+        itemsize = self.dtype.itemsize
+        self.file.truncate(self.offset + len(self.signals) * capacity * itemsize)
+        for j in reversed(range(len(self.signals))):
+            self.file.seek(self.offset + j * self.capacity * itemsize)
+            data = self.file.read(self.num_steps * itemsize)
+            self.file.seek(self.offset + j * capacity * itemsize)
+            self.file.write(data)
+        self.capacity = capacity
+
+    def close(self):
+        self.flush()
+        self.file.seek(0)
+        self.file.write(PREFIX.pack(MAGIC, self.num_steps, self.capacity, self.offset - PREFIX.size))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+# Reads a waveform file through a memory map
+#       wave["x"] returns signal x as a memory mapped array, wave.data is the full
+#       (num signals, num steps) array
+class Waveform:
+    def __init__(self, file_name):
+        with open(file_name, "rb") as file:
+            magic, num_steps, capacity, header_len = PREFIX.unpack(file.read(PREFIX.size))
+            if magic != MAGIC:
+                raise errors.uSpiceError(f"{file_name} is not a microspice waveform file")
+            header = json.loads(file.read(header_len))
+
+        self.file_name  = file_name
+        self.signals    = header["signals"]
+        self.num_steps  = num_steps
+        self.dict_sig2idx = {sig: i for i, sig in enumerate(self.signals)}
+
+        data = np.memmap(file_name, dtype=np.dtype(header["dtype"]), mode="r",
+                         offset=PREFIX.size + header_len, shape=(len(self.signals), capacity))
+        self.data = data[:, :num_steps]
+
+    @property
+    def time(self):
+        return self["time"]
+
+    def __getitem__(self, signal):
+        return self.data[self.dict_sig2idx[signal]]
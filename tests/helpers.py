@@ -0,0 +1,75 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.parser        as parser
+
+import io
+import numpy                    as np
+import os.path
+
+EXAMPLES_DIR    = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+EXAMPLES        = ["test1.sp", "test2.sp", "test3.sp"]
+
+# Options of the reference simulations, the plain dense solver
+DENSE_OPTIONS   = {"solver": "dense", "blocks": "0"}
+
+def example_path(name):
+    return os.path.join(EXAMPLES_DIR, name)
+
+# Parse a netlist and run all its environments with extra options
+#       Returns one result dictionary per environment, with the results as arrays
+def simulate(file_name, options=None):
+    p = parser.Parser()
+    p.read(file_name)
+    return run_parsed(p, options)
+
+# Same as simulate() for the netlist text
+def simulate_netlist(netlist, options=None):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(netlist))
+    return run_parsed(p, options)
+
+# Same as simulate(), with all environments run as one batch (see Engine.run_batch)
+def simulate_batch(file_name, options=None):
+    p = parser.Parser()
+    p.read(file_name)
+    p.parse()
+    p.eng.options.update(options or {})
+    return [{key: np.asarray(value) for key, value in result.items()} for result in p.eng.run_batch(p.envs)]
+
+def run_parsed(p, options):
+    p.parse()
+    p.eng.options.update(options or {})
+
+    results = []
+    for env in p.envs:
+        p.eng.set_env(env)
+        results.append({key: np.asarray(value) for key, value in p.eng.run().items()})
+    return results
+
+# Check that two lists of results (see simulate) have the same signals and values
+def assert_results_close(results, reference, atol=1e-9, rtol=1e-9):
+    assert len(results) == len(reference)
+    for result, ref in zip(results, reference):
+        assert result.keys() == ref.keys()
+        for key in ref:
+            np.testing.assert_allclose(result[key], ref[key], rtol=rtol, atol=atol, err_msg=key)
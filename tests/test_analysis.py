@@ -0,0 +1,121 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.engine        as engine
+import microspice.errors        as errors
+import microspice.parser        as parser
+
+import io
+import numpy                    as np
+import pytest
+
+from   tests.helpers            import simulate_netlist
+
+# Voltage divider, v(out) = v(in) * r2 / (r1 + r2)
+DIVIDER = """* Divider
+v1 in 0 1
+r1 in out 1k
+r2 out 0 3k
+.print v(out)
+"""
+
+def test_dc_sweep():
+    result = simulate_netlist(DIVIDER + ".dc v1 -1 2 0.5\n")[0]
+    np.testing.assert_allclose(result["sweep"], np.arange(-1, 2.25, 0.5))
+    np.testing.assert_allclose(result["out"], 0.75 * result["sweep"], atol=1e-12)
+
+def test_step():
+    result = simulate_netlist(DIVIDER + ".step r2 1k 3k 1k\n")[0]
+    np.testing.assert_allclose(result["step"], [1e3, 2e3, 3e3])
+    np.testing.assert_allclose(np.ravel(result["out"]), result["step"] / (1e3 + result["step"]), atol=1e-12)
+
+# A failing step restores the value of the stepped component
+def test_step_failure_restores_value(monkeypatch):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(DIVIDER + ".step r2 1k 3k 1k\n"))
+    p.parse()
+    run_analysis, calls = p.eng.run_analysis, []
+    def fail_second():
+        calls.append(None)
+        if len(calls) == 2:
+            raise errors.uSpiceError("failed step")
+        return run_analysis()
+    monkeypatch.setattr(p.eng, "run_analysis", fail_second)
+
+    with pytest.raises(errors.uSpiceError, match="failed step"):
+        p.eng.run()
+    assert p.envs[0].find_component("r2").resistance == 3e3
+    monkeypatch.undo()
+    del p.eng.options["step"]
+    assert p.eng.run()["out"] == pytest.approx(0.75)
+
+@pytest.mark.parametrize("command", [
+    ".dc r1 1k 2k 1k",          # Not a voltage source
+    ".dc vx 0 1 0.1",           # Unknown source
+    ".dc v1 0 1 abc",           # Malformed number
+    ".dc v1 0 1 -0.1",          # Increment going away from the stop value
+    ".step r2 1k 3k 0",         # Zero increment
+    ".ac dec 1x 10 100",
+])
+def test_invalid_sweeps(command):
+    with pytest.raises(errors.NetlistError, match="Line no.6"):
+        simulate_netlist(DIVIDER + command + "\n")
+
+# Sweeps set up without the parser are checked by the engine
+def test_dc_sweep_of_resistor():
+    p = parser.Parser()
+    p.read_stream(io.StringIO(DIVIDER))
+    p.parse()
+    p.eng.options.update({"dc_source": "r1", "dc_sweep": (1e3, 2e3, 1e3)})
+    with pytest.raises(errors.uSpiceError, match="not a voltage source"):
+        p.eng.run()
+
+# RC low pass with a 1 ms time constant
+LOW_PASS = """* Low pass
+v1 in 0 1
+r1 in out 1k
+c1 out 0 1u
+.print v(out)
+"""
+
+@pytest.mark.parametrize("solver", ["dense", "sparse"])
+def test_ac_low_pass(solver):
+    result = simulate_netlist(LOW_PASS + ".ac dec 10 10 100k\n", {"solver": solver})[0]
+    freq = result["freq"]
+    np.testing.assert_allclose(freq, 10 * 10 ** (np.arange(41) / 10))
+    np.testing.assert_allclose(result["out"], 1 / (1 + 2j * np.pi * freq * 1e-3), atol=1e-12)
+
+def test_ac_freqs():
+    np.testing.assert_allclose(engine.get_ac_freqs("lin", 5, 10, 50), [10, 20, 30, 40, 50])
+    np.testing.assert_allclose(engine.get_ac_freqs("oct", 1, 1, 8), [1, 2, 4, 8])
+    with pytest.raises(errors.uSpiceError):
+        engine.get_ac_freqs("dec", 0, 10, 100)
+
+@pytest.mark.parametrize("command", [
+    ".ac dec 0 10 100",         # No points
+    ".ac dec 10 0 100",         # Start frequency of 0
+    ".ac lin 10 100 10",        # Stop below start
+    ".ac log 10 10 100",        # Unknown sweep type
+])
+def test_invalid_ac(command):
+    with pytest.raises(errors.NetlistError, match="Line no.6"):
+        simulate_netlist(LOW_PASS + command + "\n")
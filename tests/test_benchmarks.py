@@ -0,0 +1,46 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import benchmarks.bench         as bench
+
+import json
+import pytest
+
+# Every solver backend can be benchmarked, other engine options are passed through
+@pytest.mark.parametrize("solver, options", [
+    ("dense", ["blocks=0"]),
+    ("sparse", ["ordering=rcm"]),
+    ("iterative", ["iter_method=cg", "precond=jacobi"]),
+])
+def test_solver_options(tmp_path, solver, options):
+    output = str(tmp_path / "results.json")
+    args = ["--cases", "rc_ladder", "--sizes", "10", "--steps", "20", "--repeat", "1", "--kernels", "python",
+            "--solver", solver, "--output", output, "--option"] + options
+    assert bench.main(args) == 0
+
+    with open(output) as file:
+        records = json.load(file)["results"]
+    assert {rec["solver"] for rec in records if "solver" in rec} == {solver}
+
+def test_invalid_option():
+    with pytest.raises(SystemExit):
+        bench.main(["--option", "blocks"])
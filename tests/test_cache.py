@@ -0,0 +1,92 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.cache         as cache
+import microspice.microspice    as microspice
+
+import numpy                    as np
+import os
+import pytest
+
+from   tests.helpers            import EXAMPLES, example_path, assert_results_close
+
+@pytest.fixture
+def netlist_cache(tmp_path):
+    return cache.NetlistCache(str(tmp_path / "cache"))
+
+def test_key(tmp_path, netlist_cache, monkeypatch):
+    file_a, file_b = tmp_path / "a.sp", tmp_path / "b.sp"
+    file_a.write_text("r1 1 0 1k\n")
+    file_b.write_text("r1 1 0 1k\n")
+    key = netlist_cache.get_key(str(file_a))
+    assert netlist_cache.get_key(str(file_b)) == key
+
+    # Edited netlists and other entry formats have other keys
+    file_b.write_text("r1 1 0 2k\n")
+    assert netlist_cache.get_key(str(file_b)) != key
+    monkeypatch.setattr(cache, "CACHE_FORMAT", cache.CACHE_FORMAT + 1)
+    assert netlist_cache.get_key(str(file_a)) != key
+
+def test_store_and_load(netlist_cache):
+    assert netlist_cache.load("missing") is None
+    netlist_cache.store("key", {"value": [1, 2, 3]})
+    assert netlist_cache.load("key") == {"value": [1, 2, 3]}
+
+def test_broken_entry(netlist_cache):
+    with open(netlist_cache.get_path("key"), "wb") as file:
+        file.write(b"not a pickle")
+    assert netlist_cache.load("key") is None
+    assert not os.path.exists(netlist_cache.get_path("key"))
+
+# Entries are evicted least recently used first, loading an entry marks it as used
+def test_eviction(netlist_cache):
+    payload = b"x" * 1000
+    for i, key in enumerate(["a", "b", "c"]):
+        netlist_cache.store(key, payload)
+        os.utime(netlist_cache.get_path(key), (1000 + i, 1000 + i))
+    entry_size = os.path.getsize(netlist_cache.get_path("a"))
+
+    netlist_cache.load("a")
+    netlist_cache.max_bytes = 3 * entry_size
+    netlist_cache.store("d", payload)
+
+    assert [key for key in "abcd" if os.path.exists(netlist_cache.get_path(key))] == ["a", "c", "d"]
+
+    netlist_cache.clear()
+    assert os.listdir(netlist_cache.cache_dir) == []
+
+# Netlists loaded from the cache give the results of parsed netlists
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_cached_netlist(tmp_path, name, dense_results):
+    for _ in range(2):
+        sim = microspice.Microspice(use_cache=True, cache_dir=str(tmp_path / "cache"))
+        sim.parse_file(example_path(name))
+        phases = sim.parser.eng.profiler.summary()["phases"]
+        sim.parser.eng.options.update({"solver": "dense", "blocks": "0"})
+
+        results = []
+        while not sim.done():
+            sim.run_next()
+            results.append({key: np.asarray(value) for key, value in sim.result.items()})
+        assert_results_close(results, dense_results(name))
+
+    assert "cache_load" in phases and "parse" not in phases
@@ -0,0 +1,122 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.parser        as parser
+
+import io
+import numpy                    as np
+import pytest
+
+from   tests.helpers            import EXAMPLES, example_path
+
+# Every compiled element type: resistors, capacitors, VCCS and the source types
+NETLIST = """* Compiled
+v1 in 0 pulse(0 1 0 1u 1u 5u 10u)
+v2 d 0 sin(0 1 100k 0 0 0)
+v3 e 0 2
+r1 in a 1k
+c1 a b 1n
+r2 b 0 2k
+g1 b 0 a 0 1m
+c2 b d 2n
+r3 d e 500
+c3 e 0 1p
+.tran 0.1u 20u
+.print v(a)
+"""
+STEP_SIZE = 1e-7
+
+def parse_netlist(netlist=NETLIST):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(netlist))
+    p.parse()
+    return p.envs[0]
+
+def parse_example(name):
+    p = parser.Parser()
+    p.read(example_path(name))
+    p.parse()
+    return p.envs[0]
+
+# MNA matrix (with the RHS column) assembled element by element from the component stamps
+#       np.add.at adds up the entries of elements with repeated nodes (like g1 in test3.sp)
+def assemble(env, stamp, dtype=float):
+    n   = env.num_nodes
+    mat = np.zeros((n, n + 1), dtype=dtype)
+    for comp in env.dict_id2comp.values():
+        idx_vec = env.dict_comp2node[comp.id]
+        np.add.at(mat, np.ix_(idx_vec, idx_vec + [n]), np.asarray(stamp(comp)))
+    return mat[1:, 1:]
+
+@pytest.mark.parametrize("env", [parse_netlist()] + [parse_example(name) for name in EXAMPLES])
+def test_compiled_matches_stamps(env):
+    np.testing.assert_allclose(env.get_mat_dc(), assemble(env, lambda comp: comp.stamp_dc()), atol=1e-15)
+
+    lhs_stamp = lambda comp: np.column_stack((comp.stamp_trans_lhs(STEP_SIZE), np.zeros(len(comp.nodes))))
+    np.testing.assert_allclose(env.get_lhs_trans(STEP_SIZE), assemble(env, lhs_stamp)[:, :-1], atol=1e-15)
+    np.testing.assert_allclose(env.get_mat_trans(STEP_SIZE), assemble(env, lambda comp: comp.stamp_trans(STEP_SIZE)),
+                               atol=1e-15)
+
+    ckt = env.compile()
+    (g_rows, g_cols, g_vals), (c_rows, c_cols, c_vals) = ckt.get_ac_triplets()
+    w   = 2e5
+    lhs = ckt.to_dense(g_rows, g_cols, g_vals) + 1j * w * ckt.to_dense(c_rows, c_cols, c_vals)
+    ref = assemble(env, lambda comp: comp.stamp_ac(w), complex)
+    np.testing.assert_allclose(lhs, ref[:, :-1], atol=1e-15)
+    np.testing.assert_allclose(ckt.get_rhs_ac()[1:], ref[:, -1], atol=1e-15)
+
+# The components are grouped by type into the arrays
+def test_compiled_arrays():
+    env = parse_netlist()
+    ckt = env.compile()
+    idx = env.dict_node2idx
+
+    assert ckt.num_nodes == env.num_nodes and not ckt.other
+    np.testing.assert_array_equal(ckt.res_nodes, [[idx["in"], idx["a"]], [idx["b"], 0], [idx["d"], idx["e"]]])
+    np.testing.assert_allclose(ckt.res_g, [1e-3, 5e-4, 2e-3])
+    np.testing.assert_allclose(ckt.cap_c, [1e-9, 2e-9, 1e-12])
+    np.testing.assert_allclose(ckt.vccs_g, [1e-3])
+    assert [comp.id for comp in ckt.src_comps] == ["v1", "v2", "v3"]
+    assert ckt.src_nodes.shape == (3, 3)
+
+# The vectorized state update gives the states of the per component update
+def test_update_states():
+    env  = parse_netlist()
+    ref  = parse_netlist()
+    soln = np.linspace(-1, 2, env.num_nodes - 1)
+
+    env.update_states(soln, 3e-6)
+    ref.set_node_vals(soln)
+    ref.update_comp_states(3e-6)
+
+    ckt = env.compile()
+    np.testing.assert_allclose(ckt.cap_v, [ref.dict_id2comp[comp.id].voltage for comp in ckt.cap_comps])
+    np.testing.assert_allclose(env.get_rhs_trans(STEP_SIZE), assemble(ref, lambda comp: comp.stamp_trans(STEP_SIZE))[:, -1])
+
+    # The component objects and node values are only updated by sync_components()
+    assert all(comp.voltage == 0 for comp in ckt.cap_comps)
+    env.sync_components()
+    for comp in ckt.cap_comps:
+        assert comp.voltage == pytest.approx(ref.dict_id2comp[comp.id].voltage)
+    assert all(comp.time == 3e-6 for comp in ckt.src_comps)
+    assert dict(env.dict_node2val) == pytest.approx(dict(ref.dict_node2val))
+    assert dict(ckt.node_view) == pytest.approx(dict(ref.dict_node2val))
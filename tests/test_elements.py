@@ -0,0 +1,91 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.elements      as elements
+import microspice.parser        as parser
+
+import io
+import numpy                    as np
+import pytest
+
+# Every element type with a transient stamp, with its state set
+def make_elements():
+    cap = elements.Capacitor()
+    cap.read_spice("c1 1 2 2u")
+    cap.voltage = 3.0
+
+    res = elements.Resistor()
+    res.read_spice("r1 1 2 4k")
+
+    src = elements.VPWL()
+    src.read_spice("v1 1 0 pwl(0,0 1ms,2v)")
+    src.time = 0.5e-3
+
+    vccs = elements.VCCS()
+    vccs.read_spice("g1 1 0 2 0 5m")
+    return [cap, res, src, vccs]
+
+# The transient stamp is the static LHS stamp with the RHS contribution as the last column
+@pytest.mark.parametrize("elem", make_elements(), ids=lambda elem: type(elem).__name__)
+def test_stamp_trans_split(elem):
+    h       = 1e-6
+    lhs     = np.asarray(elem.stamp_trans_lhs(h))
+    rhs_vec = np.zeros(len(elem.nodes))
+    elem.stamp_trans_rhs(h, rhs_vec, range(len(elem.nodes)))
+    np.testing.assert_array_equal(elem.stamp_trans(h), np.column_stack((lhs, rhs_vec)))
+
+def test_stamp_trans_values():
+    cap, res, src, vccs = make_elements()
+    np.testing.assert_allclose(cap.stamp_trans(1e-6), [[2, -2, 6], [-2, 2, -6]])
+    np.testing.assert_allclose(res.stamp_trans(1e-6), [[2.5e-4, -2.5e-4, 0], [-2.5e-4, 2.5e-4, 0]])
+    np.testing.assert_allclose(src.stamp_trans(1e-6), [[0, 0, 1, 0], [0, 0, -1, 0], [1, -1, 0, 1]])
+    np.testing.assert_allclose(vccs.stamp_trans(1e-6)[:, -1], 0)
+
+# The RHS contributions are added into the vector at the given indices
+def test_stamp_trans_rhs_adds():
+    cap, res, src, vccs = make_elements()
+    rhs_vec = np.ones(6)
+    cap.stamp_trans_rhs(1e-6, rhs_vec, [4, 1])
+    src.stamp_trans_rhs(1e-6, rhs_vec, [0, 1, 5])
+    np.testing.assert_allclose(rhs_vec, [1, -5, 1, 1, 7, 2])
+
+# The environment's transient system is the LHS matrix with the RHS vector as the last column
+def test_mat_trans_split():
+    p = parser.Parser()
+    p.read_stream(io.StringIO("""* Split
+v1 in 0 pulse(0 1 0 1u 1u 5u 10u)
+r1 in a 1k
+c1 a b 1n
+r2 b 0 2k
+g1 b 0 a 0 1m
+c2 b 0 2n
+.tran 0.1u 20u
+.print v(a)
+"""))
+    p.parse()
+    env = p.envs[0]
+    env.update_states(np.arange(1.0, env.num_nodes), 2e-6)
+
+    mat_trans = env.get_mat_trans(1e-7)
+    np.testing.assert_array_equal(mat_trans[:, :-1], env.get_lhs_trans(1e-7))
+    np.testing.assert_array_equal(mat_trans[:, -1], env.get_rhs_trans(1e-7))
+    np.testing.assert_array_equal(env.get_lhs_trans(1e-7, sparse=True).toarray(), env.get_lhs_trans(1e-7))
@@ -0,0 +1,131 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.circuit       as circuit
+import microspice.environment   as environment
+import microspice.parser        as parser
+
+import copy
+import io
+import numpy                    as np
+import pytest
+
+# .alter runs changing a value, a source and adding a node (each .alter applies on the previous one)
+NETLIST = """* Overlays
+v1 in 0 pulse(0 1 0 1u 1u 5u 10u)
+r1 in a 1k
+c1 a 0 1n
+r2 a b 2k
+c2 b 0 2n
+.tran 0.1u 20u
+.print v(a)
+.print v(b)
+.alter
+r1 in a 500
+.alter
+v1 in 0 sin(0 1 100k 0 0 0)
+.alter
+r3 b c 1k
+c3 c 0 1n
+"""
+STEP_SIZE = 0.1e-6
+
+def parse():
+    p = parser.Parser()
+    p.read_stream(io.StringIO(NETLIST))
+    p.parse()
+    return p
+
+# Plain environment with deep copies of the components of env
+def flatten(env):
+    flat = environment.Environment()
+    for comp in env.dict_id2comp.values():
+        flat.add_component(copy.deepcopy(comp))
+    return flat
+
+# LHS matrix of env with the rows and columns ordered as the nodes of ref_env
+def get_lhs(env, ref_env, step_size=STEP_SIZE):
+    order = [env.dict_node2idx[node] - 1 for node, idx in sorted(ref_env.dict_node2idx.items(), key=lambda x: x[1]) if idx]
+    return env.get_lhs(step_size)[np.ix_(order, order)]
+
+def run(p, env, options=None):
+    p.eng.options.update(options or {})
+    p.eng.set_env(env)
+    return {key: np.asarray(value) for key, value in p.eng.run().items()}
+
+@pytest.mark.parametrize("run_num, overlay", [(1, True), (2, True), (3, False)])
+def test_alter_matches_copy(run_num, overlay):
+    p = parse()
+    env = p.envs[run_num]
+    flat = flatten(env)
+
+    # Only .alter runs without new nodes are compiled from the base circuit
+    assert (env.compile().base is not None) == overlay
+    np.testing.assert_allclose(get_lhs(flat, env), env.get_lhs(STEP_SIZE), atol=1e-15)
+
+    result, ref = run(p, env), run(p, flat)
+    for key in ref:
+        np.testing.assert_allclose(result[key], ref[key], atol=1e-12, err_msg=key)
+
+# Changing a component shared with the base environment copies it
+def test_set_value_does_not_change_base():
+    p = parse()
+    base, env = p.envs[0], p.envs[1]
+    base_lhs = base.get_lhs(STEP_SIZE).copy()
+    base_r2  = base.find_component("r2")
+    env.get_lhs(STEP_SIZE)
+
+    env.set_value("r2", 5e3)
+
+    assert base_r2.resistance == 2e3 and base.find_component("r2") is base_r2
+    assert env.find_component("r2").resistance == 5e3
+    np.testing.assert_array_equal(base.get_lhs(STEP_SIZE), base_lhs)
+    np.testing.assert_allclose(get_lhs(flatten(env), env), env.get_lhs(STEP_SIZE), atol=1e-15)
+
+def test_step_does_not_leak_into_base():
+    p = parse()
+    base_ref = run(p, p.envs[0])
+    stepped  = run(p, p.envs[1], {"step": ("r2", 1e3, 3e3, 1e3)})
+
+    assert len(stepped["step"]) == 3
+    assert p.envs[0].find_component("r2").resistance == 2e3
+    assert p.envs[1].find_component("r2").resistance == 2e3
+    del p.eng.options["step"]
+    result = run(p, p.envs[0])
+    for key in base_ref:
+        np.testing.assert_array_equal(result[key], base_ref[key])
+
+@pytest.mark.parametrize("run_num", [1, 2])
+def test_overlay_matches_compile(run_num):
+    p = parse()
+    env = p.envs[run_num]
+    overlay = circuit.Circuit.overlay(p.envs[0].compile(), env)
+    full    = circuit.Circuit(env)
+    assert overlay is not None
+
+    for step_size in (None, STEP_SIZE):
+        np.testing.assert_array_equal(overlay.to_dense(*overlay.get_triplets(step_size)),
+                                      full.to_dense(*full.get_triplets(step_size)))
+    np.testing.assert_array_equal(overlay.get_rhs_dc(), full.get_rhs_dc())
+    np.testing.assert_array_equal(overlay.get_rhs_trans(STEP_SIZE, 3e-6), full.get_rhs_trans(STEP_SIZE, 3e-6))
+    times = np.linspace(0, 20e-6, 201)
+    np.testing.assert_array_equal(overlay.get_src_values(times), full.get_src_values(times))
@@ -0,0 +1,61 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.microspice    as microspice
+import microspice.waveform      as waveform
+
+import numpy                    as np
+
+from   tests.helpers            import DENSE_OPTIONS, example_path, assert_results_close
+
+# Environments run in worker processes give the serial results, and their profiler
+#       summaries are collected and printed like the serial ones
+def test_run_all(capsys, dense_results):
+    sim = microspice.Microspice()
+    sim.parse_file(example_path("test1.sp"))
+    sim.parser.eng.options.update(DENSE_OPTIONS)
+    sim.parser.eng.options["profile"] = "1"
+
+    results = sim.run_all(workers=2)
+    assert sim.done()
+    assert_results_close([{key: np.asarray(value) for key, value in result.items()} for result in results],
+                         dense_results("test1.sp"))
+
+    assert capsys.readouterr().out.count("Phase") == len(results)
+    assert sim.profile["counters"]["solves"] > 0
+    assert "factor" in sim.profile["phases"]
+
+# With a waveform file, run_batch runs the environments one by one and streams each into its file
+def test_run_batch_wavefile(tmp_path, dense_results):
+    sim = microspice.Microspice()
+    sim.parse_file(example_path("test1.sp"))
+    sim.parser.eng.options.update(DENSE_OPTIONS)
+    sim.parser.eng.options["wavefile"] = str(tmp_path / "wave.bin")
+
+    results = sim.run_batch()
+    assert sim.done()
+    reference = dense_results("test1.sp")
+    assert_results_close([{key: np.asarray(value) for key, value in result.items()} for result in results], reference)
+
+    for i, ref in enumerate(reference):
+        wave = waveform.Waveform(str(tmp_path / f"wave_{i}.bin"))
+        np.testing.assert_allclose(wave["time"], ref["time"])
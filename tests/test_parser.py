@@ -0,0 +1,169 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.elements      as elements
+import microspice.errors        as errors
+import microspice.parser        as parser
+import microspice.utils         as utils
+
+import io
+import numpy                    as np
+import pytest
+
+from   tests.helpers            import EXAMPLES, example_path
+
+# PWL source split over continuation lines, with comments and blank lines in between
+CONTINUED = """* Continued statements
+r1 1 2 1k
+v1 1 0 pwl(0ms,0v
+* comment between continuation lines
+
++ 1ms,1v    * trailing comment
++ 2ms,0v)
+c1 2 0 1u
+.tran 0.1ms 2ms
+.print v(2)
+"""
+
+JOINED = """* Continued statements
+r1 1 2 1k
+v1 1 0 pwl(0ms,0v 1ms,1v 2ms,0v)
+c1 2 0 1u
+.tran 0.1ms 2ms
+.print v(2)
+"""
+
+def parse_stream(netlist):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(netlist))
+    p.parse()
+    return p
+
+def run(p):
+    return {key: np.asarray(value) for key, value in p.eng.run().items()}
+
+def test_iter_statements():
+    statements = list(parser.iter_statements(io.StringIO(CONTINUED)))
+    assert statements == [
+        (2, "r1 1 2 1k"),
+        (3, "v1 1 0 pwl(0ms,0v 1ms,1v 2ms,0v)"),
+        (8, "c1 2 0 1u"),
+        (9, ".tran 0.1ms 2ms"),
+        (10, ".print v(2)"),
+    ]
+
+def test_continuation_lines():
+    continued, joined = parse_stream(CONTINUED), parse_stream(JOINED)
+    assert continued.envs[0].dict_node2idx == joined.envs[0].dict_node2idx
+    result, ref = run(continued), run(joined)
+    for key in ref:
+        np.testing.assert_array_equal(result[key], ref[key])
+
+# Errors are reported at the first line of a continued statement
+def test_error_in_continued_statement():
+    netlist = "* Error\nr1 1 0 1k\nv1 1 0 pwl(0ms,0v\n+ 1ms,1x)\n"
+    with pytest.raises(errors.NetlistError, match="Line no.3"):
+        parse_stream(netlist)
+
+def test_error_line_after_continuation():
+    netlist = "* Error\nv1 1 0 pwl(0ms,0v\n+ 1ms,1v)\n\nx1 1 0 1k\n"
+    with pytest.raises(errors.NetlistError, match="Line no.5"):
+        parse_stream(netlist)
+
+# Files read through a memory map, from a stream of lines or line by line give the same netlist
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_read_paths(name):
+    parsers = []
+    for use_mmap in (False, True):
+        p = parser.Parser()
+        p.read(example_path(name), use_mmap=use_mmap)
+        p.parse()
+        parsers.append(p)
+    with open(example_path(name)) as file:
+        parsers.append(parser.Parser())
+        parsers[-1].read_stream(file.readlines(), name)
+        parsers[-1].parse()
+    parsers.append(parser.Parser())
+    parsers[-1].read(example_path(name))
+    while parsers[-1].next_line <= len(parsers[-1].file_lines):
+        parsers[-1].parse_line()
+
+    ref = parsers[0]
+    for p in parsers[1:]:
+        assert p.eng.options == ref.eng.options
+        assert p.eng.print_nodes == ref.eng.print_nodes
+        assert len(p.envs) == len(ref.envs)
+        for env, ref_env in zip(p.envs, ref.envs):
+            assert dict(env.dict_node2idx) == dict(ref_env.dict_node2idx)
+            assert {comp_id: type(comp) for comp_id, comp in env.dict_id2comp.items()} == \
+                   {comp_id: type(comp) for comp_id, comp in ref_env.dict_id2comp.items()}
+
+def test_empty_file(tmp_path):
+    file_name = tmp_path / "empty.sp"
+    file_name.write_text("")
+    p = parser.Parser()
+    p.read(str(file_name), use_mmap=True)
+    p.parse()
+    assert len(p.envs) == 1 and len(p.envs[0].dict_id2comp) == 0
+
+def test_parse_line_past_end():
+    p = parser.Parser()
+    p.read(example_path("test1.sp"))
+    p.next_line = len(p.file_lines) + 1
+    with pytest.raises(errors.uSpiceError):
+        p.parse_line()
+
+@pytest.mark.parametrize("text, value", [
+    ("5", 5), ("-2.5e-3", -2.5e-3), ("1k", 1e3), ("1ms", 1e-3), ("100nS", 1e-7),
+    ("1kHz", 1e3), ("10V", 10), ("1f", 1e-15), ("3.3u", 3.3e-6), ("25c", 298.15),
+])
+def test_parse_number(text, value):
+    assert utils.parse_number(text) == pytest.approx(value, rel=1e-12)
+    # The second call is answered from the cache
+    hits = utils.parse_number.cache_info().hits
+    assert utils.parse_number(text) == pytest.approx(value, rel=1e-12)
+    assert utils.parse_number.cache_info().hits == hits + 1
+
+@pytest.mark.parametrize("text, error", [("1x", errors.SyntaxError), ("", errors.uSpiceBug)])
+def test_parse_number_invalid(text, error):
+    with pytest.raises(error):
+        utils.parse_number(text)
+
+# Elements read from their tokens (the fast parser path) are the ones read from the line
+@pytest.mark.parametrize("element_type, line", [
+    (elements.Resistor,  "r1 in out 4.7k"),
+    (elements.Capacitor, "c1 out 0 100n"),
+    (elements.VCCS,      "g1 out 0 in 0 2m"),
+    (elements.VConst,    "v1 in 0 12V"),
+])
+def test_read_tokens(element_type, line):
+    from_line, from_tokens = element_type(), element_type()
+    from_line.read_spice(line)
+    from_tokens.read_tokens(line.split())
+    assert vars(from_tokens) == vars(from_line)
+
+    p = parse_stream(f"* Tokens\n{line}\n")
+    assert vars(p.envs[0].dict_id2comp[from_line.id]) == vars(from_line)
+
+def test_wrong_number_of_tokens():
+    with pytest.raises(errors.NetlistError, match="Line no.3"):
+        parse_stream("* Tokens\nr1 1 0 1k\nc1 1 0\n")
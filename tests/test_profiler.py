@@ -0,0 +1,124 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.parser        as parser
+import microspice.profiler      as profiler
+
+from   tests.helpers            import example_path
+
+def test_phases_and_counters():
+    prof = profiler.Profiler()
+    with prof.phase("factor"):
+        pass
+    with prof.phase("factor"):
+        pass
+    prof.add_time("solve", 0.5, 10)
+    prof.count("solves", 10)
+    prof.count("solves")
+
+    summary = prof.summary()
+    assert summary["phases"]["factor"]["calls"] == 2
+    assert summary["phases"]["factor"]["seconds"] >= 0
+    assert summary["phases"]["solve"] == {"seconds": 0.5, "calls": 10}
+    assert summary["counters"] == {"solves": 11}
+
+    prof.reset()
+    assert prof.summary() == {"phases": {}, "counters": {}, "stats": {}}
+
+def test_stats():
+    prof = profiler.Profiler()
+    prof.max_stat("nnz", 5)
+    prof.max_stat("nnz", 3)
+    prof.max_stat("peak", -2)
+    prof.set_stat("method", "lu")
+    assert prof.summary()["stats"] == {"nnz": 5, "peak": -2, "method": "lu"}
+
+# Transient step times are added up and only passed on to the phases on flush()
+def test_step_times():
+    prof = profiler.Profiler()
+    prof.add_step(0.25, 0.5)
+    prof.add_step(0.25, 0.5)
+    assert prof.times == {}
+
+    summary = prof.summary()
+    assert summary["phases"]["rhs"] == {"seconds": 0.5, "calls": 2}
+    assert summary["phases"]["solve"] == {"seconds": 1.0, "calls": 2}
+    assert summary["counters"]["solves"] == 2
+
+def test_callbacks():
+    prof   = profiler.Profiler()
+    events = []
+    func   = lambda event, name, value: events.append((event, name, value))
+
+    prof.add_callback(func)
+    prof.add_time("solve", 0.5)
+    prof.count("solves", 3)
+    prof.set_stat("nnz", 7)
+    prof.remove_callback(func)
+    prof.count("solves")
+
+    assert events == [("phase", "solve", 0.5), ("count", "solves", 3), ("stat", "nnz", 7)]
+
+def test_merge():
+    prof = profiler.Profiler()
+    prof.add_time("solve", 0.5, 2)
+    prof.count("solves", 2)
+
+    other = profiler.Profiler()
+    other.add_time("solve", 0.25, 1)
+    other.add_time("factor", 0.125, 1)
+    other.count("solves", 1)
+    other.set_stat("nnz", 4)
+    prof.merge(other.summary())
+
+    summary = prof.summary()
+    assert summary["phases"] == {"solve": {"seconds": 0.75, "calls": 3}, "factor": {"seconds": 0.125, "calls": 1}}
+    assert summary["counters"] == {"solves": 3}
+    assert summary["stats"] == {"nnz": 4}
+
+def test_report():
+    prof = profiler.Profiler()
+    prof.add_time("factor", 0.002, 4)
+    prof.count("solves", 12)
+    prof.set_stat("unknowns", 9)
+
+    lines = prof.report().splitlines()
+    assert lines[0].split() == ["Phase", "Time", "(ms)", "Calls"]
+    assert lines[1].split() == ["factor", "2.000", "4"]
+    assert lines[2].split() == ["solves", "12"]
+    assert lines[3].split() == ["unknowns", "9"]
+
+# Callbacks registered on the engine see the events of a simulation
+def test_engine_callback():
+    p = parser.Parser()
+    p.read(example_path("test1.sp"))
+    p.parse()
+
+    events = []
+    p.eng.add_callback(lambda event, name, value: events.append((event, name)))
+    p.eng.set_env(p.envs[0])
+    p.eng.run()
+
+    assert ("phase", "factor") in events
+    assert ("count", "factorizations") in events
+    assert ("stat", "unknowns") in events
+    assert p.eng.profiler.summary()["counters"]["factorizations"] >= 1
@@ -0,0 +1,99 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import benchmarks.generators    as generators
+import microspice.elements      as elements
+import microspice.parser        as parser
+import microspice.reduction     as reduction
+
+import io
+import numpy                    as np
+import pytest
+import re
+
+from   tests.helpers            import EXAMPLES, example_path, simulate, assert_results_close
+
+# RC mesh driven by a PULSE (transient) or a constant source (AC up to 100 MHz)
+MESH_TRAN   = generators.rc_mesh(15, 15, num_steps=200)
+MESH_AC     = re.sub(r"PULSE\([^)]*\)", "1", MESH_TRAN).replace(".tran", ".ac dec 10 10 1e8\n*.tran")
+
+def parse_netlist(netlist):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(netlist))
+    p.parse()
+    return p
+
+# Run the first environment of a netlist, returns the result and the profiler statistics
+def run_netlist(netlist, options):
+    p = parse_netlist(netlist)
+    p.eng.options.update(options)
+    result = p.eng.run()
+    return {key: np.asarray(value) for key, value in result.items()}, p.eng.profiler.summary()["stats"]
+
+@pytest.mark.parametrize("tol, atol", [("1e-3", 1e-3), ("1e-6", 1e-6)])
+def test_reduced_transient(tol, atol):
+    full, _        = run_netlist(MESH_TRAN, {})
+    reduced, stats = run_netlist(MESH_TRAN, {"reduce": "1", "mor_tol": tol})
+
+    assert stats["mor_internal_nodes"] == 15 * 15 - 1
+    assert stats["mor_states"] < stats["mor_internal_nodes"]
+    assert stats["mor_error"] <= float(tol)
+    assert reduced.keys() == full.keys()
+    for key in full:
+        np.testing.assert_allclose(reduced[key], full[key], atol=atol, err_msg=key)
+
+@pytest.mark.parametrize("tol, atol", [("1e-3", 1e-3), ("1e-6", 1e-6)])
+def test_reduced_ac(tol, atol):
+    full, _        = run_netlist(MESH_AC, {})
+    reduced, stats = run_netlist(MESH_AC, {"reduce": "1", "mor_tol": tol})
+
+    assert stats["mor_error"] <= float(tol)
+    for key in full:
+        np.testing.assert_allclose(reduced[key], full[key], atol=atol, err_msg=key)
+
+# The congruence projection keeps G and C symmetric positive semidefinite (passive)
+def test_macromodel_is_passive():
+    p = parse_netlist(MESH_TRAN)
+    env, stats = reduction.reduce_environment(p.envs[0], set(p.eng.print_nodes), fmax=1e8)
+    models = [comp for comp in env.dict_id2comp.values() if isinstance(comp, elements.Macromodel)]
+    assert len(models) == 1
+
+    for mat in (models[0].g_mat, models[0].c_mat):
+        np.testing.assert_allclose(mat, mat.T, atol=1e-12 * np.abs(mat).max())
+        assert np.linalg.eigvalsh(mat).min() >= -1e-9 * np.abs(mat).max()
+
+# A tolerance the model cannot meet falls back to the full circuit
+def test_reduction_fallback():
+    p = parse_netlist(MESH_TRAN)
+    env, stats = reduction.reduce_environment(p.envs[0], set(p.eng.print_nodes), tol=1e-15, fmax=1e8, max_order=2)
+    assert env is None
+    assert stats["mor_error"] > 1e-15
+
+    full, _    = run_netlist(MESH_TRAN, {})
+    result, _  = run_netlist(MESH_TRAN, {"reduce": "1", "mor_tol": "1e-15"})
+    for key in full:
+        np.testing.assert_allclose(result[key], full[key], atol=1e-12, err_msg=key)
+
+# The examples have no internal R/C nodes to reduce, their results do not change
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_reduce_examples(name, dense_results):
+    assert_results_close(simulate(example_path(name), {"reduce": "1"}), dense_results(name))
@@ -0,0 +1,199 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.engine        as engine
+import microspice.errors        as errors
+import microspice.solvers       as solvers
+
+import inspect
+import numpy                    as np
+import pytest
+import scipy.sparse             as sp
+
+from   tests.helpers            import DENSE_OPTIONS, EXAMPLES, example_path, simulate, simulate_netlist, assert_results_close
+
+# Netlist of independent RC ladders (one per size), each driven by its own source
+def ladders_netlist(sizes, num_steps=200):
+    lines = ["* Independent RC ladders"]
+    for k, size in enumerate(sizes):
+        lines.append(f"v{k} l{k}_0 0 pulse(0 1 0 1u 1u 20u 50u)")
+        for i in range(1, size + 1):
+            lines.append(f"r{k}_{i} l{k}_{i - 1} l{k}_{i} 1k")
+            lines.append(f"c{k}_{i} l{k}_{i} 0 1n")
+    lines.append(f".tran {100e-6 / num_steps} 100u")
+    for k, size in enumerate(sizes):
+        lines.append(f".print v(l{k}_{size})")
+    return "\n".join(lines) + "\n"
+
+# Random diagonally dominant MNA-like system with a grounded voltage source row
+def make_system(size=30, seed=0):
+    rng = np.random.default_rng(seed)
+    mat = sp.random(size, size, density=0.1, random_state=rng).toarray()
+    mat = mat + mat.T
+    mat[np.diag_indices(size)] = np.abs(mat).sum(axis=1) + 1
+    mat[-1, :] = 0
+    mat[:, -1] = 0
+    mat[0, -1] = mat[-1, 0] = 1
+    return mat, rng.standard_normal(size)
+
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_sparse_matches_dense(name, dense_results):
+    assert_results_close(simulate(example_path(name), {"solver": "sparse"}), dense_results(name))
+
+@pytest.mark.parametrize("name", ["dense", "sparse"])
+def test_solver_backends(name):
+    mat, rhs = make_system()
+    solver = solvers.make_solver(name)
+    solver.factor(sp.csr_matrix(mat) if name == "sparse" else mat)
+    np.testing.assert_allclose(solver.solve(rhs), np.linalg.solve(mat, rhs), atol=1e-12)
+
+@pytest.mark.parametrize("ordering", solvers.ORDERINGS)
+def test_orderings(ordering):
+    mat, rhs = make_system()
+    perm = solvers.get_ordering(sp.csr_matrix(mat), ordering)
+    if perm is not None:
+        assert sorted(perm) == list(range(len(rhs)))
+
+    solver = solvers.SparseSolver(perm)
+    solver.factor(sp.csc_matrix(mat))
+    np.testing.assert_allclose(solver.solve(rhs), np.linalg.solve(mat, rhs), atol=1e-12)
+
+@pytest.mark.parametrize("ordering", solvers.ORDERINGS)
+def test_orderings_match_dense(ordering, dense_results):
+    results = simulate(example_path("test3.sp"), {"solver": "sparse", "ordering": ordering})
+    assert_results_close(results, dense_results("test3.sp"))
+
+def test_group_blocks():
+    blocks = [np.arange(0, 70), np.arange(70, 72), np.arange(72, 150), np.arange(150, 153)]
+    large, small = solvers.group_blocks(blocks, 64)
+    assert [len(idx) for idx in large] == [70, 78]
+    np.testing.assert_array_equal(small, [70, 71, 150, 151, 152])
+
+@pytest.mark.parametrize("parallel_size", [1, 1000])
+def test_block_solver(parallel_size):
+    mats, rhs = zip(*(make_system(size, seed) for seed, size in enumerate([20, 30, 25])))
+    mat  = sp.block_diag(mats).toarray()
+    rhs  = np.concatenate(rhs)
+    perm = np.random.default_rng(0).permutation(len(rhs))
+    mat, rhs = mat[np.ix_(perm, perm)], rhs[perm]
+
+    blocks = [np.flatnonzero((perm >= start) & (perm < stop)) for start, stop in [(0, 20), (20, 50), (50, 75)]]
+    solver = solvers.BlockSolver(blocks, ["dense", "sparse", "dense"], parallel_size, workers=2)
+    solver.factor(mat)
+    np.testing.assert_allclose(solver.solve(rhs), np.linalg.solve(mat, rhs), atol=1e-12)
+
+def test_block_solver_close():
+    mats, rhs = zip(*(make_system(size, seed) for seed, size in enumerate([20, 30])))
+    with solvers.BlockSolver([np.arange(20), np.arange(20, 50)], ["dense", "dense"], 1) as solver:
+        pool = solver.pool
+        solver.factor(sp.block_diag(mats).toarray())
+        solver.solve(np.concatenate(rhs))
+    assert solver.pool is None and pool._shutdown
+
+# The block solvers of a run (one per step size with adaptive steps) share one thread pool,
+#       which is shut down at the end of the run
+def test_block_pool_per_run(monkeypatch):
+    pools = []
+    class CountingPool(engine.ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(engine, "ThreadPoolExecutor", CountingPool)
+    monkeypatch.setattr(engine, "BLOCK_PARALLEL_SIZE", 64)
+    results = simulate_netlist(ladders_netlist([80, 70, 5]), {"solver": "dense", "adaptive": "1"})
+
+    assert len(pools) == 1 and pools[0]._shutdown
+    assert len(results[0]["time"]) > 2
+
+def test_blocks_match_dense(tmp_path):
+    file_name = tmp_path / "ladders.sp"
+    file_name.write_text(ladders_netlist([80, 70, 5, 3]))
+
+    results = simulate(str(file_name), {"solver": "dense", "blocks": "1"})
+    assert_results_close(results, simulate(str(file_name), DENSE_OPTIONS))
+
+# The tolerance keyword has to be accepted by the installed SciPy (tol before 1.12, rtol after)
+def test_iterative_tolerance_keyword():
+    for method in solvers.IterativeSolver.methods.values():
+        assert solvers.IterativeSolver.rtol_name in inspect.signature(method).parameters
+
+@pytest.mark.parametrize("method, precond", [
+    ("gmres", "ilu"), ("gmres", "jacobi"), ("gmres", "none"),
+    ("bicgstab", "ilu"), ("bicgstab", "jacobi"), ("bicgstab", "none"),
+    ("cg", "jacobi"), ("cg", "none"),
+])
+def test_iterative_solver(method, precond):
+    mat, rhs = make_system()
+    solver = solvers.IterativeSolver(method=method, precond=precond, tol=1e-12)
+    solver.factor(sp.csr_matrix(mat))
+    np.testing.assert_allclose(solver.solve(rhs), np.linalg.solve(mat, rhs), atol=1e-9)
+
+    # Warm started from the last solution
+    np.testing.assert_allclose(solver.solve(rhs), np.linalg.solve(mat, rhs), atol=1e-9)
+    assert solver.iterations == 0
+
+# The columns of a 2-D RHS are solved from their own guess, not from the previous column
+@pytest.mark.parametrize("method", ["gmres", "bicgstab", "cg"])
+def test_iterative_solver_columns(method):
+    mat, rhs = make_system()
+    rhs_mat  = np.column_stack((rhs, 2 * rhs, -rhs))
+    solver   = solvers.IterativeSolver(method=method, tol=1e-12)
+    solver.factor(sp.csr_matrix(mat))
+    last = solver.solve(rhs)
+
+    soln = solver.solve(rhs_mat)
+    np.testing.assert_allclose(soln, np.linalg.solve(mat, rhs_mat), atol=1e-9)
+    assert solver.last is last
+
+    # A guess that solves a column is returned as it is
+    solver.solve(rhs_mat, soln)
+    assert solver.iterations == 0
+
+# cg needs a symmetric preconditioner, its default is jacobi
+def test_cg_preconditioner():
+    assert solvers.IterativeSolver(method="cg").precond_type == "jacobi"
+    assert solvers.IterativeSolver(method="gmres").precond_type == "ilu"
+    with pytest.raises(errors.uSpiceError):
+        solvers.IterativeSolver(method="cg", precond="ilu")
+
+def test_cg_rejects_nonsymmetric():
+    mat, _ = make_system()
+    mat[1, 2] += 0.5
+    with pytest.raises(errors.uSpiceError):
+        solvers.IterativeSolver(method="cg").factor(sp.csr_matrix(mat))
+
+@pytest.mark.parametrize("name", EXAMPLES)
+@pytest.mark.parametrize("method", ["gmres", "bicgstab"])
+def test_iterative_matches_dense(name, method, dense_results):
+    results = simulate(example_path(name), {"solver": "iterative", "iter_method": method})
+    assert_results_close(results, dense_results(name), atol=1e-7)
+
+# cg runs on R/C circuits with grounded voltage sources, test3 has a VCCS
+@pytest.mark.parametrize("name", ["test1.sp", "test2.sp"])
+def test_cg_matches_dense(name, dense_results):
+    results = simulate(example_path(name), {"solver": "iterative", "iter_method": "cg"})
+    assert_results_close(results, dense_results(name), atol=1e-7)
+
+def test_cg_rejects_vccs():
+    with pytest.raises(errors.uSpiceError):
+        simulate(example_path("test3.sp"), {"solver": "iterative", "iter_method": "cg"})
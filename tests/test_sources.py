@@ -0,0 +1,68 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.elements      as elements
+
+import numpy                    as np
+import pytest
+
+# Source lines with every waveform type, including corners at the sample times
+SOURCES = [
+    (elements.VConst, "v1 1 0 5"),
+    (elements.VPulse, "v1 1 0 pulse(0 12V 2ms 0.1ms 0.2ms 1ms 2ms)"),
+    (elements.VPulse, "v1 1 0 pulse(1V 3V 0 0 0 1ms 2ms)"),
+    (elements.VPWL,   "v1 1 0 pwl(0.5ms,0v 1ms,12v 1.5ms,5v 3ms,-5V 4ms,3v)"),
+    (elements.VSin,   "v1 1 0 sin(0 12V 1kHz 2ms 10 45)"),
+]
+
+def make_source(source_type, line):
+    source = source_type()
+    source.read_spice(line)
+    return source
+
+# The vectorized waveforms are the scalar ones
+@pytest.mark.parametrize("source_type, line", SOURCES)
+def test_get_voltages(source_type, line):
+    source = make_source(source_type, line)
+    times  = np.concatenate((np.linspace(0, 6e-3, 6001), list(source.breakpoints(6e-3))))
+    np.testing.assert_allclose(source.get_voltages(times), [source.get_voltage(t) for t in times], atol=1e-12)
+
+# The pulse falls linearly from final_v to init_v in fall_time
+def test_pulse_fall():
+    source = make_source(*SOURCES[1])
+    fall   = 2e-3 + 0.1e-3 + 1e-3 + np.linspace(0, 0.2e-3, 9)
+    values = source.get_voltages(fall)
+    np.testing.assert_allclose(values, np.linspace(12, 0, 9), atol=1e-9)
+    assert np.all(np.diff(values) <= 0) and values.min() >= 0
+
+# Corners of the waveforms up to the end time
+@pytest.mark.parametrize("source_type, line, end_time, breakpoints", [
+    (elements.VConst, "v1 1 0 5", 5e-3, []),
+    (elements.VPulse, "v1 1 0 pulse(0 12V 2ms 0.1ms 0.2ms 1ms 2ms)", 5e-3,
+        [2e-3, 2.1e-3, 3.1e-3, 3.3e-3, 4e-3, 4.1e-3]),
+    (elements.VPWL,   "v1 1 0 pwl(0.5ms,0v 1ms,12v 1.5ms,5v 3ms,-5V 4ms,3v)", 2e-3, [0.5e-3, 1e-3, 1.5e-3]),
+    (elements.VSin,   "v1 1 0 sin(0 12V 1kHz 2ms 10 45)", 5e-3, [2e-3]),
+    (elements.VSin,   "v1 1 0 sin(0 12V 1kHz 2ms 10 45)", 1e-3, []),
+])
+def test_breakpoints(source_type, line, end_time, breakpoints):
+    source = make_source(source_type, line)
+    np.testing.assert_allclose(list(source.breakpoints(end_time)), breakpoints, atol=1e-15)
@@ -0,0 +1,203 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import microspice.elements      as elements
+import microspice.parser        as parser
+
+import io
+import numpy                    as np
+import pytest
+
+from   tests.helpers            import DENSE_OPTIONS, EXAMPLES, example_path, simulate, simulate_batch, simulate_netlist, assert_results_close
+
+# RC low pass (time constant 1 ms) driven by a 1 ms ramp from 0 to 1 V
+RC_RAMP = """* RC ramp
+r1 in out 1k
+c1 out 0 1u
+v1 in 0 pwl(0ms,0v 1ms,1v 10ms,1v)
+.tran 10us 5ms
+.print v(out)
+"""
+
+# Exact response of RC_RAMP
+def rc_ramp_exact(t, tau=1e-3, ramp_end=1e-3):
+    ramp = (t - tau * (1 - np.exp(-t / tau))) / ramp_end
+    ramp_end_v = (ramp_end - tau * (1 - np.exp(-ramp_end / tau))) / ramp_end
+    return np.where(t <= ramp_end, ramp, 1 - (1 - ramp_end_v) * np.exp(-(t - ramp_end) / tau))
+
+def test_fixed_step_rc_ramp():
+    result = simulate_netlist(RC_RAMP)[0]
+    assert len(result["time"]) == 501
+    np.testing.assert_allclose(result["out"], rc_ramp_exact(result["time"]), atol=1e-2)
+
+@pytest.mark.parametrize("reltol, atol", [("1e-3", 1e-2), ("1e-5", 1e-3)])
+def test_adaptive_rc_ramp(reltol, atol):
+    result = simulate_netlist(RC_RAMP, {"adaptive": "1", "reltol": reltol, "abstol": "1e-8"})[0]
+    time = result["time"]
+
+    assert time[0] == 0 and time[-1] == pytest.approx(5e-3)
+    assert np.all(np.diff(time) > 0)
+    # The corner of the ramp is a breakpoint
+    assert np.any(np.isclose(time, 1e-3, rtol=0, atol=1e-12))
+    np.testing.assert_allclose(result["out"], rc_ramp_exact(time), atol=atol)
+
+def test_adaptive_takes_fewer_steps():
+    fixed    = simulate_netlist(RC_RAMP)[0]
+    adaptive = simulate_netlist(RC_RAMP, {"adaptive": "1"})[0]
+    assert len(adaptive["time"]) < len(fixed["time"])
+
+# Adaptive runs of the examples end at the same time with the same signals, and the DC
+#       runs (constant sources) stay at the operating point of the fixed step runs
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_adaptive_examples(name, dense_results):
+    results = simulate(example_path(name), {"adaptive": "1"})
+    for result, ref in zip(results, dense_results(name)):
+        assert result.keys() == ref.keys()
+        assert result["time"][-1] == pytest.approx(ref["time"][-1])
+    assert_results_close([{key: value[-1] for key, value in results[0].items()}],
+                         [{key: value[-1] for key, value in dense_results(name)[0].items()}], atol=1e-9)
+
+@pytest.mark.parametrize("name", EXAMPLES)
+@pytest.mark.parametrize("solver", ["dense", "sparse"])
+def test_kernel_matches_dense(name, solver, dense_results):
+    results = simulate(example_path(name), {"kernel": "jit", "solver": solver})
+    assert_results_close(results, dense_results(name))
+
+@pytest.mark.parametrize("name", EXAMPLES)
+@pytest.mark.parametrize("solver", ["dense", "sparse"])
+def test_batch_matches_dense(name, solver, dense_results):
+    assert_results_close(simulate_batch(example_path(name), {"solver": solver}), dense_results(name))
+
+# RC_RAMP with .alter runs changing the element values, the variants have different LHS matrices
+RC_RAMP_ALTER = RC_RAMP.replace(".print", """.alter
+r1 in out 2k
+.alter
+c1 out 0 3u
+.print""")
+
+# Variants with different LHS matrices are factored once each, not once per step
+@pytest.mark.parametrize("solver", ["dense", "sparse"])
+def test_batch_different_lhs(solver):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(RC_RAMP_ALTER))
+    p.parse()
+    p.eng.options.update({"solver": solver})
+    results = [{key: np.asarray(value) for key, value in result.items()} for result in p.eng.run_batch(p.envs)]
+
+    assert len(results) == 3
+    assert_results_close(results, simulate_netlist(RC_RAMP_ALTER, DENSE_OPTIONS))
+    # One DC and one transient factorization per variant
+    assert p.eng.profiler.summary()["counters"]["factorizations"] == 2 * len(p.envs)
+
+# RC low pass driven by a pulse with corners between the 10 us time points (1.005 ms, 1.01 ms,
+#       1.5 ms on the grid, 1.503 ms)
+RC_PULSE = """* RC pulse
+r1 in out 1k
+c1 out 0 1u
+v1 in 0 pulse(0 1V 1.005ms 5us 490us 3us 0)
+.tran 10us 2ms
+.print v(out)
+"""
+
+# With ".option breakpoints=1" the fixed step time points include the source breakpoints
+#       that are not on the grid, and the steps are the distances between the time points
+def test_breakpoint_timestamps():
+    p = parser.Parser()
+    p.read_stream(io.StringIO(RC_PULSE))
+    p.parse()
+    p.eng.set_env(p.envs[0])
+
+    grid, grid_steps = p.eng.get_timestamps(2e-3, 1e-5)
+    assert len(grid) == 201
+    np.testing.assert_allclose(grid_steps, 1e-5)
+
+    p.eng.options["breakpoints"] = "1"
+    timestamps, steps = p.eng.get_timestamps(2e-3, 1e-5)
+    assert len(timestamps) == 201 + 3
+    assert np.all(np.diff(timestamps) > 0)
+    for t in [1.005e-3, 1.01e-3, 1.5e-3, 1.503e-3]:
+        assert np.min(np.abs(timestamps - t)) < 1e-15
+    np.testing.assert_allclose(steps[1:], np.diff(timestamps), rtol=1e-9)
+
+def test_breakpoint_run():
+    result = simulate_netlist(RC_PULSE, {"breakpoints": "1"})[0]
+    assert len(result["time"]) == 204
+    assert np.min(np.abs(result["time"] - 1.005e-3)) < 1e-15
+
+def run_counters(netlist, options=None):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(netlist))
+    p.parse()
+    p.eng.options.update(options or {})
+    p.eng.set_env(p.envs[0])
+    result = p.eng.run()
+    return {key: np.asarray(value) for key, value in result.items()}, p.eng.profiler.summary()["counters"]
+
+# The transient LHS of a linear circuit is factored once per step size (and once for DC)
+@pytest.mark.parametrize("solver", ["dense", "sparse"])
+def test_factor_once(solver):
+    _, counters = run_counters(RC_RAMP, {"solver": solver})
+    assert counters["steps"] == 500 and counters["solves"] == 501
+    assert counters["factorizations"] == 2
+
+    # Time points on the breakpoints add two more step sizes (to and from each breakpoint)
+    _, counters = run_counters(RC_PULSE, {"solver": solver, "breakpoints": "1"})
+    assert counters["factorizations"] <= 2 + 2 * 4
+
+# Circuits with nonlinear elements are factored again every step
+def test_factor_nonlinear(monkeypatch):
+    ref = simulate_netlist(RC_RAMP)[0]
+    monkeypatch.setattr(elements.Resistor, "is_linear", False)
+    result, counters = run_counters(RC_RAMP)
+    assert counters["factorizations"] == 1 + 500
+    np.testing.assert_allclose(result["out"], ref["out"], atol=1e-12)
+
+# The results are written into one preallocated (steps, stored unknowns + time) array, with
+#       ".option store=print" only the printed nodes are stored (all: in, out and the v1 current)
+@pytest.mark.parametrize("store, columns", [("all", 4), ("print", 2)])
+def test_result_storage(store, columns):
+    p = parser.Parser()
+    p.read_stream(io.StringIO(RC_RAMP))
+    p.parse()
+    p.eng.options["store"] = store
+    p.eng.set_env(p.envs[0])
+    result = p.eng.run()
+
+    assert p.eng.data_trans.shape == (501, columns)
+    assert p.eng.profiler.summary()["stats"]["peak_result_bytes"] == p.eng.data_trans.nbytes
+    np.testing.assert_array_equal(result["out"], p.eng.data_trans[:, p.eng.store_cols["out"]])
+    np.testing.assert_array_equal(result["time"], p.eng.time_trans)
+
+# The result array doubles when more time points are stored than allocated
+def test_result_growth():
+    p = parser.Parser()
+    p.read_stream(io.StringIO(RC_RAMP))
+    p.parse()
+    p.eng.set_env(p.envs[0])
+    p.eng.store_cols = {"in": 0, "out": 1}
+    p.eng.open_results(2)
+    for k in range(5):
+        p.eng.store_result(k, [k, -k], k * 1e-3)
+    p.eng.close_results(5)
+
+    np.testing.assert_array_equal(p.eng.data_trans, [[k, -k, k * 1e-3] for k in range(5)])
+    assert p.eng.profiler.summary()["stats"]["peak_result_bytes"] == (4 + 8) * 3 * 8
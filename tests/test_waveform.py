@@ -0,0 +1,102 @@
+# MIT License
+
+# Copyright (c) 2023 Ashwin Rajesh
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import benchmarks.generators    as generators
+import microspice.errors        as errors
+import microspice.parser        as parser
+import microspice.waveform      as waveform
+
+import io
+import numpy                    as np
+import pytest
+
+from   tests.helpers            import EXAMPLES, example_path, assert_results_close
+
+# Rows are written in chunks of 3 into a file reserving 2 time points, so the file is
+#       flushed and grown several times
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_write_and_read(tmp_path, dtype):
+    file_name = str(tmp_path / "wave.bin")
+    rows = np.arange(50, dtype=float).reshape(10, 5) / 7
+
+    with waveform.WaveformWriter(file_name, ["a", "b", "c", "d", "time"], 2, dtype, chunk_size=3) as writer:
+        for row in rows:
+            writer.write(row)
+
+    wave = waveform.Waveform(file_name)
+    assert wave.signals == ["a", "b", "c", "d", "time"]
+    assert wave.num_steps == len(rows)
+    assert wave.data.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(wave.data, rows.T.astype(dtype))
+    np.testing.assert_array_equal(wave["c"], rows[:, 2].astype(dtype))
+    np.testing.assert_array_equal(wave.time, rows[:, 4].astype(dtype))
+
+def test_empty_waveform(tmp_path):
+    file_name = str(tmp_path / "wave.bin")
+    waveform.WaveformWriter(file_name, ["x", "time"], 0).close()
+    assert waveform.Waveform(file_name).data.shape == (2, 0)
+
+def test_not_a_waveform(tmp_path):
+    file_name = tmp_path / "wave.bin"
+    file_name.write_bytes(b"\0" * 64)
+    with pytest.raises(errors.uSpiceError):
+        waveform.Waveform(str(file_name))
+
+# Transient results streamed into a waveform file are the results kept in memory
+@pytest.mark.parametrize("name", EXAMPLES)
+@pytest.mark.parametrize("adaptive", ["0", "1"])
+def test_engine_wave_file(tmp_path, name, adaptive):
+    results = []
+    for wave_file in (None, str(tmp_path / "wave.bin")):
+        p = parser.Parser()
+        p.read(example_path(name))
+        p.parse()
+        p.eng.options["adaptive"] = adaptive
+        p.eng.set_env(p.envs[-1])
+        p.eng.wave_file = wave_file
+        results.append({key: np.asarray(value) for key, value in p.eng.run().items()})
+
+    assert_results_close(results[1:], results[:1], atol=0, rtol=0)
+
+# The write buffer is sized in bytes, wide files do not buffer 4096 time points
+def test_buffer_size(tmp_path):
+    signals = [f"n{i}" for i in range(100000)] + ["time"]
+    with waveform.WaveformWriter(str(tmp_path / "wave.bin"), signals, 10000) as writer:
+        assert writer.buf.nbytes <= waveform.BUF_BYTES
+        assert len(writer.buf) >= 1
+
+    # Short runs do not buffer more time points than the file holds
+    with waveform.WaveformWriter(str(tmp_path / "wave.bin"), ["x", "time"], 10) as writer:
+        assert len(writer.buf) == 10
+
+# Streaming the results of a wide circuit takes no more memory than keeping them
+def test_engine_buffer_size(tmp_path):
+    peak = []
+    for wave_file in (None, str(tmp_path / "wave.bin")):
+        p = parser.Parser()
+        p.read_stream(io.StringIO(generators.rc_ladder(5000, num_steps=100)))
+        p.parse()
+        p.eng.print_nodes = [node for node in p.envs[0].dict_node2idx if node != "0"]
+        p.eng.wave_file = wave_file
+        p.eng.run()
+        peak.append(p.eng.profiler.summary()["stats"]["peak_result_bytes"])
+    assert peak[1] <= peak[0]